@@ -1,12 +1,21 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .routers import workflow, health
 from datagent.settings import settings
+from datagent.core.dependency_injection import container
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await container.startup()
+    yield
+    await container.shutdown()
 
 app = FastAPI(
     title="Avaloka AI",
     version="0.1.0",
-    description="Data sciece agent system"
+    description="Data sciece agent system",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -6,12 +6,23 @@ import json
 import asyncio
 import uuid
 import os
+import time
+from dataclasses import asdict
 from datetime import datetime
+from functools import lru_cache
 
 from datagent.bootstrap import bootstrap_app
-from datagent.core.workflow_executor import WorkflowExecutor
+from datagent.core.workflow_executor import WorkflowExecutor, cancel_run
+from datagent.core.context import WorkflowContext
 from datagent.core.yaml_workflow_loader import YamlWorkflowLoader
 from datagent.core.storage import SessionStorage
+from datagent.core.streaming import StreamConfig, ChunkCoalescer
+from datagent.core.node_cache import NodeResultCache
+from datagent.core.event_bus import EventBus
+from datagent.core.dependency_injection import container
+from datagent.core.profiler import Profiler
+from datagent.constants import LOGS_DIR
+from datagent.settings import settings
 from datagent.agents.schemas import BasePrompt, FileData
 
 router = APIRouter()
@@ -19,6 +30,32 @@ router = APIRouter()
 # Ensure app is bootstrapped
 bootstrap_app()
 
+WORKFLOW_PATH = "workflows/workflow.yaml"
+
+@lru_cache(maxsize=8)
+def get_executor(workflow_path: str, mtime: float) -> WorkflowExecutor:
+    # Keyed on mtime so edits to the YAML are picked up without a restart.
+    # The executor holds no per-run state, so it is shared by concurrent requests.
+    workflow_def = YamlWorkflowLoader().load(workflow_path)
+    stream_config = StreamConfig(
+        high_water=settings.STREAM_HIGH_WATER,
+        low_water=settings.STREAM_LOW_WATER,
+        text_policy=settings.STREAM_TEXT_POLICY
+    )
+    return WorkflowExecutor(
+        workflow_def,
+        checkpointer=container.resolve(SessionStorage),
+        stream_config=stream_config,
+        cache=container.resolve(NodeResultCache),
+        event_bus=container.resolve(EventBus)
+    )
+
+def json_serial(obj):
+    # Simple serialization helper for datetimes and other non-JSON values in event.data
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     upload_dir = "uploads"
@@ -39,7 +76,10 @@ async def upload_file(file: UploadFile = File(...)):
 async def stream_workflow(
     prompt: str = Form(...),
     session_id: Optional[str] = Form(None),
-    files: Optional[str] = Form(None)  # JSON string of file metadata
+    files: Optional[str] = Form(None),  # JSON string of file metadata
+    coalesce_ms: Optional[int] = Form(None),  # Text chunk batching window, 0 disables
+    timeout: Optional[float] = Form(None),  # Run deadline in seconds, defaults to the workflow timeout
+    profile: bool = Form(False)  # Record a Chrome trace of the run, reported in a final "profile" event
 ):
     # 1. Handle Session ID
     if not session_id:
@@ -60,20 +100,17 @@ async def stream_workflow(
             # Fallback or ignore if invalid JSON
             pass
 
-    # 3. Load Workflow
-    # In a real app, we might cache this or load dynamically based on request
-    loader = YamlWorkflowLoader()
+    # 3. Load Workflow (parsed and compiled once, then cached)
     try:
-        workflow_def = loader.load("workflows/workflow.yaml")
+        executor = get_executor(WORKFLOW_PATH, os.path.getmtime(WORKFLOW_PATH))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load workflow: {str(e)}")
 
     # 4. Load Context
-    session_storage = SessionStorage()
-    current_context = session_storage.load_context(session_id)
+    session_storage = container.resolve(SessionStorage)
+    current_context = await session_storage.a_load_context(session_id)
 
     # 5. Prepare Execution
-    executor = WorkflowExecutor(workflow_def)
     base_prompt = BasePrompt(
         name="Web User",
         email="web@datagent.ai",
@@ -81,18 +118,19 @@ async def stream_workflow(
         files=processed_files
     )
 
+    coalescer = ChunkCoalescer(
+        window_ms=settings.STREAM_COALESCE_MS if coalesce_ms is None else coalesce_ms,
+        max_bytes=settings.STREAM_COALESCE_MAX_BYTES
+    )
+
     async def event_generator():
+        profiler = Profiler(name=executor.plan.name) if profile else None
+        if profiler:
+            # Bound here as well, so the session saves below are profiled
+            profiler.bind()
         try:
-            async for event in executor.run_stream(base_prompt, current_context):
-                # Convert dataclass to dict for JSON serialization
-                # We need to handle datetime serialization if present in event.data
-                
-                # Simple serialization helper
-                def json_serial(obj):
-                    if isinstance(obj, datetime):
-                        return obj.isoformat()
-                    return str(obj)
-
+            events = executor.run_stream(base_prompt, current_context, timeout=timeout, profiler=profiler)
+            async for event in coalescer.coalesce(events):
                 # Extract relevant data based on event type
                 payload = {
                     "type": event.type,
@@ -105,9 +143,18 @@ async def stream_workflow(
                 
                 yield f"data: {json.dumps(payload, default=json_serial)}\n\n"
                 
-                # Save context on update
-                if event.type == "context_update":
-                    session_storage.save_context(event.context)
+                # Save context on update, write-behind so other streams keep flowing
+                if event.type == "context_update" and isinstance(event.context, WorkflowContext):
+                    await session_storage.a_save_context(event.context)
+
+            if profiler:
+                trace_path = os.path.join(LOGS_DIR, "traces", f"{session_id}-{int(time.time())}.json")
+                await asyncio.to_thread(profiler.export, trace_path)
+                profile_payload = {
+                    "type": "profile",
+                    "data": {"trace": trace_path, "summary": [asdict(stats) for stats in profiler.summary()]}
+                }
+                yield f"data: {json.dumps(profile_payload)}\n\n"
 
             yield "data: [DONE]\n\n"
             
@@ -115,4 +162,27 @@ async def stream_workflow(
             error_payload = {"type": "error", "content": str(e)}
             yield f"data: {json.dumps(error_payload)}\n\n"
 
+    # A client disconnect cancels event_generator, which tears the run down with it
     return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+@router.post("/cancel")
+async def cancel_workflow(session_id: str = Form(...)):
+    # Not through get_executor: a run started before the YAML was edited belongs
+    # to an executor that is no longer cached
+    if not cancel_run(session_id, reason="cancelled by client"):
+        raise HTTPException(status_code=404, detail=f"No running workflow for session {session_id}")
+    return {"session_id": session_id, "status": "cancelling"}
+
+@router.get("/cache/stats")
+async def cache_stats():
+    try:
+        executor = get_executor(WORKFLOW_PATH, os.path.getmtime(WORKFLOW_PATH))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load workflow: {str(e)}")
+
+    return executor.cache.stats()
+
+@router.get("/events/stats")
+async def event_stats():
+    # Queued subscribers of the shared event bus: deliveries, drops and lag
+    return container.resolve(EventBus).stats()
@@ -0,0 +1,89 @@
+"""
+Drives a long session (10k history messages by default) through WorkflowExecutor
+and reports how per-turn cost evolves as the history grows.
+
+With a structurally shared WorkflowContext the time per turn should stay flat;
+any O(history) copying shows up as a steadily increasing per-turn time.
+
+Usage:
+    python benchmarks/bench_context_history.py [--messages 10000]
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Type
+
+from datagent.agents.base import BaseAgent
+from datagent.agents.registry import AgentRegistry
+from datagent.agents.schemas import AgentInput, AgentOutput, AgentOutputEvent, BasePrompt, StreamingEvent, TextChunkEvent
+from datagent.core.context import WorkflowContext
+from datagent.core.workflow_executor import WorkflowExecutor
+from datagent.core.yaml_workflow_loader import WorkflowDefinition, WorkflowNode
+
+@dataclass(frozen=True, kw_only=True)
+class EchoOutput(AgentOutput):
+    role: str = "assistant"
+
+@AgentRegistry.register("bench_echo")
+class EchoAgent(BaseAgent[AgentInput, EchoOutput]):
+    """Answers instantly so the benchmark measures framework overhead only."""
+    poolable = True
+
+    def __init__(self, agent_id: str, **kwargs):
+        super().__init__(agent_id, **kwargs)
+
+    @property
+    def input_type(self) -> Type[AgentInput]:
+        return AgentInput
+
+    @property
+    def output_type(self) -> Type[EchoOutput]:
+        return EchoOutput
+
+    async def a_run(self, input_data: AgentInput) -> EchoOutput:
+        return EchoOutput(session_id=input_data.session_id, content=input_data.prompt.query)
+
+    async def a_stream(self, input_data: AgentInput) -> AsyncIterator[StreamingEvent]:
+        yield TextChunkEvent(session_id=input_data.session_id, agent_name=self.name, content=input_data.prompt.query)
+        yield AgentOutputEvent(
+            session_id=input_data.session_id,
+            agent_name=self.name,
+            output=await self.a_run(input_data)
+        )
+
+def build_definition() -> WorkflowDefinition:
+    nodes = {
+        "echo": WorkflowNode(id="echo", agent_name="bench_echo", next_nodes=["end"]),
+        "end": WorkflowNode(id="end", type="end"),
+    }
+    return WorkflowDefinition(name="bench", nodes=nodes, start_node="echo")
+
+async def main(total_messages: int, report_every: int):
+    executor = WorkflowExecutor(build_definition())
+    context = WorkflowContext(session_id="bench-session")
+
+    # Every turn appends the user message and the agent output
+    turns = total_messages // 2
+    window_start = time.perf_counter()
+    started = window_start
+
+    print(f"{'messages':>10} {'us/turn':>10}")
+    for turn in range(1, turns + 1):
+        prompt = BasePrompt(name="bench", email="bench@datagent.ai", query=f"message {turn}")
+        context = await executor.run(prompt, context)
+
+        if turn % report_every == 0:
+            now = time.perf_counter()
+            print(f"{len(context.history):>10} {(now - window_start) / report_every * 1e6:>10.1f}")
+            window_start = now
+
+    elapsed = time.perf_counter() - started
+    print(f"\n{turns} turns, {len(context.history)} messages in {elapsed:.2f}s ({turns / elapsed:.0f} turns/s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--report-every", type=int, default=500, help="Turns per reported window")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.report_every))
@@ -0,0 +1,67 @@
+"""
+Compares the session storage formats: file size and save/load time of a session
+through SessionRepository, for histories of 100, 1k and 10k messages.
+
+The binary format stores MessagePack payloads when `msgpack` is installed and
+zlib-compressed JSON otherwise; the payload used is printed with the results.
+
+Usage:
+    python benchmarks/bench_session_format.py [--sizes 100 1000 10000] [--repeat 5]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from datagent.agents.schemas import AssistantMessage, UserMessage
+from datagent.core.context import WorkflowContext
+from datagent.db.codecs import PAYLOAD_MSGPACK, BinaryCodec, DocumentCodec
+from datagent.db.fs import FileSystemDB
+from datagent.db.repositories.session import SessionRepository
+
+def build_context(messages: int) -> WorkflowContext:
+    context = WorkflowContext(session_id=f"bench-{messages}")
+    for i in range(messages // 2):
+        context = context.add_history(UserMessage(session_id=context.session_id, content=f"question {i} about the dataset"))
+        context = context.add_history(AssistantMessage(
+            session_id=context.session_id,
+            agent_name="planner",
+            node_id="plan",
+            content=f"answer {i}: " + "the column looks normally distributed with a few outliers. " * 4
+        ))
+    return context.update({"plan": context.history[-1], "step": messages})
+
+def measure(repo: SessionRepository, context: WorkflowContext, repeat: int):
+    save_times, load_times = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        repo.save(context)
+        save_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        loaded = repo.load(context.session_id)
+        load_times.append(time.perf_counter() - started)
+    assert len(loaded.history) == len(context.history)
+
+    path = repo.db._get_doc_path(repo.COLLECTION, context.session_id, repo.codec.extension)
+    return os.path.getsize(path), min(save_times), min(load_times)
+
+def main(sizes, repeat: int):
+    binary = BinaryCodec()
+    print(f"binary payload: {'msgpack' if binary.payload == PAYLOAD_MSGPACK else 'zlib json'}\n")
+    print(f"{'messages':>9} {'format':>7} {'size KiB':>10} {'save ms':>9} {'load ms':>9}")
+
+    with tempfile.TemporaryDirectory() as root:
+        for messages in sizes:
+            context = build_context(messages)
+            for name, codec in (("json", DocumentCodec()), ("binary", binary)):
+                repo = SessionRepository(database=FileSystemDB(root_dir=os.path.join(root, name)), codec=codec)
+                size, save, load = measure(repo, context, repeat)
+                print(f"{messages:>9} {name:>7} {size / 1024:>10.1f} {save * 1000:>9.1f} {load * 1000:>9.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement, the fastest is reported")
+    args = parser.parse_args()
+    main(args.sizes, args.repeat)
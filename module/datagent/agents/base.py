@@ -1,11 +1,102 @@
+import asyncio
+import atexit
+import os
+import threading
 from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, Type, Iterator, AsyncIterator
+from typing import Awaitable, Generic, Optional, TypeVar, Type, Iterator, AsyncIterator
 from .schemas import AgentInput, AgentOutput, StreamingEvent
 
 In = TypeVar("In", bound=AgentInput)
 Out = TypeVar("Out", bound=AgentOutput)
+T = TypeVar("T")
+
+class BackgroundLoop:
+    """
+    A single event loop running in a daemon thread, used by the synchronous agent API.
+
+    Sync callers submit coroutines to it instead of spinning up a loop per call, so
+    loop setup is paid once and async clients (HTTP connection pools, LLM clients)
+    stay bound to one loop and are reused across calls. An agent's clients are
+    bound to the loop it was acquired on, so an agent acquired inside a running
+    loop is for `a_run`/`a_stream` there, not for the sync API.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        # Re-created after a fork, the thread does not survive into the child
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def _run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=_run, name="datagent-agent-loop", daemon=True)
+        thread.start()
+        ready.wait()
+        self._loop, self._thread, self._pid = loop, thread, os.getpid()
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """Runs `coro` on the background loop and blocks until it is done."""
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            # Never awaited now, close it to avoid the "never awaited" warning
+            getattr(coro, "close", lambda: None)()
+            raise RuntimeError("BackgroundLoop.run() called from the background loop itself, await the coroutine instead")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, agen: AsyncIterator[T]) -> Iterator[T]:
+        """Drives an async iterator on the background loop, yielding its items synchronously."""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            # Also when the caller stops early, so the stream releases its resources
+            aclose = getattr(agen, "aclose", None)
+            if aclose:
+                self.run(aclose())
+
+    def stop(self):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is not None and self._pid == os.getpid():
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+
+# Shared by every agent in the process
+background_loop = BackgroundLoop()
+atexit.register(background_loop.stop)
 
 class BaseAgent(ABC, Generic[In, Out]):
+    # Pooled agents are shared across runs and sessions of one event loop (see
+    # AgentRegistry.acquire). Opt-in: only agents that keep no per-run state on the
+    # instance set this to True.
+    poolable: bool = False
+
     def __init__(self, name: str, **kwargs):
         self.name = name
         self.config = kwargs
@@ -24,13 +115,11 @@ class BaseAgent(ABC, Generic[In, Out]):
     async def a_run(self, input_data: In) -> Out:
         pass
 
-    @abstractmethod
     def run(self, input_data: In) -> Out:
-        pass
+        return background_loop.run(self.a_run(input_data))
 
-    @abstractmethod
     def stream(self, input_data: In) -> Iterator[StreamingEvent]:
-        pass
+        return background_loop.iterate(self.a_stream(input_data))
 
     @abstractmethod
     async def a_stream(self, input_data: In) -> AsyncIterator[StreamingEvent]:
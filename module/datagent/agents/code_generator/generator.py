@@ -17,7 +17,8 @@ class CodeGeneratorOutput(AgentOutput):
 
 @AgentRegistry.register("code_generator")
 class CodeGeneratorAgent(BaseAgent[CodeGeneratorInput, CodeGeneratorOutput]):
-    
+    poolable = True
+
     def __init__(self, name: str = "code_generator"):
         super().__init__(name)
         self.builder = MultiFileBuilder()
@@ -46,10 +47,6 @@ class CodeGeneratorAgent(BaseAgent[CodeGeneratorInput, CodeGeneratorOutput]):
             summary="Generated 2 files."
         )
 
-    def run(self, input_data: CodeGeneratorInput) -> CodeGeneratorOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
     def stream(self, input_data: CodeGeneratorInput) -> Iterator[StreamingEvent]:
         yield TextChunkEvent(
             session_id=input_data.session_id,
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Type, List, AsyncIterator, Iterator
+from typing import Type, List, AsyncIterator
 import tempfile
 import os
 from ..base import BaseAgent
@@ -25,6 +25,8 @@ class ValidatorOutput(AgentOutput):
 
 @AgentRegistry.register("code_validator")
 class CodeValidatorAgent(BaseAgent[ValidatorInput, ValidatorOutput]):
+    poolable = True
+
     def __init__(self, name: str = "code_validator"):
         super().__init__(name)
         self.static_analyzer = StaticAnalyzer()
@@ -80,24 +82,6 @@ class CodeValidatorAgent(BaseAgent[ValidatorInput, ValidatorOutput]):
                 summary=summary
             )
 
-    def run(self, input_data: ValidatorInput) -> ValidatorOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
-    def stream(self, input_data: ValidatorInput) -> Iterator[StreamingEvent]:
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        agen = self.a_stream(input_data)
-        try:
-            while True:
-                try:
-                    yield loop.run_until_complete(agen.__anext__())
-                except StopAsyncIteration:
-                    break
-        finally:
-            loop.close()
-
     async def a_stream(self, input_data: ValidatorInput) -> AsyncIterator[StreamingEvent]:
         yield TextChunkEvent(
             session_id=input_data.session_id,
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Type, Iterator, AsyncIterator
+from typing import Type, AsyncIterator
 
 from ..base import BaseAgent
 from ..schemas import AgentInput, AgentOutput, StreamingEvent, TextChunkEvent, AgentOutputEvent
@@ -15,6 +15,8 @@ class DataProcessingOutput(AgentOutput):
 
 @AgentRegistry.register("data_processor")
 class DataProcessingAgent(BaseAgent[DataProcessingInput, DataProcessingOutput]):
+    poolable = True
+
     def __init__(self, agent_id: str, **kwargs):
         super().__init__(agent_id, **kwargs)
         # In future, we can accept tools/config here
@@ -39,24 +41,6 @@ class DataProcessingAgent(BaseAgent[DataProcessingInput, DataProcessingOutput]):
             result=f"Processed request: {input_data.user_request}"
         )
 
-    def run(self, input_data: DataProcessingInput) -> DataProcessingOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
-    def stream(self, input_data: DataProcessingInput) -> Iterator[StreamingEvent]:
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        agen = self.a_stream(input_data)
-        try:
-            while True:
-                try:
-                    yield loop.run_until_complete(agen.__anext__())
-                except StopAsyncIteration:
-                    break
-        finally:
-            loop.close()
-
     async def a_stream(self, input_data: DataProcessingInput) -> AsyncIterator[StreamingEvent]:
         # For now, this is a placeholder that just acknowledges the request
         yield TextChunkEvent(
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Type, Iterator, AsyncIterator
+from typing import Type, AsyncIterator
 
 from ..base import BaseAgent
 from ..schemas import AgentInput, AgentOutput, StreamingEvent, TextChunkEvent, AgentOutputEvent
@@ -16,12 +16,14 @@ class ExtraTopicOutput(AgentOutput):
 
 @AgentRegistry.register("extra_topic")
 class ExtraTopicAgent(BaseAgent[ExtraTopicInput, ExtraTopicOutput]):
+    poolable = True
+
     def __init__(self, agent_id: str, **kwargs):
         super().__init__(agent_id, **kwargs)
         
         # 1. Configurable LLM
         llm_config = kwargs.get("llm_config", {"provider": "openai", "model": "gpt-4o"})
-        self.llm = LLMRegistry.instantiate(
+        self.llm = LLMRegistry.acquire(
             provider=llm_config.get("provider", "openai"),
             model=llm_config.get("model", "gpt-4o"),
             api_key=llm_config.get("api_key")
@@ -49,24 +51,6 @@ class ExtraTopicAgent(BaseAgent[ExtraTopicInput, ExtraTopicOutput]):
         # Fallback if stream didn't yield output (should not happen if implemented correctly)
         return ExtraTopicOutput(session_id=input_data.session_id, response="Error: No output from stream")
 
-    def run(self, input_data: ExtraTopicInput) -> ExtraTopicOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
-    def stream(self, input_data: ExtraTopicInput) -> Iterator[StreamingEvent]:
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        agen = self.a_stream(input_data)
-        try:
-            while True:
-                try:
-                    yield loop.run_until_complete(agen.__anext__())
-                except StopAsyncIteration:
-                    break
-        finally:
-            loop.close()
-
     async def a_stream(self, input_data: ExtraTopicInput) -> AsyncIterator[StreamingEvent]:
         system_prompt = f"""
         You are a helpful assistant for the Avaloka Datagent service.
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Type, Iterator, AsyncIterator
+from typing import Type, AsyncIterator
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from ..base import BaseAgent
@@ -17,12 +17,14 @@ class GreetingOutput(AgentOutput):
 
 @AgentRegistry.register("greeting")
 class GreetingAgent(BaseAgent[GreetingInput, GreetingOutput]):
+    poolable = True
+
     def __init__(self, agent_id: str, **kwargs):
         super().__init__(agent_id, **kwargs)
         
         # 1. Configurable LLM
         llm_config = kwargs.get("llm_config", {"provider": "openai", "model": "gpt-4o"})
-        self.llm = LLMRegistry.instantiate(
+        self.llm = LLMRegistry.acquire(
             provider=llm_config.get("provider", "openai"),
             model=llm_config.get("model", "gpt-4o")
         )
@@ -50,24 +52,6 @@ class GreetingAgent(BaseAgent[GreetingInput, GreetingOutput]):
         # Fallback
         return GreetingOutput(session_id=input_data.session_id, response="Error: No output from stream")
 
-    def run(self, input_data: GreetingInput) -> GreetingOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
-    def stream(self, input_data: GreetingInput) -> Iterator[StreamingEvent]:
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        agen = self.a_stream(input_data)
-        try:
-            while True:
-                try:
-                    yield loop.run_until_complete(agen.__anext__())
-                except StopAsyncIteration:
-                    break
-        finally:
-            loop.close()
-
     async def a_stream(self, input_data: GreetingInput) -> AsyncIterator[StreamingEvent]:
         system_prompt = f"""
         You are the Greeting Agent for {self.service_name}.
@@ -16,7 +16,8 @@ class InferencerOutput(AgentOutput):
 
 @AgentRegistry.register("inferencer")
 class InferencerAgent(BaseAgent[InferencerInput, InferencerOutput]):
-    
+    poolable = True
+
     @property
     def input_type(self) -> Type[InferencerInput]:
         return InferencerInput
@@ -33,10 +34,6 @@ class InferencerAgent(BaseAgent[InferencerInput, InferencerOutput]):
             latency_ms=10.5
         )
 
-    def run(self, input_data: InferencerInput) -> InferencerOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
     def stream(self, input_data: InferencerInput) -> Iterator[StreamingEvent]:
         yield StreamingEvent(session_id=input_data.session_id, agent_name=self.name, type="prediction", data={"value": "Mock"})
 
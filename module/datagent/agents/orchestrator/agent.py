@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Type, Iterator, AsyncIterator
+from typing import Type, AsyncIterator
 from ..base import BaseAgent
 from ..schemas import AgentInput, AgentOutput, StreamingEvent, TextChunkEvent
 from ..registry import AgentRegistry
@@ -14,6 +14,8 @@ class OrchestratorOutput(AgentOutput):
 
 @AgentRegistry.register("orchestrator")
 class OrchestratorAgent(BaseAgent[OrchestratorInput, OrchestratorOutput]):
+    poolable = True
+
     @property
     def input_type(self) -> Type[OrchestratorInput]:
         return OrchestratorInput
@@ -29,24 +31,6 @@ class OrchestratorAgent(BaseAgent[OrchestratorInput, OrchestratorOutput]):
             status="Orchestrated"
         )
 
-    def run(self, input_data: OrchestratorInput) -> OrchestratorOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
-    def stream(self, input_data: OrchestratorInput) -> Iterator[StreamingEvent]:
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        agen = self.a_stream(input_data)
-        try:
-            while True:
-                try:
-                    yield loop.run_until_complete(agen.__anext__())
-                except StopAsyncIteration:
-                    break
-        finally:
-            loop.close()
-
     async def a_stream(self, input_data: OrchestratorInput) -> AsyncIterator[StreamingEvent]:
         # Simulate thinking/planning
         yield TextChunkEvent(
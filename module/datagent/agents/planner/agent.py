@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Type, Iterator, AsyncIterator
+from typing import Type, AsyncIterator
 
 from ..base import BaseAgent
 from ..schemas import AgentInput, AgentOutput, StreamingEvent, TextChunkEvent, ContextUpdateEvent, AgentOutputEvent
@@ -16,12 +16,14 @@ class PlannerOutput(AgentOutput):
 
 @AgentRegistry.register("planner")
 class PlannerAgent(BaseAgent[PlannerInput, PlannerOutput]):
+    poolable = True
+
     def __init__(self, agent_id: str, **kwargs):
         super().__init__(agent_id, **kwargs)
         
         # Configurable LLM
         llm_config = kwargs.get("llm_config", {"provider": "openai", "model": "gpt-4o"})
-        self.llm = LLMRegistry.instantiate(
+        self.llm = LLMRegistry.acquire(
             provider=llm_config.get("provider", "openai"),
             model=llm_config.get("model", "gpt-4o")
         )
@@ -46,24 +48,6 @@ class PlannerAgent(BaseAgent[PlannerInput, PlannerOutput]):
             
         return PlannerOutput(session_id=input_data.session_id, next_action="unknown", reasoning="Failed to get output from stream")
 
-    def run(self, input_data: PlannerInput) -> PlannerOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
-    def stream(self, input_data: PlannerInput) -> Iterator[StreamingEvent]:
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        agen = self.a_stream(input_data)
-        try:
-            while True:
-                try:
-                    yield loop.run_until_complete(agen.__anext__())
-                except StopAsyncIteration:
-                    break
-        finally:
-            loop.close()
-
     async def a_stream(self, input_data: PlannerInput) -> AsyncIterator[StreamingEvent]:
         system_prompt = """
         You are the Planner Agent for Avaloka Datagent.
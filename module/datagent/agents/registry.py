@@ -1,9 +1,14 @@
-from typing import Dict, Type, Any
+from typing import Dict, Type
 from .base import BaseAgent
+from ..instance_pool import InstancePool
 
 class AgentRegistry:
     _registry: Dict[str, Type[BaseAgent]] = {}
 
+    # Instances of poolable agents, keyed by agent type and config, per event loop
+    # since they hold loop-bound LLM clients
+    _pool = InstancePool(max_size=256, per_loop=True)
+
     @classmethod
     def register(cls, name: str):
         def decorator(agent_cls: Type[BaseAgent]):
@@ -17,6 +22,32 @@ class AgentRegistry:
             raise ValueError(f"Agent type {agent_type} not found")
         return cls._registry[agent_type](**kwargs)
 
+    @classmethod
+    def acquire(cls, agent_type: str, **kwargs) -> BaseAgent:
+        """
+        Returns an agent for the given type and config, reusing a pooled instance
+        (and with it the LLM client and its connection pool) for agents that set
+        `poolable = True`. Any other agent gets a fresh instance. Pooled instances
+        belong to the running event loop (outside one, to the loop of the sync
+        `run`/`stream` API): acquire an agent on the loop that will run it.
+        """
+        if agent_type not in cls._registry:
+            raise ValueError(f"Agent type {agent_type} not found")
+
+        agent_cls = cls._registry[agent_type]
+        if not agent_cls.poolable:
+            return agent_cls(**kwargs)
+
+        return cls._pool.get_or_create(agent_type, kwargs, lambda: agent_cls(**kwargs))
+
+    @classmethod
+    def clear_pool(cls):
+        cls._pool.clear()
+
+    @classmethod
+    def pool_size(cls) -> int:
+        return len(cls._pool)
+
     @classmethod
     def list_agents(cls):
         return list(cls._registry.keys())
@@ -20,7 +20,8 @@ class TrainerOutput(AgentOutput):
 
 @AgentRegistry.register("trainer")
 class TrainerAgent(BaseAgent[TrainerInput, TrainerOutput]):
-    
+    poolable = True
+
     def __init__(self, name: str = "trainer"):
         super().__init__(name)
         self.runtime = RayRuntime()
@@ -47,10 +48,6 @@ class TrainerAgent(BaseAgent[TrainerInput, TrainerOutput]):
             metrics={"epochs": input_data.epochs}
         )
 
-    def run(self, input_data: TrainerInput) -> TrainerOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
     def stream(self, input_data: TrainerInput) -> Iterator[StreamingEvent]:
         yield TextChunkEvent(session_id=input_data.session_id, agent_name=self.name, chunk_index=0, content="Submitting training job...")
 
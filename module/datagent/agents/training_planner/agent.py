@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Type, Iterator, AsyncIterator
+from typing import Type, AsyncIterator
 from ..base import BaseAgent
 from ..schemas import AgentInput, AgentOutput, StreamingEvent, TextChunkEvent
 from ..registry import AgentRegistry
@@ -14,6 +14,8 @@ class TrainingPlannerOutput(AgentOutput):
 
 @AgentRegistry.register("training_planner")
 class TrainingPlannerAgent(BaseAgent[TrainingPlannerInput, TrainingPlannerOutput]):
+    poolable = True
+
     @property
     def input_type(self) -> Type[TrainingPlannerInput]:
         return TrainingPlannerInput
@@ -49,24 +51,6 @@ class TrainingPlannerAgent(BaseAgent[TrainingPlannerInput, TrainingPlannerOutput
             plan=plan
         )
 
-    def run(self, input_data: TrainingPlannerInput) -> TrainingPlannerOutput:
-        import asyncio
-        return asyncio.run(self.a_run(input_data))
-
-    def stream(self, input_data: TrainingPlannerInput) -> Iterator[StreamingEvent]:
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        agen = self.a_stream(input_data)
-        try:
-            while True:
-                try:
-                    yield loop.run_until_complete(agen.__anext__())
-                except StopAsyncIteration:
-                    break
-        finally:
-            loop.close()
-
     async def a_stream(self, input_data: TrainingPlannerInput) -> AsyncIterator[StreamingEvent]:
         yield TextChunkEvent(
             session_id=input_data.session_id,
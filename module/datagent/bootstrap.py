@@ -1,3 +1,4 @@
+import asyncio
 import os
 import logging
 from .settings import settings
@@ -39,8 +40,58 @@ def bootstrap_app():
     # 5. Import LLMs to register them
     import datagent.llms.openai.client
     import datagent.llms.groq.client
+
+    # 6. Compose the LLM middleware chain once for all clients
+    if settings.LLM_MIDDLEWARE:
+        from .core.middleware import MiddlewarePipeline
+        from .llms.registry import LLMRegistry
+        names = [name.strip() for name in settings.LLM_MIDDLEWARE.split(",") if name.strip()]
+        LLMRegistry.use_middleware(MiddlewarePipeline.from_config(names))
+        logger.info(f"LLM middleware: {', '.join(names)}")
+
+    # 7. Register shared services, created once per process on first use
+    register_services()
     
     logger.info("Bootstrap complete.")
 
+def register_services():
+    from .core.dependency_injection import container, SINGLETON
+    from .core.event_bus import EventBus
+    from .core.node_cache import NodeResultCache
+    from .core.storage import SessionStorage
+    from .core.state_manager import StateManager, create_state_manager
+
+    # bootstrap_app may run more than once per process, keep existing singletons
+    if not container.is_registered(NodeResultCache):
+        container.register_factory(
+            NodeResultCache,
+            lambda: NodeResultCache(max_entries=settings.NODE_CACHE_MAX_ENTRIES, directory=settings.NODE_CACHE_DIR),
+            scope=SINGLETON
+        )
+    if not container.is_registered(SessionStorage):
+        container.register_factory(
+            SessionStorage,
+            SessionStorage,
+            scope=SINGLETON,
+            # Writes what is still pending in the write-behind queue
+            dispose=lambda storage: asyncio.to_thread(storage.close)
+        )
+    if not container.is_registered(EventBus):
+        container.register_factory(EventBus, EventBus, scope=SINGLETON, dispose=lambda bus: bus.close())
+    if not container.is_registered(StateManager):
+        container.register_factory(
+            StateManager,
+            lambda: create_state_manager(
+                settings.STATE_BACKEND,
+                max_entries=settings.STATE_MAX_ENTRIES,
+                max_bytes=settings.STATE_MAX_BYTES,
+                ttl=settings.STATE_TTL,
+                path=settings.STATE_DB_PATH
+            ),
+            scope=SINGLETON,
+            # Commits pending writes of the sqlite backend
+            dispose=lambda manager: manager.close() if hasattr(manager, "close") else None
+        )
+
 if __name__ == "__main__":
     bootstrap_app()
@@ -1,19 +1,104 @@
 import typer
 import asyncio
+import json
+import time
 import uuid
-from typing import Optional
+from contextlib import nullcontext
+from typing import Optional, AsyncIterator
 from rich.console import Console
 from rich.panel import Panel
+from rich.table import Table
 from .settings import settings
 from .bootstrap import bootstrap_app
 from .core.workflow_executor import WorkflowExecutor
 from .core.yaml_workflow_loader import YamlWorkflowLoader
 from .core.storage import SessionStorage
-from .agents.schemas import BasePrompt
+from .agents.schemas import BasePrompt, StreamingEvent, FileData
+from .core.context import WorkflowContext
+from .core.streaming import ChunkCoalescer
+from .core.node_cache import NodeResultCache
+from .core.dependency_injection import container
+from .core.profiler import Profiler
+from .core.serialization import serialize
+from .db.fs import DEFAULT_SHARD_DEPTH, FileSystemDB, db
 
 app = typer.Typer()
 console = Console()
 
+async def render_events(events: AsyncIterator[StreamingEvent], session_storage: SessionStorage, current_context: WorkflowContext, stream: bool) -> WorkflowContext:
+    """Prints a workflow event stream and persists context updates. Returns the final context."""
+    async for event in events:
+        if event.type == "node_start":
+            node_id = event.node_id
+            agent_name = event.data.get('agent', 'unknown')
+            console.print(Panel(f"Starting Node: [bold]{node_id}[/bold] (Agent: {agent_name})", border_style="blue"))
+        
+        elif event.type == "node_end":
+            console.print(f"[dim]Node {event.node_id} finished.[/dim]")
+        
+        elif event.type == "router_decision":
+                console.print(f"[bold magenta]Router Decision:[/bold magenta] {event.condition} = {event.value} -> {event.next_node}")
+        
+        elif event.type == "text_chunk":
+            content = event.content
+            role = getattr(event, "role", "assistant")
+            style = "green"
+            if role == "agent":
+                style = "dim"
+            elif role == "assistant":
+                style = "green"
+                
+            if content and stream:
+                console.print(content, style=style, end="")
+        
+        elif event.type == "tool_start":
+            console.print(f"[yellow]Tool Call:[/yellow] {event.data.get('tool_name')}")
+        
+        elif event.type == "tool_end":
+            console.print(f"[dim]Tool Result:[/dim] {event.data.get('output')}")
+        
+        elif event.type == "context_update":
+            console.print(f"[dim]Context Update:[/dim] {event}")
+            # Agents may emit plain dict updates, only the workflow context is persisted
+            if isinstance(event.context, WorkflowContext):
+                updated_context = event.context
+                await session_storage.a_save_context(updated_context)
+                current_context = updated_context
+
+        elif event.type == "workflow_end":
+            console.print(f"\n[bold green]Workflow Ended[/bold green]")
+
+        elif event.type == "node_timeout":
+            console.print(f"\n[bold red]Timeout:[/bold red] {event.content}")
+
+        elif event.type == "workflow_cancelled":
+            console.print(f"\n[bold yellow]Workflow Cancelled:[/bold yellow] {event.reason} (resume with 'datagent resume')")
+            return current_context
+
+    console.print("\n[bold green]Workflow Completed Successfully.[/bold green]")
+    console.print(f"[dim]Session History Items: {len(current_context.history)}[/dim]")
+
+    return current_context
+
+def node_cache() -> NodeResultCache:
+    return container.resolve(NodeResultCache)
+
+def print_profile(profiler: Profiler, trace_path: str):
+    table = Table(title="Run Profile", show_lines=False)
+    table.add_column("Category")
+    table.add_column("Span")
+    table.add_column("Count", justify="right")
+    table.add_column("Total ms", justify="right")
+    table.add_column("Mean ms", justify="right")
+    table.add_column("Max ms", justify="right")
+    for stats in profiler.summary():
+        table.add_row(
+            stats.category, stats.name, str(stats.count),
+            f"{stats.total_ms:.1f}", f"{stats.mean_ms:.1f}", f"{stats.max_ms:.1f}"
+        )
+    console.print(table)
+    console.print(f"[dim]Chrome trace written to {trace_path} (open in https://ui.perfetto.dev)[/dim]")
+
 @app.command()
 def info():
     """Display application information."""
@@ -25,6 +110,9 @@ def run(
     input_text: str = typer.Option(..., "--input", "-i", help="Initial user input."),
     session_id: Optional[str] = typer.Option(None, "--session-id", "-s", help="Session ID"),
     stream: bool = typer.Option(True, "--stream/--no-stream", help="Stream output tokens"),
+    coalesce_ms: int = typer.Option(settings.STREAM_COALESCE_MS, "--coalesce-ms", help="Batch streamed tokens per window (ms), 0 disables"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", "-t", help="Deadline for the whole run in seconds (default: workflow timeout)"),
+    profile: Optional[str] = typer.Option(None, "--profile", help="Profile the run: write a Chrome trace to this path and print a timing summary"),
     user_name: str = typer.Option("CLI User", "--name", "-n", help="User name"),
     user_email: str = typer.Option("cli@datagent.ai", "--email", "-e", help="User email")
 ):
@@ -41,7 +129,7 @@ def run(
     if not session_id:
         session_id = f"cli-run-{uuid.uuid4()}"
 
-    session_storage = SessionStorage()
+    session_storage = container.resolve(SessionStorage)
     
     async def run():
         try:
@@ -49,11 +137,11 @@ def run(
             console.print(f"[bold]User Input:[/bold] {input_text}")
 
             # 2. Load Context
-            current_context = session_storage.load_context(session_id)
+            current_context = await session_storage.a_load_context(session_id)
             console.print(f"[dim]Loaded session history: {len(current_context.history)} items[/dim]")
 
             # 3. Prepare Executor
-            executor = WorkflowExecutor(workflow_def)
+            executor = WorkflowExecutor(workflow_def, checkpointer=session_storage, cache=node_cache())
             prompt = BasePrompt(
                 name=user_name,
                 email=user_email,
@@ -62,52 +150,23 @@ def run(
 
             # 4. Execute
             console.print("[bold]Starting Workflow Execution...[/bold]")
+            profiler = Profiler(name=workflow_def.name) if profile else None
             try:
-                async for event in executor.run_stream(prompt, current_context):
-                    if event.type == "node_start":
-                        node_id = event.node_id
-                        agent_name = event.data.get('agent', 'unknown')
-                        console.print(Panel(f"Starting Node: [bold]{node_id}[/bold] (Agent: {agent_name})", border_style="blue"))
-                    
-                    elif event.type == "node_end":
-                        console.print(f"[dim]Node {event.node_id} finished.[/dim]")
-                    
-                    elif event.type == "router_decision":
-                            console.print(f"[bold magenta]Router Decision:[/bold magenta] {event.condition} = {event.value} -> {event.next_node}")
-                    
-                    elif event.type == "text_chunk":
-                        content = event.content
-                        role = getattr(event, "role", "assistant")
-                        style = "green"
-                        if role == "agent":
-                            style = "dim"
-                        elif role == "assistant":
-                            style = "green"
-                            
-                        if content and stream:
-                            console.print(content, style=style, end="")
-                    
-                    elif event.type == "tool_start":
-                        console.print(f"[yellow]Tool Call:[/yellow] {event.data.get('tool_name')}")
-                    
-                    elif event.type == "tool_end":
-                        console.print(f"[dim]Tool Result:[/dim] {event.data.get('output')}")
-                    
-                    elif event.type == "context_update":
-                        console.print(f"[dim]Context Update:[/dim] {event}")
-                        updated_context = event.context
-                        session_storage.save_context(updated_context)
-                        current_context = updated_context
-
-                    elif event.type == "workflow_end":
-                        console.print(f"\n[bold green]Workflow Ended[/bold green]")
-
-                console.print("\n[bold green]Workflow Completed Successfully.[/bold green]")
-                console.print(f"[dim]Session History Items: {len(current_context.history)}[/dim]")
-
+                # Active around rendering too, so the session saves show up in the profile
+                with profiler.activate() if profiler else nullcontext():
+                    events = ChunkCoalescer(window_ms=coalesce_ms).coalesce(
+                        executor.run_stream(prompt, current_context, timeout=timeout, profiler=profiler)
+                    )
+                    await render_events(events, session_storage, current_context, stream)
             except Exception as e:
                 console.print(f"\n[bold red]Workflow Runtime Error:[/bold red] {e}")
 
+            # Saves are write-behind, wait for them before exiting (and profiling)
+            await session_storage.aflush()
+            if profiler:
+                profiler.export(profile)
+                print_profile(profiler, profile)
+
         except KeyboardInterrupt:
             console.print("\n[bold yellow]Interrupted by user. Exiting...[/bold yellow]")
         except Exception as e:
@@ -115,5 +174,145 @@ def run(
 
     asyncio.run(run())
 
+@app.command("run-batch")
+def run_batch(
+    input_path: str = typer.Argument(..., help="JSONL file, one request per line: {\"query\": ..., \"session_id\"?, \"name\"?, \"email\"?, \"files\"?}"),
+    output_path: str = typer.Argument(..., help="JSONL file to write one result per line to"),
+    workflow_path: str = typer.Option("workflows/workflow.yaml", "--workflow", "-w", help="Path to workflow YAML file"),
+    max_concurrency: int = typer.Option(8, "--max-concurrency", "-c", help="Max workflow runs in flight"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", "-t", help="Deadline per run in seconds (default: workflow timeout)")
+):
+    """Run a workflow over every request of a JSONL file with bounded concurrency."""
+    bootstrap_app()
+
+    loader = YamlWorkflowLoader()
+    try:
+        workflow_def = loader.load(workflow_path)
+    except Exception as e:
+        console.print(f"[bold red]Error loading workflow:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    prompts = []
+    contexts = []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                console.print(f"[bold red]Invalid JSON on line {line_no}:[/bold red] {e}")
+                raise typer.Exit(code=1)
+            prompts.append(BasePrompt(
+                name=item.get("name", "Batch User"),
+                email=item.get("email", "batch@datagent.ai"),
+                query=item["query"],
+                files=[FileData(filename=fd.get("filename"), url=fd.get("url")) for fd in item.get("files", [])]
+            ))
+            contexts.append(WorkflowContext(session_id=item.get("session_id") or f"batch-{uuid.uuid4()}"))
+
+    # One executor: the definition is parsed and compiled once, agents and
+    # LLM clients come from the shared pools for every item
+    executor = WorkflowExecutor(workflow_def, cache=node_cache())
+
+    async def run():
+        results = []
+        started = time.perf_counter()
+        with open(output_path, "w", encoding="utf-8") as out:
+            async for result in executor.run_batch_stream(prompts, contexts, max_concurrency=max_concurrency, timeout=timeout):
+                results.append(result)
+                record = {
+                    "index": result.index,
+                    "session_id": result.session_id,
+                    "ok": result.ok,
+                    "latency_ms": round(result.latency * 1000, 1),
+                    "error": result.error
+                }
+                if result.context is not None:
+                    last = result.context.history[-1] if len(result.context.history) else None
+                    record["output"] = getattr(last, "content", None)
+                    record["state"] = serialize(result.context.state)
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                console.print(f"[dim]{len(results)}/{len(prompts)}[/dim] item {result.index}: {'ok' if result.ok else '[red]' + result.error + '[/red]'} ({record['latency_ms']} ms)")
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+
+    latencies = sorted(result.latency for result in results)
+    failed = sum(1 for result in results if not result.ok)
+
+    def percentile(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    console.print(Panel(
+        f"Items: {len(results)} ({failed} failed)\n"
+        f"Wall time: {elapsed:.2f}s\n"
+        f"Throughput: {len(results) / elapsed if elapsed else 0:.2f} items/s\n"
+        f"Latency p50/p95/max: {percentile(0.5):.0f} / {percentile(0.95):.0f} / {percentile(1.0):.0f} ms\n"
+        f"Node cache hits/misses: {executor.cache.hits} / {executor.cache.misses}",
+        title="Batch Summary",
+        border_style="green" if not failed else "yellow"
+    ))
+
+@app.command()
+def resume(
+    workflow_path: str = typer.Argument("workflows/workflow.yaml", help="Path to workflow YAML file"),
+    session_id: str = typer.Option(..., "--session-id", "-s", help="Session ID of the interrupted run"),
+    stream: bool = typer.Option(True, "--stream/--no-stream", help="Stream output tokens"),
+    coalesce_ms: int = typer.Option(settings.STREAM_COALESCE_MS, "--coalesce-ms", help="Batch streamed tokens per window (ms), 0 disables"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", "-t", help="Deadline for the resumed run in seconds (default: workflow timeout)")
+):
+    """Resume an interrupted workflow run from its last completed node."""
+    bootstrap_app()
+
+    loader = YamlWorkflowLoader()
+    try:
+        workflow_def = loader.load(workflow_path)
+    except Exception as e:
+        console.print(f"[bold red]Error loading workflow:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    session_storage = container.resolve(SessionStorage)
+    checkpoint = session_storage.load_checkpoint(session_id)
+    if not checkpoint:
+        console.print(f"[bold red]No checkpoint found for session {session_id}[/bold red]")
+        raise typer.Exit(code=1)
+
+    async def run():
+        console.print(f"\n[bold cyan]--- Resuming Workflow Session: {session_id} ---[/bold cyan]")
+        console.print(f"[dim]Completed nodes: {', '.join(checkpoint.completed)}[/dim]")
+
+        executor = WorkflowExecutor(workflow_def, checkpointer=session_storage, cache=node_cache())
+        try:
+            events = ChunkCoalescer(window_ms=coalesce_ms).coalesce(executor.resume_stream(session_id, timeout=timeout))
+            await render_events(events, session_storage, checkpoint.context, stream)
+        except Exception as e:
+            console.print(f"\n[bold red]Workflow Runtime Error:[/bold red] {e}")
+        await session_storage.aflush()
+
+    asyncio.run(run())
+
+@app.command("migrate-sessions")
+def migrate_sessions():
+    """Rewrite stored sessions and checkpoints in the configured SESSION_FORMAT, or import them into the database with SESSION_STORE=sql."""
+    bootstrap_app()
+
+    migrated = container.resolve(SessionStorage).repo.migrate()
+    target = "the database" if settings.SESSION_STORE == "sql" else f"the {settings.SESSION_FORMAT} format"
+    console.print(f"[bold green]Migrated {migrated} documents to {target}.[/bold green]")
+
+@app.command("migrate-storage")
+def migrate_storage(
+    root: Optional[str] = typer.Option(None, "--root", help="Storage root directory (default: the shared session store)"),
+    shard_depth: int = typer.Option(DEFAULT_SHARD_DEPTH, "--shard-depth", help="Levels of hash-prefix subdirectories, 0 for a flat layout")
+):
+    """Move the documents of a file store into the sharded directory layout and rebuild its index. Stop the service first."""
+    store = FileSystemDB(root_dir=root) if root else db
+    started = time.perf_counter()
+    moved = store.migrate_layout(shard_depth)
+    console.print(f"[bold green]Moved {moved} files of {store.root_dir} to a {shard_depth} level layout in {time.perf_counter() - started:.1f}s.[/bold green]")
+
 if __name__ == "__main__":
     app()
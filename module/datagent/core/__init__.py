@@ -1,11 +1,17 @@
 from .context import WorkflowContext
 from .workflow_executor import WorkflowExecutor
 from .yaml_workflow_loader import YamlWorkflowLoader, WorkflowDefinition, WorkflowNode
+from .execution_plan import ExecutionPlan, PlanCompiler, PlanNode
+from .checkpoint import WorkflowCheckpoint
 
 __all__ = [
     "WorkflowContext",
     "WorkflowExecutor",
     "YamlWorkflowLoader",
     "WorkflowDefinition",
-    "WorkflowNode"
+    "WorkflowNode",
+    "ExecutionPlan",
+    "PlanCompiler",
+    "PlanNode",
+    "WorkflowCheckpoint"
 ]
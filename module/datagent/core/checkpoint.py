@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+from typing import Tuple
+from .context import WorkflowContext
+from ..agents.schemas import BasePrompt
+
+@dataclass(frozen=True)
+class WorkflowCheckpoint:
+    """
+    Snapshot of an in-flight run taken at a node boundary.
+    `completed` lists the agent nodes that finished, in completion order, and
+    `context` holds their merged outputs so a resumed run can skip them.
+    """
+    session_id: str
+    workflow: str
+    prompt: BasePrompt
+    completed: Tuple[str, ...]
+    context: WorkflowContext
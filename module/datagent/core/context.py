@@ -1,20 +1,167 @@
 from dataclasses import dataclass, field
-from typing import Dict, Any, Optional
+from itertools import islice
+from typing import Dict, Any, Optional, Iterator, Iterable, Mapping, Sequence, Union
 import uuid
 from ..agents.schemas import BaseMessage
 
+class History(Sequence):
+    """
+    Immutable, structurally shared message history.
+
+    All versions derived from one another by `append` share a single backing list;
+    a version only ever sees the first `len(self)` items of it. Appending to the
+    newest version is therefore O(1) (amortized). Appending to an older version
+    (e.g. two parallel branches forking from the same context) copies its prefix
+    once and starts a new backing list.
+    """
+    __slots__ = ("_items", "_length")
+
+    def __init__(self, items: Iterable[Any] = ()):
+        self._items = list(items)
+        self._length = len(self._items)
+
+    @classmethod
+    def _view(cls, items: list, length: int) -> "History":
+        history = cls.__new__(cls)
+        history._items = items
+        history._length = length
+        return history
+
+    def append(self, entry: Any) -> "History":
+        items = self._items
+        if len(items) != self._length:
+            # Someone already appended to our backing list, branch off
+            items = items[:self._length]
+        items.append(entry)
+        return History._view(items, self._length + 1)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            return self._items[start:stop:step]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("history index out of range")
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        return islice(self._items, self._length)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (History, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"History({list(self)!r})"
+
+class ChainedState(Mapping):
+    """
+    Immutable state mapping built as a chain of update layers, newest on top.
+
+    `set_many` adds the updates as a new layer instead of copying the whole dict.
+    Layers are merged size-tiered: a layer is folded into the one below it while
+    it holds at least half as many keys, so every layer is less than half the size
+    of the one below. The chain is therefore at most log2(len(state)) + 1 layers
+    deep (the cost of a lookup), and a key is copied O(log(len(state))) times over
+    its lifetime, which makes `set_many` amortized O(len(updates) * log(len(state))).
+    A small update never copies the large layers holding most of the state.
+    Iterating walks every layer, O(len(state) * depth).
+    """
+    __slots__ = ("_local", "_parent", "_len")
+
+    def __init__(self, data: Optional[Mapping[str, Any]] = None):
+        self._local = dict(data or {})
+        self._parent: Optional[ChainedState] = None
+        self._len = len(self._local)
+
+    def set_many(self, updates: Mapping[str, Any]) -> "ChainedState":
+        if not updates:
+            return self
+        length = self._len + sum(1 for key in updates if key not in self)
+
+        local = dict(updates)
+        parent = self
+        while parent is not None and 2 * len(local) >= len(parent._local):
+            merged = dict(parent._local)
+            merged.update(local)
+            local = merged
+            parent = parent._parent
+
+        state = ChainedState.__new__(ChainedState)
+        state._local = local
+        state._parent = parent
+        state._len = length
+        return state
+
+    def _flatten(self) -> Dict[str, Any]:
+        if self._parent is None:
+            return self._local
+        layers = []
+        node = self
+        while node is not None:
+            layers.append(node._local)
+            node = node._parent
+        flat = {}
+        for layer in reversed(layers):
+            flat.update(layer)
+        return flat
+
+    def __getitem__(self, key: str) -> Any:
+        node = self
+        while node is not None:
+            if key in node._local:
+                return node._local[key]
+            node = node._parent
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        node = self
+        while node is not None:
+            if key in node._local:
+                return node._local[key]
+            node = node._parent
+        return default
+
+    def __contains__(self, key) -> bool:
+        node = self
+        while node is not None:
+            if key in node._local:
+                return True
+            node = node._parent
+        return False
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._flatten())
+
+    def __len__(self) -> int:
+        return self._len
+
+    def copy(self) -> Dict[str, Any]:
+        return dict(self._flatten())
+
+    def __repr__(self) -> str:
+        return f"ChainedState({self._flatten()!r})"
+
 @dataclass(frozen=True)
 class WorkflowContext:
     session_id: str
-    state: Dict[str, Any] = field(default_factory=dict)
-    history: list[BaseMessage] = field(default_factory=list)
-    
+    state: Union[Dict[str, Any], ChainedState] = field(default_factory=dict)
+    history: Union[list[BaseMessage], History] = field(default_factory=list)
+
+    def __post_init__(self):
+        # Accept plain dicts/lists (e.g. from storage) and convert them once
+        if not isinstance(self.state, ChainedState):
+            object.__setattr__(self, "state", ChainedState(self.state))
+        if not isinstance(self.history, History):
+            object.__setattr__(self, "history", History(self.history))
+
     def update(self, updates: Dict[str, Any]) -> 'WorkflowContext':
-        new_state = self.state.copy()
-        new_state.update(updates)
-        return WorkflowContext(session_id=self.session_id, state=new_state, history=self.history)
+        return WorkflowContext(session_id=self.session_id, state=self.state.set_many(updates), history=self.history)
 
     def add_history(self, entry: Any) -> 'WorkflowContext':
-        new_history = self.history.copy()
-        new_history.append(entry)
-        return WorkflowContext(session_id=self.session_id, state=self.state, history=new_history)
+        return WorkflowContext(session_id=self.session_id, state=self.state, history=self.history.append(entry))
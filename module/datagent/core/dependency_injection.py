@@ -1,29 +1,226 @@
-from typing import Any, Dict, Type, TypeVar, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+from concurrent.futures import Future
+from dataclasses import dataclass
+import asyncio
+import inspect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
 
 T = TypeVar("T")
 
+# Service scopes
+SINGLETON = "singleton"  # created once per process, on first resolve (or at startup if eager)
+SESSION = "session"      # created once per session id, disposed by end_session()
+TRANSIENT = "transient"  # created on every resolve
+_SCOPES = (SINGLETON, SESSION, TRANSIENT)
+
+@dataclass(frozen=True)
+class _Registration:
+    factory: Callable[..., Any]
+    scope: str
+    # Called with the instance when its scope ends, may be async
+    dispose: Optional[Callable[[Any], Any]] = None
+    eager: bool = False
+
+    @property
+    def is_async(self) -> bool:
+        return inspect.iscoroutinefunction(self.factory)
+
 class Container:
+    """
+    Service container. Factories run lazily on first resolve and their instances
+    are cached according to the registration's scope. Singleton and per-session
+    creation happens exactly once even with concurrent resolves from several
+    threads or event loops; the other callers wait for the first one's result.
+
+    Async factories must be resolved with `aresolve`; sync `resolve` only returns
+    their instance once it exists (e.g. after `startup` for eager services).
+    """
+
     def __init__(self):
         self._services: Dict[Type, Any] = {}
-        self._factories: Dict[Type, Any] = {}
+        self._factories: Dict[Type, _Registration] = {}
+        self._singletons: Dict[Type, Future] = {}
+        self._sessions: Dict[str, Dict[Type, Future]] = {}
+        # Instances with a dispose hook, in creation order, per session id (None for singletons)
+        self._disposables: Dict[Optional[str], List[Tuple[Any, Callable[[Any], Any]]]] = {}
+        self._startup_hooks: List[Callable[[], Any]] = []
+        self._shutdown_hooks: List[Callable[[], Any]] = []
+        self._lock = threading.Lock()
 
     def register_instance(self, interface: Type[T], instance: T):
         self._services[interface] = instance
 
-    def register_factory(self, interface: Type[T], factory: Any):
-        self._factories[interface] = factory
+    def register_factory(
+        self,
+        interface: Type[T],
+        factory: Callable[[], Any],
+        scope: str = TRANSIENT,
+        dispose: Optional[Callable[[T], Any]] = None,
+        eager: bool = False
+    ):
+        """
+        Registers a (sync or async) factory. With `eager`, a singleton is created by
+        `startup` rather than on first resolve. `dispose` is called with each
+        instance when its scope ends (shutdown, or end_session for session scope).
+
+        A factory can be replaced until the previous one created an instance that is
+        still alive; replacing it then would leak that instance without disposing it.
+        """
+        if scope not in _SCOPES:
+            raise ValueError(f"Unknown scope {scope}, expected one of {', '.join(_SCOPES)}")
+        with self._lock:
+            if interface in self._singletons or any(interface in slots for slots in self._sessions.values()):
+                raise ValueError(f"Service {interface} already has live instances, shut the container down (or end their sessions) before registering it again")
+            self._factories[interface] = _Registration(factory, scope, dispose, eager)
+
+    def is_registered(self, interface: Type) -> bool:
+        return interface in self._services or interface in self._factories
+
+    def on_startup(self, hook: Callable[[], Any]):
+        self._startup_hooks.append(hook)
+        return hook
+
+    def on_shutdown(self, hook: Callable[[], Any]):
+        self._shutdown_hooks.append(hook)
+        return hook
+
+    def resolve(self, interface: Type[T], session_id: Optional[str] = None) -> T:
+        if interface in self._services:
+            return self._services[interface]
+
+        registration = self._registration(interface)
+        if registration.scope == TRANSIENT:
+            if registration.is_async:
+                raise ValueError(f"Service {interface} has an async factory, use aresolve()")
+            return registration.factory()
+
+        if registration.is_async:
+            with self._lock:
+                future = self._slots(registration, session_id).get(interface)
+            if future is None or not future.done():
+                raise ValueError(f"Service {interface} has an async factory, use aresolve()")
+            return future.result()
 
-    def resolve(self, interface: Type[T]) -> T:
+        future, owner = self._claim(interface, registration, session_id)
+        if owner:
+            self._create(interface, registration, session_id, future)
+        # Blocks while another thread is still creating it
+        return future.result()
+
+    async def aresolve(self, interface: Type[T], session_id: Optional[str] = None) -> T:
         if interface in self._services:
             return self._services[interface]
-        
-        if interface in self._factories:
-            instance = self._factories[interface]()
-            # Singleton by default for factories? Let's keep it simple and just return new instance
-            # or we could cache it.
-            return instance
-            
-        raise ValueError(f"Service {interface} not registered")
+
+        registration = self._registration(interface)
+        if registration.scope == TRANSIENT:
+            instance = registration.factory()
+            return await instance if inspect.isawaitable(instance) else instance
+
+        future, owner = self._claim(interface, registration, session_id)
+        if owner:
+            if registration.is_async:
+                try:
+                    instance = await registration.factory()
+                except BaseException as e:
+                    self._fail(interface, registration, session_id, future, e)
+                    raise
+                self._created(registration, session_id, future, instance)
+            else:
+                self._create(interface, registration, session_id, future)
+        if future.done():
+            return future.result()
+        # Created by another task or thread, wait without blocking the loop
+        return await asyncio.wrap_future(future)
+
+    def _registration(self, interface: Type) -> _Registration:
+        registration = self._factories.get(interface)
+        if registration is None:
+            raise ValueError(f"Service {interface} not registered")
+        return registration
+
+    def _slots(self, registration: _Registration, session_id: Optional[str]) -> Dict[Type, Future]:
+        if registration.scope == SINGLETON:
+            return self._singletons
+        if session_id is None:
+            raise ValueError("Session scoped services need a session_id")
+        return self._sessions.setdefault(session_id, {})
+
+    def _claim(self, interface: Type, registration: _Registration, session_id: Optional[str]) -> Tuple[Future, bool]:
+        """Returns the instance's future and whether the caller has to create it."""
+        with self._lock:
+            slots = self._slots(registration, session_id)
+            future = slots.get(interface)
+            if future is not None:
+                return future, False
+            future = slots[interface] = Future()
+            return future, True
+
+    def _create(self, interface: Type, registration: _Registration, session_id: Optional[str], future: Future):
+        try:
+            instance = registration.factory()
+        except BaseException as e:
+            self._fail(interface, registration, session_id, future, e)
+            raise
+        self._created(registration, session_id, future, instance)
+
+    def _created(self, registration: _Registration, session_id: Optional[str], future: Future, instance: Any):
+        if registration.dispose is not None:
+            with self._lock:
+                self._disposables.setdefault(session_id if registration.scope == SESSION else None, []).append((instance, registration.dispose))
+        future.set_result(instance)
+
+    def _fail(self, interface: Type, registration: _Registration, session_id: Optional[str], future: Future, error: BaseException):
+        # Waiting callers get the error, the next resolve tries again
+        self._release(interface, registration, session_id, future)
+        future.set_exception(error)
+
+    def _release(self, interface: Type, registration: _Registration, session_id: Optional[str], future: Future):
+        with self._lock:
+            slots = self._slots(registration, session_id)
+            if slots.get(interface) is future:
+                del slots[interface]
+
+    async def startup(self):
+        """Creates eager singletons, then runs the startup hooks."""
+        for interface, registration in list(self._factories.items()):
+            if registration.eager and registration.scope == SINGLETON:
+                await self.aresolve(interface)
+        for hook in self._startup_hooks:
+            await _call(hook)
+
+    async def end_session(self, session_id: str):
+        """Disposes the session scoped instances of `session_id`."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            disposables = self._disposables.pop(session_id, [])
+        await _dispose(disposables)
+
+    async def shutdown(self):
+        """Ends all sessions, disposes singletons (newest first) and runs the shutdown hooks."""
+        for session_id in list(self._sessions):
+            await self.end_session(session_id)
+        with self._lock:
+            self._singletons.clear()
+            disposables = self._disposables.pop(None, [])
+        await _dispose(disposables)
+        for hook in self._shutdown_hooks:
+            await _call(hook)
+
+async def _call(fn: Callable[..., Any], *args) -> Any:
+    result = fn(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+async def _dispose(disposables: List[Tuple[Any, Callable[[Any], Any]]]):
+    for instance, dispose in reversed(disposables):
+        try:
+            await _call(dispose, instance)
+        except Exception as e:
+            logger.warning(f"Failed to dispose {type(instance).__name__}: {e}")
 
 # Global container instance
 container = Container()
@@ -1,16 +1,210 @@
-from typing import Callable, Dict, List, Any
+from typing import Callable, Dict, List, Any, Optional
 import asyncio
+import inspect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Subscribes a handler to every event type
+ALL_EVENTS = "*"
+
+# Overflow policies of a queued subscription
+OVERFLOW_BLOCK = "block"              # publish waits for room (backpressure on the publisher)
+OVERFLOW_DROP_NEWEST = "drop_newest"  # the event being published is dropped
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # the oldest queued event is dropped to make room
+_OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST)
+
+class Subscription:
+    """
+    A queued subscriber: events are put on its own bounded queue and delivered by
+    its own worker task, so a slow handler only ever delays itself. With a
+    `batch_size` above 1 the handler receives lists of up to that many events,
+    waiting at most `batch_interval` seconds for a batch to fill up.
+    """
+
+    def __init__(
+        self,
+        event_type: str,
+        handler: Callable[[Any], Any],
+        max_queue: int = 1024,
+        overflow: str = OVERFLOW_DROP_OLDEST,
+        batch_size: int = 1,
+        batch_interval: Optional[float] = None
+    ):
+        if overflow not in _OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow}, expected one of {', '.join(_OVERFLOW_POLICIES)}")
+        if max_queue < 1 or batch_size < 1:
+            raise ValueError("max_queue and batch_size must be at least 1")
+        self.event_type = event_type
+        self.handler = handler
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        # Created on first use, bound to the loop that publishes to it
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Counters for observability, every published event ends up delivered,
+        # dropped or failed (or is still queued)
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_lag = 0
+        # Seconds the oldest event of the last delivery waited in the queue
+        self.last_delay = 0.0
+
+    @property
+    def lag(self) -> int:
+        """Events queued but not yet delivered."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "event_type": self.event_type,
+            "handler": getattr(self.handler, "__qualname__", repr(self.handler)),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+            "last_delay": self.last_delay
+        }
+
+    async def put(self, payload: Any):
+        queue = self._ensure_worker()
+        item = (time.monotonic(), payload)
+        if queue.full():
+            if self.overflow == OVERFLOW_DROP_NEWEST:
+                self.published += 1
+                self.dropped += 1
+                return
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                queue.get_nowait()
+                queue.task_done()
+                self.dropped += 1
+            else:
+                await queue.put(item)
+                self._published()
+                return
+        queue.put_nowait(item)
+        self._published()
+
+    def _published(self):
+        self.published += 1
+        self.max_lag = max(self.max_lag, self._queue.qsize())
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_queue)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run(), name=f"event-bus:{self.event_type}")
+        return self._queue
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            items = [await queue.get()]
+            if self.batch_size > 1:
+                await self._fill_batch(queue, items)
+            try:
+                self.last_delay = time.monotonic() - items[0][0]
+                payloads = [payload for _, payload in items]
+                result = self.handler(payloads if self.batch_size > 1 else payloads[0])
+                if inspect.isawaitable(result):
+                    await result
+                self.delivered += len(items)
+            except Exception as e:
+                self.failed += len(items)
+                logger.warning(f"Event handler {self.stats()['handler']} for '{self.event_type}' failed: {e}")
+            finally:
+                for _ in items:
+                    queue.task_done()
+
+    async def _fill_batch(self, queue: asyncio.Queue, items: List[Any]):
+        deadline = time.monotonic() + self.batch_interval if self.batch_interval else None
+        while len(items) < self.batch_size:
+            if not queue.empty():
+                items.append(queue.get_nowait())
+                continue
+            remaining = deadline - time.monotonic() if deadline is not None else 0
+            if remaining <= 0:
+                return
+            try:
+                items.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                return
+
+    async def drain(self):
+        """Waits until every queued event has been delivered (or has failed)."""
+        if self._queue is not None and self._worker is not None and not self._worker.done():
+            await self._queue.join()
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
 
 class EventBus:
+    """
+    Publish/subscribe of events by type. Handlers registered with `subscribe` are
+    awaited by `publish` itself; handlers registered with `subscribe_queued` get
+    their own bounded queue and worker task (see Subscription), so side consumers
+    like metrics exporters or DB writers never slow the publisher down, short of
+    a full queue with the `block` overflow policy.
+
+    Queued subscriptions are bound to the event loop that first publishes to them.
+    """
+
     def __init__(self):
         self._subscribers: Dict[str, List[Callable[[Any], Any]]] = {}
+        self._queued: Dict[str, List[Subscription]] = {}
 
     def subscribe(self, event_type: str, handler: Callable[[Any], Any]):
         if event_type not in self._subscribers:
             self._subscribers[event_type] = []
         self._subscribers[event_type].append(handler)
 
+    def subscribe_queued(self, event_type: str, handler: Callable[[Any], Any], **options) -> Subscription:
+        """
+        Subscribes `handler` (sync or async) through its own queue and worker.
+        `event_type` may be ALL_EVENTS. Options are those of Subscription.
+        """
+        subscription = Subscription(event_type, handler, **options)
+        self._queued.setdefault(event_type, []).append(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription, drain: bool = True):
+        subscriptions = self._queued.get(subscription.event_type, [])
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+        if drain:
+            await subscription.drain()
+        await subscription.close()
+
     async def publish(self, event_type: str, payload: Any):
+        for key in (event_type, ALL_EVENTS):
+            for subscription in self._queued.get(key, ()):
+                await subscription.put(payload)
+
         if event_type in self._subscribers:
             tasks = [handler(payload) for handler in self._subscribers[event_type]]
             await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [subscription.stats() for subscriptions in self._queued.values() for subscription in subscriptions]
+
+    async def drain(self):
+        await asyncio.gather(*(subscription.drain() for subscriptions in self._queued.values() for subscription in subscriptions))
+
+    async def close(self, drain: bool = True):
+        """Stops all queued workers, by default after they delivered what is queued."""
+        if drain:
+            await self.drain()
+        for subscriptions in self._queued.values():
+            for subscription in subscriptions:
+                await subscription.close()
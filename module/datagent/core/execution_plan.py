@@ -0,0 +1,277 @@
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
+from .context import WorkflowContext
+from .node_cache import CachePolicy
+from .yaml_workflow_loader import WorkflowDefinition, WorkflowNode
+
+# `speculate` value of a router that picks its likely route from recent decisions
+SPECULATE_LEARNED = "learned"
+
+# Concurrent element runs of a map node without `max_concurrency`
+DEFAULT_MAP_CONCURRENCY = 4
+
+# A compiled `$node.path` reference: takes the current context and returns the value
+Accessor = Callable[[WorkflowContext], Any]
+# A compiled `$item.path` reference: takes one element of a map node's list
+ItemAccessor = Callable[[Any], Any]
+# A compiled map node `items` reference: takes the context and the run's prompt
+ItemsAccessor = Callable[[WorkflowContext, Any], Any]
+
+@dataclass(frozen=True)
+class PlanNode:
+    id: str
+    type: str
+    agent_name: Optional[str]
+    # Global workflow config already merged into the node config
+    config: Mapping[str, Any]
+    # (agent input name, accessor) pairs
+    inputs: Tuple[Tuple[str, Accessor], ...]
+    next_nodes: Tuple[str, ...]
+    # Router specific
+    condition: Optional[str] = None
+    condition_accessor: Optional[Accessor] = None
+    routes: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    default_route: Optional[str] = None
+    # Node started ahead of the decision, SPECULATE_LEARNED or None
+    speculate: Optional[str] = None
+    # Nodes that are safe to start ahead of the decision
+    speculative_targets: FrozenSet[str] = frozenset()
+    # Agent specific: speculative router directly downstream of this node
+    speculation_router: Optional[str] = None
+    # Join specific: number of incoming edges to wait for
+    fan_in: int = 0
+    timeout: Optional[float] = None
+    # Agent specific: result caching, None when disabled
+    cache: Optional[CachePolicy] = None
+    # Map specific
+    items_accessor: Optional[ItemsAccessor] = None
+    # (agent input name, accessor) pairs resolved against each element
+    item_inputs: Tuple[Tuple[str, ItemAccessor], ...] = ()
+    max_concurrency: int = 0
+    continue_on_error: bool = False
+
+    def resolve_inputs(self, context: WorkflowContext) -> Dict[str, Any]:
+        return {key: accessor(context) for key, accessor in self.inputs}
+
+    def route(self, condition_val: Any) -> Optional[str]:
+        return self.routes.get(str(condition_val), self.default_route)
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    name: str
+    start_node: str
+    nodes: Mapping[str, PlanNode]
+    # Default deadline of a run in seconds, None for no deadline
+    timeout: Optional[float] = None
+
+class PlanCompiler:
+    """
+    Compiles a WorkflowDefinition ahead of time into an immutable ExecutionPlan.
+
+    All per-definition work (config merging, reference parsing, edge validation)
+    happens here once, so executing a node only costs what the node itself does.
+    """
+
+    def compile(self, definition: WorkflowDefinition) -> ExecutionPlan:
+        self._validate(definition)
+
+        nodes = {}
+        for node_id, node in definition.nodes.items():
+            nodes[node_id] = self._compile_node(node, definition)
+
+        timeout = definition.timeout
+        return ExecutionPlan(
+            name=definition.name,
+            start_node=definition.start_node,
+            nodes=MappingProxyType(nodes),
+            timeout=timeout if timeout is not None and timeout > 0 else None
+        )
+
+    def _compile_node(self, node: WorkflowNode, definition: WorkflowDefinition) -> PlanNode:
+        is_map = node.type == "map"
+        inputs = []
+        item_inputs = []
+        for target_key, source_value in node.input_mapping.items():
+            if is_map and _is_item_reference(source_value):
+                item_inputs.append((target_key, compile_item_reference(source_value)))
+            else:
+                inputs.append((target_key, compile_reference(source_value)))
+
+        return PlanNode(
+            id=node.id,
+            type=node.type,
+            agent_name=node.agent_name,
+            config=MappingProxyType(self._merge_config(definition.config, node.config)),
+            inputs=tuple(inputs),
+            next_nodes=tuple(node.next_nodes),
+            condition=node.condition,
+            condition_accessor=compile_reference(node.condition) if node.type == "router" else None,
+            routes=MappingProxyType({str(k): v for k, v in node.routes.items()}),
+            default_route=node.default_route,
+            speculate=self._speculation_target(node),
+            speculative_targets=frozenset(self._speculative_targets(node, definition)),
+            speculation_router=self._speculation_router(node, definition),
+            fan_in=len(definition.predecessors(node.id)) if node.type == "join" else 0,
+            timeout=node.timeout,
+            cache=CachePolicy.parse(node.cache),
+            items_accessor=compile_items_reference(node.items) if is_map else None,
+            item_inputs=tuple(item_inputs),
+            max_concurrency=(node.max_concurrency or DEFAULT_MAP_CONCURRENCY) if is_map else 0,
+            continue_on_error=bool(node.continue_on_error)
+        )
+
+    def _speculation_target(self, node: WorkflowNode) -> Optional[str]:
+        if node.type != "router" or node.speculate is None or node.speculate == SPECULATE_LEARNED:
+            return node.speculate
+        # A route key or directly the id of the target node
+        return node.routes.get(str(node.speculate), node.speculate)
+
+    def _speculative_targets(self, node: WorkflowNode, definition: WorkflowDefinition) -> List[str]:
+        """
+        Route targets of a speculating router that may start before the decision:
+        agent nodes which do not read the output of a node upstream of the router,
+        since a speculative node runs on the context from before that node finished.
+        """
+        if node.type != "router" or not node.speculate:
+            return []
+        upstream = set(definition.predecessors(node.id))
+        targets = set(node.routes.values())
+        if node.default_route:
+            targets.add(node.default_route)
+        return [
+            target for target in targets
+            if definition.nodes[target].type in ("agent", "map") and not _reads_from(definition.nodes[target], upstream)
+        ]
+
+    def _speculation_router(self, node: WorkflowNode, definition: WorkflowDefinition) -> Optional[str]:
+        if node.type not in ("agent", "map") or len(node.next_nodes) != 1:
+            return None
+        successor = definition.nodes[node.next_nodes[0]]
+        return successor.id if successor.type == "router" and successor.speculate else None
+
+    def _merge_config(self, global_config: Dict[str, Any], node_config: Dict[str, Any]) -> Dict[str, Any]:
+        final_config = dict(node_config)
+
+        # Merge global config into node config
+        for key, global_val in (global_config or {}).items():
+            if key not in final_config:
+                final_config[key] = global_val
+            else:
+                # Both exist. Shallow merge if dicts
+                local_val = final_config[key]
+                if isinstance(global_val, dict) and isinstance(local_val, dict):
+                    merged = global_val.copy()
+                    merged.update(local_val)
+                    final_config[key] = merged
+        return final_config
+
+    def _validate(self, definition: WorkflowDefinition):
+        if definition.start_node not in definition.nodes:
+            raise ValueError(f"Workflow '{definition.name}': start node '{definition.start_node}' is not defined")
+
+        for node in definition.nodes.values():
+            if node.type in ("agent", "map") and not node.agent_name:
+                raise ValueError(f"Workflow '{definition.name}': node '{node.id}' has no agent")
+            if node.type == "map":
+                if not node.items:
+                    raise ValueError(f"Workflow '{definition.name}': map node '{node.id}' has no items")
+                if node.max_concurrency is not None and node.max_concurrency < 1:
+                    raise ValueError(f"Workflow '{definition.name}': map node '{node.id}' needs a max_concurrency of at least 1")
+            if node.type == "router" and not node.condition:
+                raise ValueError(f"Workflow '{definition.name}': router '{node.id}' has no condition")
+            if node.timeout is not None and node.timeout <= 0:
+                raise ValueError(f"Workflow '{definition.name}': node '{node.id}' has a non-positive timeout")
+            if node.cache:
+                if node.type not in ("agent", "map"):
+                    raise ValueError(f"Workflow '{definition.name}': only agent and map nodes can be cached, '{node.id}' is a {node.type}")
+                try:
+                    CachePolicy.parse(node.cache)
+                except ValueError as e:
+                    raise ValueError(f"Workflow '{definition.name}': node '{node.id}': {e}") from None
+
+            targets = list(node.next_nodes) + list(node.routes.values())
+            if node.default_route:
+                targets.append(node.default_route)
+            for target in targets:
+                if target not in definition.nodes:
+                    raise ValueError(f"Workflow '{definition.name}': node '{node.id}' points to unknown node '{target}'")
+
+            if node.speculate is not None:
+                self._validate_speculation(node, definition)
+
+    def _validate_speculation(self, node: WorkflowNode, definition: WorkflowDefinition):
+        if node.type != "router":
+            raise ValueError(f"Workflow '{definition.name}': node '{node.id}' is not a router and cannot speculate")
+        if node.speculate == SPECULATE_LEARNED:
+            return
+
+        target = self._speculation_target(node)
+        if target not in node.routes.values() and target != node.default_route:
+            raise ValueError(f"Workflow '{definition.name}': router '{node.id}' speculates on unknown route '{node.speculate}'")
+        if target not in self._speculative_targets(node, definition):
+            raise ValueError(
+                f"Workflow '{definition.name}': router '{node.id}' cannot speculate on '{target}', "
+                f"it is not an agent or map node or it reads the output of a node upstream of the router"
+            )
+
+def _reads_from(node: WorkflowNode, node_ids: set) -> bool:
+    """Whether any input (or map items) reference of `node` points at one of `node_ids`."""
+    for source_value in list(node.input_mapping.values()) + [node.items]:
+        if isinstance(source_value, str) and source_value.startswith("$"):
+            if source_value[1:].split(".", 1)[0] in node_ids:
+                return True
+    return False
+
+def compile_reference(source_value: Any) -> Accessor:
+    """
+    Turns an input mapping value into an accessor. `$name` reads a state variable,
+    `$node.a.b` walks attributes/keys of a node output, anything else is a literal.
+    """
+    if not (isinstance(source_value, str) and source_value.startswith("$")):
+        return lambda context: source_value
+
+    ref_path = source_value[1:]
+    if "." not in ref_path:
+        # Direct match on state (node outputs OR variables)
+        return lambda context: context.state.get(ref_path)
+
+    node_id, rest = ref_path.split(".", 1)
+    parts = tuple(rest.split("."))
+
+    def _accessor(context: WorkflowContext) -> Any:
+        return _walk(context.state.get(node_id), parts)
+
+    return _accessor
+
+def compile_items_reference(source_value: str) -> ItemsAccessor:
+    """Like `compile_reference`, plus `$prompt.a.b` to read from the run's prompt (e.g. `$prompt.files`)."""
+    if isinstance(source_value, str) and (source_value == "$prompt" or source_value.startswith("$prompt.")):
+        parts = tuple(source_value.split(".")[1:])
+        return lambda context, prompt: _walk(prompt, parts)
+
+    accessor = compile_reference(source_value)
+    return lambda context, prompt: accessor(context)
+
+def compile_item_reference(source_value: str) -> ItemAccessor:
+    """Compiles `$item` or `$item.a.b`, read from one element of a map node's list."""
+    parts = tuple(source_value.split(".")[1:])
+    return lambda item: _walk(item, parts)
+
+def _is_item_reference(source_value: Any) -> bool:
+    return isinstance(source_value, str) and (source_value == "$item" or source_value.startswith("$item."))
+
+def _walk(current: Any, parts: Tuple[str, ...]) -> Any:
+    """Follows attributes/keys along `parts`, None as soon as one is missing."""
+    if not parts:
+        return current
+    if not current:
+        return None
+    for part in parts:
+        if hasattr(current, part):
+            current = getattr(current, part)
+        elif isinstance(current, dict) and part in current:
+            current = current[part]
+        else:
+            return None
+    return current
@@ -1,38 +1,215 @@
-from typing import Callable, Awaitable, Any, Dict
-from abc import ABC, abstractmethod
+from typing import Callable, Awaitable, Any, Dict, Iterable, List, Optional, Tuple, Type, Union
+from abc import ABC
+from functools import partial
+import asyncio
 import logging
+import random
+import threading
+import time
+from .profiler import span
 
 logger = logging.getLogger(__name__)
 
+# A composed chain (or its target): takes the call context, returns the result
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
 class Middleware(ABC):
-    @abstractmethod
+    """
+    A link in a MiddlewarePipeline. Override `handle`, which receives the next
+    handler of the precomposed chain and must call it with the context, or the
+    older `process_request`, whose `next_call` takes no arguments. A middleware
+    overriding neither passes every call through unchanged.
+    """
+
+    async def handle(self, context: Dict[str, Any], call_next: Handler) -> Any:
+        # Adapter for process_request style middleware (binds the context per call)
+        return await self.process_request(context, partial(call_next, context))
+
     async def process_request(self, context: Dict[str, Any], next_call: Callable[[], Awaitable[Any]]) -> Any:
-        pass
+        return await next_call()
+
+class MiddlewareRegistry:
+    _registry: Dict[str, Type[Middleware]] = {}
+
+    @classmethod
+    def register(cls, name: str):
+        def decorator(middleware_cls: Type[Middleware]):
+            cls._registry[name] = middleware_cls
+            return middleware_cls
+        return decorator
+
+    @classmethod
+    def instantiate(cls, name: str, **kwargs) -> Middleware:
+        if name not in cls._registry:
+            raise ValueError(f"Middleware {name} not found")
+        return cls._registry[name](**kwargs)
 
 class MiddlewarePipeline:
-    def __init__(self):
-        self._middlewares = []
+    """
+    An ordered list of middleware. `build(target)` composes the chain around a
+    target once and returns a flat callable, so a call only costs the middleware
+    themselves. The first middleware added is the outermost.
+    """
+
+    def __init__(self, middlewares: Iterable[Middleware] = ()):
+        self._middlewares: List[Middleware] = list(middlewares)
+        self._chain: Optional[Handler] = None
+
+    @classmethod
+    def from_config(cls, entries: Optional[List[Union[str, Dict[str, Dict[str, Any]]]]]) -> "MiddlewarePipeline":
+        """
+        Builds a pipeline from a config list, e.g. from YAML:
+        `["logging", {"retry": {"max_attempts": 3}}, {"rate_limit": {"rate": 5}}]`.
+        """
+        pipeline = cls()
+        for entry in entries or []:
+            if isinstance(entry, str):
+                pipeline.add(MiddlewareRegistry.instantiate(entry))
+            elif isinstance(entry, dict) and len(entry) == 1:
+                name, options = next(iter(entry.items()))
+                pipeline.add(MiddlewareRegistry.instantiate(name, **(options or {})))
+            else:
+                raise ValueError(f"Invalid middleware entry {entry!r}, expected a name or a single-key mapping")
+        return pipeline
 
     def add(self, middleware: Middleware):
         self._middlewares.append(middleware)
+        self._chain = None
+
+    def __len__(self) -> int:
+        return len(self._middlewares)
+
+    def build(self, target: Handler) -> Handler:
+        handler = target
+        for middleware in reversed(self._middlewares):
+            handler = _link(middleware, handler)
+        return handler
 
     async def execute(self, context: Dict[str, Any], target: Callable[[], Awaitable[Any]]) -> Any:
-        async def _dispatch(index: int):
-            if index == len(self._middlewares):
-                return await target()
-            
-            middleware = self._middlewares[index]
-            return await middleware.process_request(context, lambda: _dispatch(index + 1))
+        # The target travels in the context so the chain is only composed once
+        if self._chain is None:
+            self._chain = self.build(_call_target)
+        return await self._chain({**context, "target": target})
+
+def _link(middleware: Middleware, call_next: Handler) -> Handler:
+    handle = middleware.handle
+
+    def call(context: Dict[str, Any]) -> Awaitable[Any]:
+        return handle(context, call_next)
+
+    return call
 
-        return await _dispatch(0)
+def _call_target(context: Dict[str, Any]) -> Awaitable[Any]:
+    return context["target"]()
 
+@MiddlewareRegistry.register("logging")
 class LoggingMiddleware(Middleware):
-    async def process_request(self, context: Dict[str, Any], next_call: Callable[[], Awaitable[Any]]) -> Any:
-        logger.info(f"Starting request with context keys: {list(context.keys())}")
+    async def handle(self, context: Dict[str, Any], call_next: Handler) -> Any:
+        logger.info(f"Starting {context.get('kind', 'request')} {context.get('name', '')} with context keys: {list(context.keys())}")
         try:
-            result = await next_call()
-            logger.info("Request completed successfully")
+            result = await call_next(context)
+            logger.info(f"{context.get('kind', 'request').capitalize()} {context.get('name', '')} completed successfully")
             return result
         except Exception as e:
-            logger.error(f"Request failed: {e}")
+            logger.error(f"{context.get('kind', 'request').capitalize()} {context.get('name', '')} failed: {e}")
             raise
+
+@MiddlewareRegistry.register("timing")
+class TimingMiddleware(Middleware):
+    """Keeps call counts and total seconds per `kind:name` and adds a span to the active profiler."""
+
+    def __init__(self, log_slower_than: Optional[float] = None):
+        self.log_slower_than = log_slower_than
+        # "kind:name" -> [calls, total seconds]
+        self.stats: Dict[str, List[float]] = {}
+
+    async def handle(self, context: Dict[str, Any], call_next: Handler) -> Any:
+        key = f"{context.get('kind', 'request')}:{context.get('name', '')}"
+        start = time.perf_counter()
+        try:
+            with span(key, "middleware"):
+                return await call_next(context)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self.stats.setdefault(key, [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            if self.log_slower_than is not None and elapsed > self.log_slower_than:
+                logger.warning(f"{key} took {elapsed:.2f}s")
+
+@MiddlewareRegistry.register("retry")
+class RetryMiddleware(Middleware):
+    """
+    Retries failed calls with exponential backoff and jitter. A retried node call
+    runs the agent again from the start, so its streamed events are emitted again.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        retry_on: Tuple[Type[BaseException], ...] = (Exception,)
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_on = tuple(retry_on)
+
+    async def handle(self, context: Dict[str, Any], call_next: Handler) -> Any:
+        attempt = 1
+        while True:
+            try:
+                return await call_next(context)
+            except self.retry_on as e:
+                if attempt >= self.max_attempts:
+                    raise
+                delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff) * random.uniform(0.5, 1.0)
+                logger.warning(f"{context.get('kind', 'request')} {context.get('name', '')} failed ({e}), retry {attempt}/{self.max_attempts - 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+@MiddlewareRegistry.register("rate_limit")
+class RateLimitMiddleware(Middleware):
+    """
+    Token bucket limiting calls to `rate` per second with bursts of up to `burst`.
+    With `key`, every distinct value of that context field (e.g. "agent" or
+    "provider") gets its own bucket.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None, key: Optional[str] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.key = key
+        # bucket key -> [tokens, last refill time]
+        self._buckets: Dict[Any, List[float]] = {}
+        # Buckets are shared by callers on different loops (e.g. the sync agent loop)
+        self._lock = threading.Lock()
+
+    async def handle(self, context: Dict[str, Any], call_next: Handler) -> Any:
+        bucket_key = context.get(self.key) if self.key else None
+        while True:
+            wait = self._take(bucket_key)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        return await call_next(context)
+
+    def _take(self, bucket_key: Any) -> float:
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                bucket = self._buckets[bucket_key] = [float(self.burst), now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            return (1 - tokens) / self.rate
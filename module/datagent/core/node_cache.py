@@ -0,0 +1,206 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Mapping, Optional, Tuple
+from ..agents.schemas import AgentOutput, AgentOutputEvent, StreamingEvent
+from .serialization import serialize, deserialize
+
+logger = logging.getLogger(__name__)
+
+# Fields that differ between otherwise identical messages and must not affect a key
+_VOLATILE_FIELDS = ("id", "timestamp", "session_id")
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    Per-node `cache:` settings.
+
+    ttl: seconds a result stays valid, None for no expiry.
+    replay_stream: record every event of the agent and replay it on a hit, instead
+        of only its context updates and final output.
+    include_history: whether the conversation history is part of the key.
+    """
+    ttl: Optional[float] = None
+    replay_stream: bool = False
+    include_history: bool = True
+
+    @classmethod
+    def parse(cls, value: Any) -> Optional["CachePolicy"]:
+        """Builds a policy from a YAML `cache:` value (`true`, `false` or a mapping)."""
+        if value is None or value is False:
+            return None
+        if value is True:
+            return cls()
+        if not isinstance(value, Mapping):
+            raise ValueError(f"Invalid cache setting {value!r}, expected a boolean or a mapping")
+
+        options = dict(value)
+        if not options.pop("enabled", True):
+            return None
+        unknown = set(options) - {f.name for f in dataclasses.fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown cache option(s): {', '.join(sorted(unknown))}")
+        policy = cls(**options)
+        if policy.ttl is not None and policy.ttl <= 0:
+            raise ValueError("Cache ttl must be positive")
+        return policy
+
+@dataclass(frozen=True)
+class CacheEntry:
+    # Recorded agent events, always including context updates and the final output
+    events: Tuple[StreamingEvent, ...]
+    created_at: float  # wall clock seconds
+
+class NodeResultCache:
+    """
+    Content-addressed cache of agent node results.
+
+    Entries are keyed by a hash of everything an agent sees (agent name, effective
+    config, resolved inputs, prompt and optionally history) and kept in an in-memory
+    LRU. With a `directory`, entries are also written there as JSON so they survive
+    restarts and can be shared between processes; memory misses fall back to disk.
+    """
+
+    def __init__(self, max_entries: int = 1024, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Counters for observability
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, agent_name: str, config: Mapping[str, Any], inputs: Mapping[str, Any], prompt: Any, history: Any = None) -> str:
+        payload = {
+            "agent": agent_name,
+            "config": dict(config),
+            "inputs": dict(inputs),
+            "prompt": prompt,
+            "history": list(history) if history is not None else None
+        }
+        canonical = json.dumps(_canonical(serialize(payload)), sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, ttl: Optional[float] = None) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        from_disk = False
+        if entry is None and self.directory:
+            entry = self._read(key)
+            from_disk = entry is not None
+
+        if entry is not None and ttl is not None and time.time() - entry.created_at > ttl:
+            self.invalidate(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if from_disk:
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, events: Tuple[StreamingEvent, ...]):
+        entry = CacheEntry(events=tuple(events), created_at=time.time())
+        self._remember(key, entry)
+        if self.directory:
+            self._write(key, entry)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.directory:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self._entries)
+        }
+
+    def _remember(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _write(self, key: str, entry: CacheEntry):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"created_at": entry.created_at, "events": serialize(list(entry.events))}, f, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write node cache entry {key}: {e}")
+
+    def _read(self, key: str) -> Optional[CacheEntry]:
+        try:
+            with open(self._path(key), "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable node cache entry {key}: {e}")
+            return None
+
+        events = deserialize(data.get("events", []))
+        if not all(isinstance(event, StreamingEvent) for event in events):
+            logger.warning(f"Ignoring node cache entry {key} with unknown event types")
+            return None
+        return CacheEntry(events=tuple(events), created_at=data.get("created_at", 0))
+
+async def replay_events(entry: CacheEntry, session_id: str) -> AsyncIterator[StreamingEvent]:
+    """
+    Yields the recorded events of `entry` as fresh messages of `session_id`,
+    so replayed outputs do not share ids or timestamps with the original run.
+    """
+    for event in entry.events:
+        if isinstance(event, AgentOutputEvent):
+            event = dataclasses.replace(event, output=_refresh(event.output, session_id))
+        yield _refresh(event, session_id)
+
+def _refresh(message: AgentOutput, session_id: str) -> AgentOutput:
+    return dataclasses.replace(message, id=str(uuid.uuid4()), timestamp=datetime.utcnow(), session_id=session_id)
+
+def _canonical(value: Any) -> Any:
+    """Drops per-message identity fields from serialized dataclasses."""
+    if isinstance(value, dict):
+        drop = _VOLATILE_FIELDS if "_type" in value else ()
+        return {k: _canonical(v) for k, v in value.items() if k not in drop}
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    return value
@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Profiler of the current run, inherited by every task the run spawns
+_current: contextvars.ContextVar[Optional["Profiler"]] = contextvars.ContextVar("datagent_profiler", default=None)
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start_us: int
+    duration_us: int
+    track: int
+    args: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass(frozen=True)
+class SpanStats:
+    category: str
+    name: str
+    count: int
+    total_ms: float
+    mean_ms: float
+    max_ms: float
+
+class Profiler:
+    """
+    Records timed spans of a workflow run: nodes, routers, LLM calls, tool calls
+    and storage writes. Spans are laid out on one track per asyncio task (or thread),
+    so parallel branches show up side by side in the exported Chrome trace.
+
+    Code records spans through the module level `span()` / `profile_stream()`,
+    which are no-ops unless a profiler is bound to the current context.
+    """
+
+    def __init__(self, name: str = "workflow"):
+        self.name = name
+        self.spans: List[Span] = []
+        self._origin_ns = time.perf_counter_ns()
+        self._tracks: Dict[Any, int] = {}
+        self._track_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def now_us(self) -> int:
+        return (time.perf_counter_ns() - self._origin_ns) // 1000
+
+    def bind(self):
+        """Makes this the profiler of the calling task and every task it spawns from now on."""
+        _current.set(self)
+
+    @contextmanager
+    def activate(self) -> Iterator["Profiler"]:
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    @contextmanager
+    def span(self, name: str, category: str, **args) -> Iterator[Dict[str, Any]]:
+        """Times the enclosed block. The yielded dict can be used to add args to the span."""
+        start = self.now_us()
+        try:
+            yield args
+        finally:
+            self.record(name, category, start, **args)
+
+    def record(self, name: str, category: str, start_us: int, **args):
+        """Records a span that started at `start_us` (see `now_us`) and ends now."""
+        span = Span(name, category, start_us, self.now_us() - start_us, self._track(), args)
+        with self._lock:
+            self.spans.append(span)
+
+    def _track(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = task if task is not None else threading.get_ident()
+        track = self._tracks.get(key)
+        if track is None:
+            with self._lock:
+                track = self._tracks.setdefault(key, len(self._tracks) + 1)
+                self._track_names[track] = task.get_name() if task is not None else threading.current_thread().name
+        return track
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Trace Event Format, loadable in Perfetto or chrome://tracing."""
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {"ph": "M", "name": "process_name", "pid": pid, "tid": 0, "args": {"name": self.name}}
+        ]
+        for track, track_name in sorted(self._track_names.items()):
+            events.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": track, "args": {"name": track_name}})
+        for span in self.spans:
+            events.append({
+                "ph": "X",
+                "name": span.name,
+                "cat": span.category,
+                "ts": span.start_us,
+                "dur": span.duration_us,
+                "pid": pid,
+                "tid": span.track,
+                "args": span.args
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+    def summary(self) -> List[SpanStats]:
+        """Per (category, name) totals, slowest first."""
+        groups: Dict[tuple, List[int]] = {}
+        for span in self.spans:
+            groups.setdefault((span.category, span.name), []).append(span.duration_us)
+
+        stats = [
+            SpanStats(
+                category=category,
+                name=name,
+                count=len(durations),
+                total_ms=sum(durations) / 1000,
+                mean_ms=sum(durations) / len(durations) / 1000,
+                max_ms=max(durations) / 1000
+            )
+            for (category, name), durations in groups.items()
+        ]
+        return sorted(stats, key=lambda s: s.total_ms, reverse=True)
+
+def current_profiler() -> Optional[Profiler]:
+    return _current.get()
+
+def span(name: str, category: str, **args):
+    """Times the enclosed block on the current profiler, if any."""
+    profiler = _current.get()
+    if profiler is None:
+        # Yields this call's own args dict, so what a caller adds to it is dropped with it
+        return nullcontext(args)
+    return profiler.span(name, category, **args)
+
+def profile_stream(stream: AsyncIterator[T], name: str, category: str, **args) -> AsyncIterator[T]:
+    """
+    Times an async stream from the first `__anext__` until it is exhausted or closed,
+    recording the time to its first item as `ttft_ms`. Returns `stream` itself when
+    profiling is off.
+    """
+    profiler = _current.get()
+    if profiler is None:
+        return stream
+    return _profiled_stream(profiler, stream, name, category, args)
+
+async def _profiled_stream(profiler: Profiler, stream: AsyncIterator[T], name: str, category: str, args: Dict[str, Any]) -> AsyncIterator[T]:
+    start = profiler.now_us()
+    items = 0
+    try:
+        async for item in stream:
+            if items == 0:
+                args["ttft_ms"] = (profiler.now_us() - start) / 1000
+            items += 1
+            yield item
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose:
+            await aclose()
+        profiler.record(name, category, start, items=items, **args)
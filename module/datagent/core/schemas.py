@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 from .context import WorkflowContext
 from ..agents.schemas import StreamingEvent, AgentOutput
 
@@ -26,4 +27,25 @@ class NodeStartEvent(StreamingEvent):
 class NodeEndEvent(StreamingEvent):
     type: str = "node_end"
     node_id: str
-    output: AgentOutput
\ No newline at end of file
+    output: AgentOutput
+
+@dataclass(frozen=True, kw_only=True)
+class NodeTimeoutEvent(StreamingEvent):
+    type: str = "node_timeout"
+    node_id: str
+    timeout: float
+    # "timeout" when the node's own timeout expired, "deadline" for the workflow deadline
+    reason: str = "timeout"
+
+@dataclass(frozen=True, kw_only=True)
+class WorkflowCancelledEvent(StreamingEvent):
+    type: str = "workflow_cancelled"
+    # "timeout", "deadline" or the reason passed to WorkflowExecutor.cancel
+    reason: str
+
+@dataclass(frozen=True, kw_only=True)
+class MapOutput(AgentOutput):
+    # One output per element, in list order (None where an element failed)
+    results: list[Optional[AgentOutput]] = field(default_factory=list)
+    # Error message per element, None where it succeeded (only with continue_on_error)
+    errors: list[Optional[str]] = field(default_factory=list)
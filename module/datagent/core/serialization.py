@@ -1,86 +1,178 @@
 import dataclasses
+import threading
+import typing
 from datetime import datetime
-from typing import Any, Dict, Type, Set
+from typing import Any, Callable, Dict, Optional, Set, Type
 import logging
 
-from ..agents.schemas import BaseMessage
+from ..agents.schemas import BaseMessage, BasePrompt, FileData
+from .context import History, ChainedState
 
 logger = logging.getLogger(__name__)
 
+_PRIMITIVES = frozenset((str, int, float, bool, type(None)))
+
+# Type name -> class, built on first use (see get_registry)
+_registry: Optional[Dict[str, Type]] = None
+# Types that are not BaseMessage subclasses but can be reconstructed too
+_extra_types: Dict[str, Type] = {}
+# Unknown type names the registry was already rebuilt for
+_missing: Set[str] = set()
+_registry_lock = threading.Lock()
+
+# Per-class codecs, generated on first use
+_encoders: Dict[Type, Callable[[Any], Any]] = {}
+_decoders: Dict[Type, Callable[[Dict[str, Any]], Any]] = {}
+
 def get_all_subclasses(cls) -> Set[Type]:
     return set(cls.__subclasses__()).union(
         [s for c in cls.__subclasses__() for s in get_all_subclasses(c)])
 
 def _build_registry() -> Dict[str, Type]:
-    registry = {}
+    registry = dict(_extra_types)
     # Add all BaseMessage subclasses
     # We assume all relevant message types inherit from BaseMessage
     for cls in get_all_subclasses(BaseMessage):
         registry[cls.__name__] = cls
     return registry
 
+def get_registry() -> Dict[str, Type]:
+    global _registry
+    registry = _registry
+    if registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = _build_registry()
+            registry = _registry
+    return registry
+
+def invalidate_registry():
+    """Forgets the type registry and decoders, e.g. after message classes were redefined."""
+    global _registry
+    with _registry_lock:
+        _registry = None
+        _missing.clear()
+        _decoders.clear()
+
+def register_type(cls: Type) -> Type:
+    """Makes a dataclass outside the BaseMessage hierarchy deserializable. Usable as a decorator."""
+    _extra_types[cls.__name__] = cls
+    invalidate_registry()
+    return cls
+
+def _lookup(type_name: str) -> Optional[Type]:
+    cls = get_registry().get(type_name)
+    if cls is None and type_name not in _missing:
+        # Possibly defined after the registry was built, rebuild once per unknown name
+        invalidate_registry()
+        _missing.add(type_name)
+        cls = get_registry().get(type_name)
+    return cls
+
 def serialize(obj: Any) -> Any:
     """
     Recursively serialize objects to JSON-compatible types.
-    Handles dataclasses and datetime objects.
+    Handles dataclasses (nested ones included, tagged with `_type`) and datetime objects.
     """
-    if dataclasses.is_dataclass(obj):
-        # Convert dataclass to dict
-        d = {k: serialize(v) for k, v in dataclasses.asdict(obj).items()}
+    if type(obj) in _PRIMITIVES:
+        return obj
+    encoder = _encoders.get(type(obj))
+    if encoder is None:
+        encoder = _encoder_for(type(obj))
+    return encoder(obj)
+
+def _encoder_for(cls: Type) -> Callable[[Any], Any]:
+    if dataclasses.is_dataclass(cls):
+        encoder = _compile_encoder(cls)
+    elif issubclass(cls, datetime):
+        encoder = datetime.isoformat
+    elif issubclass(cls, (list, tuple, History)):
+        encoder = _encode_list
+    elif issubclass(cls, (dict, ChainedState)):
+        encoder = _encode_dict
+    else:
+        encoder = _identity
+    _encoders[cls] = encoder
+    return encoder
+
+def _compile_encoder(cls: Type) -> Callable[[Any], Dict[str, Any]]:
+    names = tuple(f.name for f in dataclasses.fields(cls))
+    type_name = cls.__name__
+
+    def encode(obj: Any) -> Dict[str, Any]:
+        # Single pass over the fields, no intermediate asdict() copy
+        d = {name: serialize(getattr(obj, name)) for name in names}
         # Inject type information for reconstruction
-        d["_type"] = obj.__class__.__name__
+        d["_type"] = type_name
         return d
-    
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-        
-    if isinstance(obj, list):
-        return [serialize(x) for x in obj]
-        
-    if isinstance(obj, dict):
-        return {k: serialize(v) for k, v in obj.items()}
-        
+
+    return encode
+
+def _encode_list(obj: Any) -> list:
+    return [serialize(x) for x in obj]
+
+def _encode_dict(obj: Any) -> dict:
+    return {k: serialize(v) for k, v in obj.items()}
+
+def _identity(obj: Any) -> Any:
     return obj
 
 def deserialize(obj: Any) -> Any:
     """
     Recursively deserialize JSON-compatible types back to objects.
-    Reconstructs dataclasses using the _type field.
+    Reconstructs dataclasses using the _type field. The input is not modified.
     """
     if isinstance(obj, list):
         return [deserialize(x) for x in obj]
-        
+
     if isinstance(obj, dict):
         # Check if it's a serialized object
-        if "_type" in obj:
-            type_name = obj.pop("_type")
-            registry = _build_registry()
-            cls = registry.get(type_name)
-            
+        type_name = obj.get("_type")
+        if type_name is not None:
+            cls = _lookup(type_name)
             if cls:
-                # Recursively deserialize fields
-                kwargs = {k: deserialize(v) for k, v in obj.items()}
-                
-                # Special handling for timestamp (common in BaseMessage)
-                if "timestamp" in kwargs and isinstance(kwargs["timestamp"], str):
-                    try:
-                        kwargs["timestamp"] = datetime.fromisoformat(kwargs["timestamp"])
-                    except ValueError:
-                        pass
-                        
-                try:
-                    return cls(**kwargs)
-                except Exception as e:
-                    logger.warning(f"Failed to instantiate {type_name}: {e}")
-                    # Fallback to dict
-                    kwargs["_type"] = type_name
-                    return kwargs
-            else:
-                # Class not found in registry
-                logger.warning(f"Class {type_name} not found in registry. Returning dict.")
-                obj["_type"] = type_name # restore type
-                return {k: deserialize(v) for k, v in obj.items()}
-                
+                decoder = _decoders.get(cls)
+                if decoder is None:
+                    decoder = _decoders[cls] = _compile_decoder(cls)
+                return decoder(obj)
+            # Class not found in registry
+            logger.warning(f"Class {type_name} not found in registry. Returning dict.")
+
         return {k: deserialize(v) for k, v in obj.items()}
-        
+
     return obj
+
+def _compile_decoder(cls: Type) -> Callable[[Dict[str, Any]], Any]:
+    datetime_fields = frozenset(f.name for f in dataclasses.fields(cls) if _is_datetime_field(f))
+    type_name = cls.__name__
+
+    def decode(obj: Dict[str, Any]) -> Any:
+        # Recursively deserialize fields
+        kwargs = {k: deserialize(v) for k, v in obj.items() if k != "_type"}
+        for name in datetime_fields:
+            value = kwargs.get(name)
+            if isinstance(value, str):
+                try:
+                    kwargs[name] = datetime.fromisoformat(value)
+                except ValueError:
+                    pass
+        try:
+            return cls(**kwargs)
+        except Exception as e:
+            logger.warning(f"Failed to instantiate {type_name}: {e}")
+            # Fallback to dict
+            kwargs["_type"] = type_name
+            return kwargs
+
+    return decode
+
+def _is_datetime_field(f: dataclasses.Field) -> bool:
+    annotation = f.type
+    if isinstance(annotation, str):
+        # Postponed annotations (`from __future__ import annotations`)
+        return annotation in ("datetime", "Optional[datetime]", "datetime | None", "typing.Optional[datetime]")
+    return annotation is datetime or datetime in typing.get_args(annotation)
+
+# Nested in AgentInput and checkpoints
+register_type(BasePrompt)
+register_type(FileData)
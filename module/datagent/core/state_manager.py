@@ -1,5 +1,16 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from .serialization import serialize, deserialize
+
+logger = logging.getLogger(__name__)
 
 class StateManager(ABC):
     @abstractmethod
@@ -19,3 +30,232 @@ class InMemoryStateManager(StateManager):
 
     async def set_state(self, key: str, value: Dict[str, Any]):
         self._state[key] = value
+
+class LRUStateManager(StateManager):
+    """
+    In-memory state bounded by entry count and (estimated) size, evicting the
+    least recently used keys first. Keys expire after their TTL, the manager's
+    `default_ttl` unless `set_state` is given one. Sizes are estimated from the
+    JSON encoding of a value when it is set.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: Optional[int] = None, default_ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        # key -> (value, size in bytes, monotonic expiry or None)
+        self._state: "OrderedDict[str, Tuple[Dict[str, Any], int, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+
+        # Counters for observability
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get_state(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._state.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._state.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    async def set_state(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        size = _estimate_size(value)
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._remove(key)
+            self._state[key] = (value, size, expires_at)
+            self.size_bytes += size
+            self._evict()
+
+    async def delete_state(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._state),
+            "size_bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+    def _remove(self, key: str):
+        entry = self._state.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[1]
+
+    def _evict(self):
+        # Never evicts the entry that was just set, even if it alone exceeds max_bytes
+        while len(self._state) > 1 and (
+            len(self._state) > self.max_entries
+            or (self.max_bytes is not None and self.size_bytes > self.max_bytes)
+        ):
+            key, (_, size, _) = self._state.popitem(last=False)
+            self.size_bytes -= size
+            self.evictions += 1
+
+class SQLiteStateManager(StateManager):
+    """
+    State persisted in a SQLite database in WAL mode, so it survives restarts.
+
+    Writes are buffered and committed in batches by a background writer thread,
+    at the latest `flush_interval` seconds after they were made or as soon as
+    `batch_size` keys are pending; reads see pending writes immediately. Use
+    `flush()` to wait for everything to be committed and `close()` on shutdown.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.05, batch_size: int = 256, default_ttl: Optional[float] = None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.default_ttl = default_ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._db_lock = threading.Lock()
+
+        # key -> (encoded value or None for a delete, wall clock expiry or None)
+        self._pending: Dict[str, Tuple[Optional[str], Optional[float]]] = {}
+        self._pending_lock = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-state-writer", daemon=True)
+        self._writer.start()
+
+        # Counters for observability
+        self.batches = 0
+        self.writes = 0
+
+    async def get_state(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._pending_lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            encoded, expires_at = pending
+        else:
+            row = await asyncio.to_thread(self._read, key)
+            if row is None:
+                return None
+            encoded, expires_at = row
+        if encoded is None or (expires_at is not None and expires_at <= time.time()):
+            return None
+        return deserialize(json.loads(encoded))
+
+    async def set_state(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        encoded = json.dumps(serialize(value), default=str)
+        self._enqueue(key, encoded, time.time() + ttl if ttl else None)
+
+    async def delete_state(self, key: str):
+        self._enqueue(key, None, None)
+
+    async def flush(self):
+        await asyncio.to_thread(self._flush_now)
+
+    async def close(self):
+        await self.flush()
+        with self._pending_lock:
+            self._closed = True
+            self._pending_lock.notify()
+        await asyncio.to_thread(self._writer.join)
+        with self._db_lock:
+            self._conn.close()
+
+    def _enqueue(self, key: str, encoded: Optional[str], expires_at: Optional[float]):
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError("State manager is closed")
+            self._pending[key] = (encoded, expires_at)
+            # Wakes the writer for a new batch, and again when the batch is full
+            if len(self._pending) in (1, self.batch_size):
+                self._pending_lock.notify()
+
+    def _read(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        with self._db_lock:
+            return self._conn.execute("SELECT value, expires_at FROM state WHERE key = ?", (key,)).fetchone()
+
+    def _write_loop(self):
+        while True:
+            with self._pending_lock:
+                if not self._pending and not self._closed:
+                    self._pending_lock.wait()
+                if self._closed and not self._pending:
+                    return
+                if len(self._pending) < self.batch_size and not self._closed:
+                    # Give the batch a chance to fill up
+                    self._pending_lock.wait(self.flush_interval)
+            self._flush_now()
+
+    def _flush_now(self):
+        with self._db_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            upserts: List[Tuple[str, str, Optional[float]]] = []
+            deletes: List[Tuple[str]] = []
+            for key, (encoded, expires_at) in batch.items():
+                if encoded is None:
+                    deletes.append((key,))
+                else:
+                    upserts.append((key, encoded, expires_at))
+            try:
+                self._conn.execute("BEGIN")
+                if upserts:
+                    self._conn.executemany("INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)", upserts)
+                if deletes:
+                    self._conn.executemany("DELETE FROM state WHERE key = ?", deletes)
+                self._conn.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._conn.execute("ROLLBACK")
+                logger.error(f"Failed to write {len(batch)} state keys to {self.path}: {e}")
+                # Keep them pending (unless overwritten meanwhile) for the next batch
+                with self._pending_lock:
+                    for key, item in batch.items():
+                        self._pending.setdefault(key, item)
+                return
+            self.batches += 1
+            self.writes += len(batch)
+
+def create_state_manager(
+    backend: str,
+    max_entries: int = 10000,
+    max_bytes: Optional[int] = None,
+    ttl: Optional[float] = None,
+    path: Optional[str] = None
+) -> StateManager:
+    """Builds the StateManager for a `STATE_BACKEND` setting: memory, lru or sqlite."""
+    if backend == "memory":
+        return InMemoryStateManager()
+    if backend == "lru":
+        return LRUStateManager(max_entries=max_entries, max_bytes=max_bytes, default_ttl=ttl)
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("The sqlite state backend needs a path")
+        return SQLiteStateManager(path, default_ttl=ttl)
+    raise ValueError(f"Unknown state backend {backend}, expected memory, lru or sqlite")
+
+def _estimate_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(repr(value))
@@ -1,27 +1,333 @@
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import contextvars
+import logging
+import threading
+import time
 from .context import WorkflowContext
+from .checkpoint import WorkflowCheckpoint
+from .profiler import span
 from ..db.repositories.session import SessionRepository
-from ..db.fs import FileSystemDB
+from ..db.repositories.journal import JournaledSessionRepository
+from ..db.repositories.sql import SQLSessionRepository
+from ..db.fs import db, FileSystemDB
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+_CONTEXT = "context"
+_CHECKPOINT = "checkpoint"
+# Pending checkpoint value that deletes it
+_CLEAR = object()
+# Seconds the writer waits before retrying failed writes
+_RETRY_DELAY = 1.0
+# Failed attempts after which a pending write is dropped
+_MAX_ATTEMPTS = 5
+# Estimated bytes of a history entry or state value besides its text
+_ENTRY_OVERHEAD = 256
 
 class SessionStorage:
     """
     Adapter class for Session persistence.
     Delegates to the SessionRepository in the db module.
+
+    The `a_*` methods are write-behind: saves only enqueue the latest context or
+    checkpoint of a session, a background writer thread persists them (a newer
+    write of the same session replaces one still pending). Loads see pending
+    writes and run the repository off the event loop. The synchronous methods
+    write immediately, ordered after the writes of a session already pending.
+    Call `flush()` (or `aflush()`) to wait for pending writes and `close()` on
+    shutdown. A failed write does not hold up the others: it is queued again
+    behind them and dropped (with an error logged) after `max_attempts` failures.
+
+    Contexts are cached in an LRU bounded by their estimated size
+    (`cache_max_bytes`, 0 disables it), so loading a hot session touches
+    neither the disk nor the decoder. The cache is never revalidated against the
+    store, so it assumes this process is the only writer of its sessions: with
+    several server processes sharing a store (uvicorn `--workers`, replicas on
+    the same database or volume) a process would serve its own stale copy of a
+    session another one has saved since. Disable it there with
+    `SESSION_CACHE_MAX_BYTES=0`. The writer waits `flush_interval` seconds
+    after a save before writing, so the saves of one run coalesce into one write.
     """
-    def __init__(self, storage_dir: str = None):
+    def __init__(
+        self,
+        storage_dir: str = None,
+        cache_max_bytes: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_attempts: int = _MAX_ATTEMPTS
+    ):
         # If storage_dir is provided, we use it for the FileSystemDB
         # Otherwise, FileSystemDB defaults to module/datagent/db/storage
         db_instance = FileSystemDB(root_dir=storage_dir) if storage_dir else None
         
         # If no custom dir, use the default singleton db from the module 
         # (or create new one if needed, but SessionRepository defaults to singleton db)
-        if db_instance:
-            self.repo = SessionRepository(database=db_instance)
+        if settings.SESSION_STORE == "journal":
+            self.repo = JournaledSessionRepository(
+                database=db_instance or db,
+                compact_every=settings.SESSION_JOURNAL_COMPACT_EVERY,
+                max_sessions=settings.SESSION_TRACKED_MAX
+            )
+        elif settings.SESSION_STORE == "document":
+            self.repo = SessionRepository(database=db_instance or db)
+        elif settings.SESSION_STORE == "sql":
+            # In the database of settings.DATABASE_URL, storage_dir does not apply
+            self.repo = SQLSessionRepository(max_sessions=settings.SESSION_TRACKED_MAX)
         else:
-            self.repo = SessionRepository()
+            raise ValueError(f"Unknown session store {settings.SESSION_STORE}, expected document, journal or sql")
+
+        # (kind, session id) -> (context, checkpoint or _CLEAR, contextvars of the caller)
+        self._pending: Dict[Tuple[str, str], Tuple[Any, contextvars.Context]] = {}
+        # The batch being written, still visible to loads until it is on disk
+        self._in_flight: Dict[Tuple[str, str], Tuple[Any, contextvars.Context]] = {}
+        self._pending_lock = threading.Condition()
+        # Held while writing, so writes of a session cannot overtake each other
+        self._io_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self.flush_interval = settings.SESSION_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        # (kind, session id) -> failed attempts of the pending write
+        self._attempts: Dict[Tuple[str, str], int] = {}
+
+        # session id -> (context, estimated history bytes, estimated state bytes)
+        self._cache: "OrderedDict[str, Tuple[WorkflowContext, int, int]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_max_bytes = settings.SESSION_CACHE_MAX_BYTES if cache_max_bytes is None else cache_max_bytes
+        self.cache_bytes = 0
+
+        # Counters for observability
+        self.enqueued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
 
     def save_context(self, context: WorkflowContext):
-        self.repo.save(context)
+        self._cache_put(context)
+        self._write_now((_CONTEXT, context.session_id), context)
 
     def load_context(self, session_id: str) -> WorkflowContext:
-        return self.repo.load(session_id)
+        cached = self._cached(session_id)
+        if cached is not None:
+            return cached
+        with span("load_context", "storage"):
+            context = self.repo.load(session_id)
+        self._cache_put(context)
+        return context
+
+    def save_checkpoint(self, checkpoint: WorkflowCheckpoint):
+        self._write_now((_CHECKPOINT, checkpoint.session_id), checkpoint)
+
+    def load_checkpoint(self, session_id: str) -> Optional[WorkflowCheckpoint]:
+        pending = self._pending_item((_CHECKPOINT, session_id))
+        if pending is not None:
+            return None if pending is _CLEAR else pending
+        return self.repo.load_checkpoint(session_id)
+
+    def clear_checkpoint(self, session_id: str):
+        self._write_now((_CHECKPOINT, session_id), _CLEAR)
+
+    async def a_save_context(self, context: WorkflowContext):
+        self._cache_put(context)
+        self._enqueue((_CONTEXT, context.session_id), context)
+
+    async def a_load_context(self, session_id: str) -> WorkflowContext:
+        cached = self._cached(session_id)
+        if cached is not None:
+            return cached
+        return await asyncio.to_thread(self.load_context, session_id)
+
+    async def a_save_checkpoint(self, checkpoint: WorkflowCheckpoint):
+        self._enqueue((_CHECKPOINT, checkpoint.session_id), checkpoint)
+
+    async def a_load_checkpoint(self, session_id: str) -> Optional[WorkflowCheckpoint]:
+        pending = self._pending_item((_CHECKPOINT, session_id))
+        if pending is not None:
+            return None if pending is _CLEAR else pending
+        return await asyncio.to_thread(self.repo.load_checkpoint, session_id)
+
+    async def a_clear_checkpoint(self, session_id: str):
+        self._enqueue((_CHECKPOINT, session_id), _CLEAR)
+
+    def flush(self):
+        """
+        Writes everything pending. Every write is attempted; the failed ones are
+        queued again (unless written again meanwhile) and the first error is raised.
+        """
+        with self._io_lock:
+            with self._pending_lock:
+                batch = self._in_flight = self._pending
+                self._pending = {}
+            error = None
+            try:
+                for key, (item, ctx) in batch.items():
+                    try:
+                        # Under the caller's contextvars, so the write shows up in its profile
+                        ctx.run(self._write, key, item)
+                    except Exception as e:
+                        self.failed += 1
+                        error = error or e
+                        self._retry_later(key, (item, ctx), e)
+                        continue
+                    self.written += 1
+                    self._attempts.pop(key, None)
+            finally:
+                with self._pending_lock:
+                    self._in_flight = {}
+            if error is not None:
+                raise error
+
+    def _retry_later(self, key: Tuple[str, str], pending: Tuple[Any, contextvars.Context], error: Exception):
+        with self._pending_lock:
+            attempts = self._attempts.get(key, 0) + 1
+            if key in self._pending:
+                # Superseded by a newer write, which gets attempts of its own
+                self._attempts.pop(key, None)
+                return
+            if attempts >= self.max_attempts:
+                self._attempts.pop(key, None)
+                self.dropped += 1
+                logger.error(f"Dropping the {key[0]} of session {key[1]} after {attempts} failed writes: {error}")
+                return
+            self._attempts[key] = attempts
+            # Behind everything pending, so it cannot hold up other sessions
+            self._pending[key] = pending
+
+    async def aflush(self):
+        await asyncio.to_thread(self.flush)
+
+    def close(self):
+        """Stops the writer, then writes what is left (raising if that fails)."""
+        with self._pending_lock:
+            self._closed = True
+            writer = self._writer
+            self._pending_lock.notify()
+        if writer is not None:
+            writer.join()
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "cached": len(self._cache),
+            "cache_bytes": self.cache_bytes,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_evictions": self.cache_evictions
+        }
+
+    def _cached(self, session_id: str) -> Optional[WorkflowContext]:
+        """The latest context of a session without reading the repository, None on a miss."""
+        context = self._pending_item((_CONTEXT, session_id))
+        with self._cache_lock:
+            if context is None:
+                entry = self._cache.get(session_id)
+                if entry is not None:
+                    self._cache.move_to_end(session_id)
+                    context = entry[0]
+            if context is None:
+                self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+        return context
+
+    def _cache_put(self, context: WorkflowContext):
+        if not self.cache_max_bytes:
+            return
+        with self._cache_lock:
+            entry = self._cache.pop(context.session_id, None)
+            history = context.history
+            start = 0
+            history_bytes = 0
+            if entry is not None:
+                self.cache_bytes -= entry[1] + entry[2]
+                # Histories only grow during a session, size just the new entries
+                length = len(entry[0].history)
+                if len(history) >= length and (length == 0 or history[length - 1] is entry[0].history[length - 1]):
+                    start, history_bytes = length, entry[1]
+            history_bytes += sum(_estimate_size(item) for item in history[start:])
+            state_bytes = sum(len(key) + _estimate_size(value) for key, value in context.state.items())
+
+            self._cache[context.session_id] = (context, history_bytes, state_bytes)
+            self.cache_bytes += history_bytes + state_bytes
+            # Never evicts the session just stored, even if it alone exceeds the limit
+            while len(self._cache) > 1 and self.cache_bytes > self.cache_max_bytes:
+                _, (_, evicted_history, evicted_state) = self._cache.popitem(last=False)
+                self.cache_bytes -= evicted_history + evicted_state
+                self.cache_evictions += 1
+
+    def _pending_item(self, key: Tuple[str, str]) -> Any:
+        with self._pending_lock:
+            pending = self._pending.get(key) or self._in_flight.get(key)
+        return pending[0] if pending is not None else None
+
+    def _enqueue(self, key: Tuple[str, str], item: Any):
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError("Session storage is closed")
+            if key in self._pending:
+                self.coalesced += 1
+            # A new write starts over, also when it replaces one being retried
+            self._attempts.pop(key, None)
+            self._pending[key] = (item, contextvars.copy_context())
+            self.enqueued += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+                self._writer.start()
+            self._pending_lock.notify()
+
+    def _write_now(self, key: Tuple[str, str], item: Any):
+        with self._io_lock:
+            # Superseded by this write
+            with self._pending_lock:
+                self._pending.pop(key, None)
+                self._attempts.pop(key, None)
+            self._write(key, item)
+
+    def _write(self, key: Tuple[str, str], item: Any):
+        kind, session_id = key
+        if kind == _CONTEXT:
+            with span("save_context", "storage", history=len(item.history)):
+                self.repo.save(item)
+        elif item is _CLEAR:
+            self.repo.delete_checkpoint(session_id)
+        else:
+            with span("save_checkpoint", "storage", completed=len(item.completed)):
+                self.repo.save_checkpoint(item)
+
+    def _write_loop(self):
+        while True:
+            with self._pending_lock:
+                while not self._pending and not self._closed:
+                    self._pending_lock.wait()
+                if self._closed:
+                    # close() writes the rest itself
+                    return
+                # Let the further saves of a run replace the pending ones
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and (remaining := deadline - time.monotonic()) > 0:
+                    self._pending_lock.wait(remaining)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write sessions, retrying in {_RETRY_DELAY}s: {e}")
+                time.sleep(_RETRY_DELAY)
+
+def _estimate_size(value: Any) -> int:
+    content = getattr(value, "content", value)
+    return _ENTRY_OVERHEAD + (len(content) if isinstance(content, str) else 0)
@@ -0,0 +1,188 @@
+import asyncio
+import dataclasses
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, List, Optional
+from ..agents.schemas import TextChunkEvent
+
+# Key in an event's `data` with the list position of the map node element that emitted it
+ITEM_INDEX = "item_index"
+
+@dataclass(frozen=True)
+class StreamConfig:
+    """
+    Flow control between the agents producing events and the consumer of a run.
+
+    high_water: buffered events at which producers are paused.
+    low_water: buffered events at which paused producers resume (default: high_water // 2).
+    text_policy: what to do with a text chunk while the buffer is full.
+        "coalesce" appends it to the last buffered chunk of the same agent so the
+        upstream LLM stream keeps draining at full speed; "block" waits for room.
+    """
+    high_water: int = 256
+    low_water: Optional[int] = None
+    text_policy: str = "coalesce"
+
+    def __post_init__(self):
+        if self.high_water < 1:
+            raise ValueError("high_water must be at least 1")
+        if self.text_policy not in ("coalesce", "block"):
+            raise ValueError(f"Unknown text_policy '{self.text_policy}', expected 'coalesce' or 'block'")
+        if self.low_water is not None and not 0 <= self.low_water < self.high_water:
+            raise ValueError("low_water must be between 0 and high_water")
+
+class EventBuffer:
+    """
+    Bounded FIFO of workflow events for a single run (one consumer, many producers).
+
+    Producers `await put()` and are suspended once `high_water` events are buffered
+    until the consumer drained it down to `low_water`, which keeps memory bounded
+    when the consumer (e.g. a slow SSE client) falls behind. Control items are
+    never subject to the limit.
+    """
+
+    def __init__(self, config: Optional[StreamConfig] = None):
+        self.config = config or StreamConfig()
+        self._high_water = self.config.high_water
+        self._low_water = self.config.low_water if self.config.low_water is not None else self._high_water // 2
+        self._coalesce_text = self.config.text_policy == "coalesce"
+        self._items: Deque[Any] = deque()
+        self._not_empty = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+        # Counters for observability
+        self.coalesced = 0
+        self.blocked = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def put(self, event: Any):
+        while len(self._items) >= self._high_water:
+            if self._coalesce_text and self._try_coalesce(event):
+                return
+            self.blocked += 1
+            self._drained.clear()
+            await self._drained.wait()
+        self._items.append(event)
+        self._not_empty.set()
+
+    def put_control(self, item: Any):
+        """Enqueues an internal item (completion marker, error) without waiting."""
+        self._items.append(item)
+        self._not_empty.set()
+
+    async def get(self) -> Any:
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        item = self._items.popleft()
+        if len(self._items) <= self._low_water:
+            self._drained.set()
+        return item
+
+    def _try_coalesce(self, event: Any) -> bool:
+        if not isinstance(event, TextChunkEvent) or not self._items:
+            return False
+        last = self._items[-1]
+        if not isinstance(last, TextChunkEvent) or not same_stream(last, event):
+            return False
+        self._items[-1] = dataclasses.replace(last, content=(last.content or "") + (event.content or ""))
+        self.coalesced += 1
+        return True
+
+class ChunkCoalescer:
+    """
+    Merges consecutive TextChunkEvents of the same agent into one event before they
+    reach a transport (SSE, CLI). A batch is flushed when `window_ms` elapsed since
+    its first chunk, when it reaches `max_bytes`, or when any other event arrives,
+    so ordering is preserved and added latency is bounded by the window.
+    A window of 0 disables coalescing.
+    """
+
+    def __init__(self, window_ms: float = 30, max_bytes: int = 4096):
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+
+        # Counters for observability
+        self.chunks_in = 0
+        self.chunks_out = 0
+
+    async def coalesce(self, events: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        if self.window <= 0:
+            async for event in events:
+                yield event
+            return
+
+        loop = asyncio.get_running_loop()
+        iterator = events.__aiter__()
+        batch: List[TextChunkEvent] = []
+        batch_bytes = 0
+        deadline = 0.0
+        pending: Optional[asyncio.Task] = None
+
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+
+                if batch:
+                    # Never cancel the pending __anext__ (it would close the source), just stop waiting
+                    done, _ = await asyncio.wait({pending}, timeout=max(deadline - loop.time(), 0))
+                    if not done:
+                        yield self._flush(batch)
+                        batch, batch_bytes = [], 0
+                        continue
+
+                try:
+                    event = await pending
+                except StopAsyncIteration:
+                    break
+                finally:
+                    if pending.done():
+                        pending = None
+
+                if isinstance(event, TextChunkEvent):
+                    self.chunks_in += 1
+                    if batch and not same_stream(batch[0], event):
+                        yield self._flush(batch)
+                        batch, batch_bytes = [], 0
+                    if not batch:
+                        deadline = loop.time() + self.window
+                    batch.append(event)
+                    batch_bytes += len((event.content or "").encode("utf-8"))
+                    if batch_bytes >= self.max_bytes:
+                        yield self._flush(batch)
+                        batch, batch_bytes = [], 0
+                    continue
+
+                if batch:
+                    yield self._flush(batch)
+                    batch, batch_bytes = [], 0
+                yield event
+
+            if batch:
+                yield self._flush(batch)
+        finally:
+            # Consumer went away: tear the source down now rather than at garbage collection
+            if pending is not None:
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+
+    def _flush(self, batch: List[TextChunkEvent]) -> TextChunkEvent:
+        self.chunks_out += 1
+        if len(batch) == 1:
+            return batch[0]
+        return dataclasses.replace(batch[0], content="".join(event.content or "" for event in batch))
+
+def same_stream(first: TextChunkEvent, event: TextChunkEvent) -> bool:
+    """Whether two text chunks continue the same text: same agent and, within a map node, same element."""
+    return (
+        first.agent_name == event.agent_name
+        and first.role == event.role
+        and first.session_id == event.session_id
+        and first.data.get(ITEM_INDEX) == event.data.get(ITEM_INDEX)
+    )
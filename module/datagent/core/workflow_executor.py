@@ -1,202 +1,935 @@
-from typing import Dict, Any, AsyncIterator
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from dataclasses import dataclass, field, replace
+from typing import Dict, Any, AsyncIterator, Deque, List, Optional, Sequence, Set, Tuple
 from .context import WorkflowContext
 from .yaml_workflow_loader import WorkflowDefinition
-from .schemas import WorkflowEndEvent, NodeStartEvent, RouterDecisionEvent, NodeEndEvent
+from .execution_plan import SPECULATE_LEARNED, ExecutionPlan, PlanCompiler, PlanNode
+from .checkpoint import WorkflowCheckpoint
+from .event_bus import EventBus
+from .middleware import MiddlewarePipeline
+from .node_cache import NodeResultCache, replay_events
+from .profiler import Profiler, current_profiler, span
+from .storage import SessionStorage
+from .streaming import ITEM_INDEX, EventBuffer, StreamConfig
+from .schemas import WorkflowEndEvent, NodeStartEvent, RouterDecisionEvent, NodeEndEvent, NodeTimeoutEvent, WorkflowCancelledEvent, MapOutput
 from ..agents.registry import AgentRegistry
-from ..agents.schemas import AgentOutput, StreamingEvent, ContextUpdateEvent, AgentOutputEvent, AssistantMessage, BasePrompt, UserMessage
+from ..agents.schemas import AgentOutput, StreamingEvent, ContextUpdateEvent, AgentOutputEvent, AssistantMessage, BasePrompt, UserMessage, ToolStartEvent, ToolEndEvent
+
+logger = logging.getLogger(__name__)
+
+# Sentinel put on the run queue by every branch task when it finishes
+_BRANCH_DONE = object()
+
+# The run-level deadline backstop fires this much later than the deadline itself,
+# so a node hitting the deadline gets to report its NodeTimeoutEvent first
+_DEADLINE_GRACE = 0.1
+
+# Learned speculation: recent decisions kept per router, how many are needed
+# before predicting and how dominant a route has to be among them
+_SPECULATION_WINDOW = 50
+_SPECULATION_MIN_SAMPLES = 5
+_SPECULATION_MIN_SHARE = 0.6
+
+@dataclass
+class _BranchError:
+    error: BaseException
+
+@dataclass
+class _Abort:
+    reason: str
+
+@dataclass(frozen=True)
+class BatchResult:
+    """Outcome of one item of `WorkflowExecutor.run_batch`."""
+    index: int
+    session_id: str
+    latency: float  # seconds
+    context: Optional[WorkflowContext] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+class WorkflowCancelledError(Exception):
+    """Raised by `run`/`resume` when the run timed out or was cancelled."""
+
+class _NodeTimeout(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class _SpeculativeSink:
+    """
+    Stands in for the run queue while a speculative node runs: its events are held
+    back until the router confirms the guess, then replayed and forwarded live.
+    """
+
+    def __init__(self, queue: EventBuffer):
+        self._queue = queue
+        self._held: Deque[Any] = deque()
+        self._released = False
+
+    async def put(self, event: Any):
+        if self._released:
+            await self._queue.put(event)
+        else:
+            self._held.append(event)
+
+    def put_control(self, item: Any):
+        if self._released:
+            self._queue.put_control(item)
+        else:
+            self._held.append(item)
+
+    async def release(self):
+        # Events held back while we wait on the queue are picked up by the same loop
+        while self._held:
+            item = self._held.popleft()
+            if isinstance(item, NodeTimeoutEvent):
+                self._queue.put_control(item)
+            else:
+                await self._queue.put(item)
+        self._released = True
+
+class _MapItemSink:
+    """
+    Stands in for the queue while a map node element runs: tags the element's events
+    with its list position, so chunks of concurrent elements are never merged.
+    """
+
+    def __init__(self, queue, index: int):
+        self._queue = queue
+        self._index = index
+
+    async def put(self, event: Any):
+        await self._queue.put(self._tag(event))
+
+    def put_control(self, item: Any):
+        self._queue.put_control(self._tag(item))
+
+    def _tag(self, item: Any) -> Any:
+        if isinstance(item, StreamingEvent):
+            return replace(item, data={**item.data, ITEM_INDEX: self._index})
+        return item
+
+@dataclass
+class _Speculation:
+    target: str
+    # Context the speculative node started from
+    base: WorkflowContext
+    sink: _SpeculativeSink
+    task: asyncio.Task
+
+@dataclass(eq=False)
+class _RunState:
+    """
+    Per-run bookkeeping shared by all concurrently executing branches.
+    Kept off the executor so a single executor can serve concurrent runs.
+    """
+    prompt: BasePrompt
+    queue: EventBuffer
+    # The loop the run executes on, cancel_run may be called from another one
+    loop: asyncio.AbstractEventLoop
+    tasks: Set[asyncio.Task] = field(default_factory=set)
+    pending: int = 0
+    # join node id -> [(context, fork bases)] of branches that already arrived
+    arrivals: Dict[str, List[Tuple[WorkflowContext, tuple]]] = field(default_factory=dict)
+    # contexts of branches that reached the end of the graph
+    final_contexts: List[WorkflowContext] = field(default_factory=list)
+    # agent nodes finished in this run (or a resumed one), in completion order
+    completed: List[str] = field(default_factory=list)
+    # agent node visits a resumed run replays from its checkpoint instead of
+    # executing, consumed as they are skipped so cycles run again afterwards
+    skip: Counter = field(default_factory=Counter)
+    # outputs of all completed nodes across branches, what gets checkpointed
+    checkpoint_context: Optional[WorkflowContext] = None
+    # loop time at which the whole run must be done, None for no deadline
+    deadline: Optional[float] = None
+    profiler: Optional[Profiler] = None
+
+# In-flight runs of all executors by session id, so a run can be cancelled without
+# the executor that started it (e.g. after the workflow was reloaded)
+_active_runs: Dict[str, Set[_RunState]] = {}
+_active_runs_lock = threading.Lock()
+
+def cancel_run(session_id: str, reason: str = "cancelled") -> bool:
+    """
+    Cooperatively cancels the in-flight runs of a session, whichever executor and
+    event loop they run on: running agents are torn down (closing their streams and
+    underlying requests) and each run's stream ends with a WorkflowCancelledEvent.
+    Returns False if the session has no run in flight.
+    """
+    with _active_runs_lock:
+        runs = list(_active_runs.get(session_id, ()))
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    for run in runs:
+        if run.loop is current:
+            run.queue.put_control(_Abort(reason))
+        else:
+            run.loop.call_soon_threadsafe(run.queue.put_control, _Abort(reason))
+    return bool(runs)
+
+def _register_run(session_id: str, run: _RunState):
+    with _active_runs_lock:
+        _active_runs.setdefault(session_id, set()).add(run)
+
+def _unregister_run(session_id: str, run: _RunState):
+    with _active_runs_lock:
+        runs = _active_runs.get(session_id)
+        if runs is not None:
+            runs.discard(run)
+            if not runs:
+                del _active_runs[session_id]
 
 class WorkflowExecutor:
-    def __init__(self, definition: WorkflowDefinition):
+    def __init__(
+        self,
+        definition: WorkflowDefinition,
+        plan: Optional[ExecutionPlan] = None,
+        checkpointer: Optional[SessionStorage] = None,
+        stream_config: Optional[StreamConfig] = None,
+        cache: Optional[NodeResultCache] = None,
+        middleware: Optional[MiddlewarePipeline] = None,
+        event_bus: Optional[EventBus] = None
+    ):
         self.definition = definition
+        # Compile once, every run executes off the immutable plan
+        self.plan = plan or PlanCompiler().compile(definition)
+        # When set, a checkpoint is saved after every completed agent node
+        self.checkpointer = checkpointer
+        # Flow control between agents and the consumer of run_stream
+        self.stream_config = stream_config or StreamConfig()
+        # Results of nodes with a `cache:` block, in memory unless a cache is passed in
+        if cache is None and any(node.cache for node in self.plan.nodes.values()):
+            cache = NodeResultCache()
+        self.cache = cache
+        # Every agent invocation goes through this chain, composed once here.
+        # Defaults to the workflow's `middleware:` list.
+        if middleware is None:
+            try:
+                middleware = MiddlewarePipeline.from_config(definition.middleware)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Workflow '{definition.name}': invalid middleware: {e}") from None
+        self.middleware = middleware
+        # Every streamed event is also published here by its type, for side consumers
+        # (use EventBus.subscribe_queued so they never slow the run down)
+        self.event_bus = event_bus
+        self._invoke = self.middleware.build(self._invoke_agent)
+        # Recent decisions of routers with learned speculation, shared across runs
+        self._route_history: Dict[str, Deque[str]] = {}
+
+        # Counters for observability
+        self.speculation_hits = 0
+        self.speculation_misses = 0
 
-    async def run(self, prompt: BasePrompt, initial_context: WorkflowContext) -> WorkflowContext:
+    async def run(
+        self,
+        prompt: BasePrompt,
+        initial_context: WorkflowContext,
+        timeout: Optional[float] = None,
+        profiler: Optional[Profiler] = None
+    ) -> WorkflowContext:
         """
         Runs the workflow non-interactively, gathering all results.
         """
-        # We need to capture the final context.
-        # Since run_stream creates a local variable, we can't easily get it back unless we yield it.
-        # But we can reconstruct the logic for `run` or just iterate over the stream and look for context updates.
-        
-        context = initial_context
-        async for event in self.run_stream(prompt, initial_context):
-            if event.type == "context_update" and isinstance(event.data, dict) and "context" in event.data:
-                context = event.data["context"]
+        events = self.run_stream(prompt, initial_context, timeout=timeout, profiler=profiler)
+        return await self._final_context(events, initial_context)
+
+    async def resume(self, session_id: str, timeout: Optional[float] = None, profiler: Optional[Profiler] = None) -> WorkflowContext:
+        """
+        Continues an interrupted run non-interactively, see `resume_stream`.
+        """
+        checkpoint = await self._load_checkpoint(session_id)
+        events = self._execute(checkpoint.prompt, checkpoint.context, checkpoint.completed, timeout, profiler)
+        return await self._final_context(events, checkpoint.context)
+
+    async def _final_context(self, events: AsyncIterator[StreamingEvent], context: WorkflowContext) -> WorkflowContext:
+        # The final workflow context is published as the last (system) ContextUpdateEvent.
+        # Agents may also emit ContextUpdateEvents carrying plain dict updates, skip those.
+        async for event in events:
+            if isinstance(event, ContextUpdateEvent) and isinstance(event.context, WorkflowContext):
+                context = event.context
+            elif isinstance(event, WorkflowCancelledEvent):
+                raise WorkflowCancelledError(event.content)
         return context
 
-    async def run_stream(self, prompt: BasePrompt, initial_context: WorkflowContext) -> AsyncIterator[StreamingEvent]:
+    async def run_batch(
+        self,
+        prompts: Sequence[BasePrompt],
+        contexts: Optional[Sequence[WorkflowContext]] = None,
+        max_concurrency: int = 8,
+        timeout: Optional[float] = None
+    ) -> List[BatchResult]:
+        """
+        Runs the workflow once per prompt with at most `max_concurrency` runs in flight.
+        Results are returned in input order; a failing item does not stop the batch.
+        """
+        results = [result async for result in self.run_batch_stream(prompts, contexts, max_concurrency, timeout)]
+        results.sort(key=lambda result: result.index)
+        return results
+
+    async def run_batch_stream(
+        self,
+        prompts: Sequence[BasePrompt],
+        contexts: Optional[Sequence[WorkflowContext]] = None,
+        max_concurrency: int = 8,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[BatchResult]:
+        """
+        Same as `run_batch` but yields each result as soon as its run finishes.
+        Items without a context get a fresh session, the given ones must not share one.
+        """
+        if contexts is not None and len(contexts) != len(prompts):
+            raise ValueError(f"Got {len(prompts)} prompts but {len(contexts)} contexts")
+        if contexts is not None:
+            # Their runs would overwrite each other's saved session
+            shared = [session_id for session_id, count in Counter(context.session_id for context in contexts).items() if count > 1]
+            if shared:
+                raise ValueError(f"Batch items share sessions {', '.join(shared)}, every item needs its own")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        batch_id = uuid.uuid4().hex[:8]
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _run_item(index: int) -> BatchResult:
+            if contexts is not None:
+                context = contexts[index]
+            else:
+                context = WorkflowContext(session_id=f"batch-{batch_id}-{index}")
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    final_context = await self.run(prompts[index], context, timeout=timeout)
+                except Exception as e:
+                    return BatchResult(index=index, session_id=context.session_id, latency=time.perf_counter() - started, error=str(e) or type(e).__name__)
+                return BatchResult(index=index, session_id=context.session_id, latency=time.perf_counter() - started, context=final_context)
+
+        tasks = [asyncio.ensure_future(_run_item(index)) for index in range(len(prompts))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cancel(self, session_id: str, reason: str = "cancelled") -> bool:
+        """Cancels the in-flight runs of a session, see `cancel_run`."""
+        return cancel_run(session_id, reason)
+
+    async def run_stream(
+        self,
+        prompt: BasePrompt,
+        initial_context: WorkflowContext,
+        timeout: Optional[float] = None,
+        profiler: Optional[Profiler] = None
+    ) -> AsyncIterator[StreamingEvent]:
+        """
+        Executes the workflow graph and yields the merged event stream of all branches.
+
+        Nodes with several successors fan out: every successor runs concurrently as its
+        own asyncio task. Branches are merged back at `join` nodes, which wait until all
+        of their upstream branches have arrived before continuing.
+
+        The run must finish within `timeout` seconds (default: the workflow's `timeout`),
+        and every agent node within its own `timeout`. When either expires, or the run
+        is cancelled, the stream ends with a WorkflowCancelledEvent instead of a final
+        ContextUpdateEvent; the last checkpoint is kept so the run can be resumed.
+
+        With a `profiler`, spans of the run's nodes, routers, LLM and tool calls and
+        storage writes are recorded on it.
+        """
         context = initial_context.add_history(
             UserMessage(
                 session_id=initial_context.session_id,
                 content=prompt.query
             )
         )
-        current_node_id = self.definition.start_node
+        async for event in self._published(self._execute(prompt, context, (), timeout, profiler)):
+            yield event
 
-        while current_node_id:
-            node = self.definition.nodes.get(current_node_id)
-            if not node:
-                break
+    async def resume_stream(
+        self,
+        session_id: str,
+        timeout: Optional[float] = None,
+        profiler: Optional[Profiler] = None
+    ) -> AsyncIterator[StreamingEvent]:
+        """
+        Continues the interrupted run of `session_id` from its last checkpoint.
+        Agent nodes that already completed are not executed again, their outputs
+        are taken from the checkpointed context (routers re-evaluate on them).
+        """
+        checkpoint = await self._load_checkpoint(session_id)
+        async for event in self._published(self._execute(checkpoint.prompt, checkpoint.context, checkpoint.completed, timeout, profiler)):
+            yield event
 
-            # Check node type
-            if node.type == "end":
-                yield WorkflowEndEvent(
-                    session_id=context.session_id,
-                    agent_name="system",
-                    context=context
-                )
-                break
-
-            if node.type == "router":
-                # Evaluate condition
-                # condition is likely a variable name like "$next_agent"
-                condition_val = self._resolve_value(node.condition, context)
-                
-                # Determine next node
-                # routes is a dict: { "greeting": "greeting_node", "planner": "planner_node" }
-                next_node_id = node.routes.get(str(condition_val), node.default_route)
-                
-                yield RouterDecisionEvent(
-                    session_id=context.session_id,
-                    agent_name="system",
-                    node_id=node.id,
-                    next_node=next_node_id,
-                    condition=node.condition,
-                    value=condition_val
-                )
+    def _published(self, events: AsyncIterator[StreamingEvent]) -> AsyncIterator[StreamingEvent]:
+        return events if self.event_bus is None else self._publish(events)
 
-                current_node_id = next_node_id
-                continue
+    async def _publish(self, events: AsyncIterator[StreamingEvent]) -> AsyncIterator[StreamingEvent]:
+        try:
+            async for event in events:
+                await self.event_bus.publish(event.type, event)
+                yield event
+        finally:
+            await events.aclose()
 
-            # It's an agent node
-            yield NodeStartEvent(
+    async def _load_checkpoint(self, session_id: str) -> WorkflowCheckpoint:
+        if not self.checkpointer:
+            raise ValueError("Cannot resume without a checkpointer")
+        checkpoint = await self.checkpointer.a_load_checkpoint(session_id)
+        if not checkpoint:
+            raise ValueError(f"No checkpoint found for session {session_id}")
+        if checkpoint.workflow != self.plan.name:
+            raise ValueError(f"Checkpoint of session {session_id} belongs to workflow '{checkpoint.workflow}', not '{self.plan.name}'")
+        return checkpoint
+
+    async def _execute(
+        self,
+        prompt: BasePrompt,
+        context: WorkflowContext,
+        completed: Tuple[str, ...],
+        timeout: Optional[float],
+        profiler: Optional[Profiler] = None
+    ) -> AsyncIterator[StreamingEvent]:
+        loop = asyncio.get_running_loop()
+        if timeout is None:
+            timeout = self.plan.timeout
+
+        run = _RunState(
+            prompt=prompt,
+            queue=EventBuffer(self.stream_config),
+            loop=loop,
+            completed=list(completed),
+            skip=Counter(completed),
+            checkpoint_context=context,
+            deadline=loop.time() + timeout if timeout else None,
+            profiler=profiler
+        )
+        run_started = profiler.now_us() if profiler else 0
+        _register_run(context.session_id, run)
+        self._spawn_branch(run, self.plan.start_node, context, ())
+
+        # Backstop for waits no node timeout covers (e.g. an incomplete join)
+        deadline_handle = None
+        if run.deadline is not None:
+            deadline_handle = loop.call_at(run.deadline + _DEADLINE_GRACE, run.queue.put_control, _Abort("deadline"))
+
+        abort_reason = None
+        try:
+            while run.pending:
+                item = await run.queue.get()
+                if item is _BRANCH_DONE:
+                    run.pending -= 1
+                elif isinstance(item, _BranchError):
+                    raise item.error
+                elif isinstance(item, _Abort):
+                    abort_reason = item.reason
+                    break
+                else:
+                    yield item
+        finally:
+            if deadline_handle is not None:
+                deadline_handle.cancel()
+            _unregister_run(context.session_id, run)
+            # Tear down whatever is still running (also when our consumer went away)
+            tasks = list(run.tasks)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            if profiler is not None:
+                profiler.record(self.plan.name, "workflow", run_started, session_id=context.session_id, aborted=abort_reason)
+
+        if abort_reason:
+            yield WorkflowCancelledEvent(
                 session_id=context.session_id,
-                agent_name=node.agent_name,
-                node_id=node.id
+                agent_name="system",
+                reason=abort_reason,
+                content=f"Workflow run aborted: {abort_reason}"
             )
+            return
 
-            agent_inputs = self._resolve_inputs(node.input_mapping, context)
-            
-            # Merge configs
-            final_config = node.config.copy()
-            
-            # Merge global config into node config
-            if self.definition.config:
-                for key, global_val in self.definition.config.items():
-                    if key not in final_config:
-                        final_config[key] = global_val
-                    else:
-                        # Both exist. Shallow merge if dicts
-                        local_val = final_config[key]
-                        if isinstance(global_val, dict) and isinstance(local_val, dict):
-                            merged = global_val.copy()
-                            merged.update(local_val)
-                            final_config[key] = merged
-            
-            # Instantiate agent with config
-            agent = AgentRegistry.instantiate(node.agent_name, agent_id=node.id, **final_config)
-            
-            typed_input = agent.input_type(
-                session_id=context.session_id,
-                prompt=prompt,
-                history=context.history,
-                **agent_inputs
+        for node_id, arrived in run.arrivals.items():
+            logger.warning(
+                f"Join node '{node_id}' received {len(arrived)}/{self.plan.nodes[node_id].fan_in} branches and never ran"
             )
-            
-            # Variable to capture the final output from the stream
-            final_output: AgentOutput = None
-            
-            # Stream agent execution
-            async for event in agent.a_stream(typed_input):
-                yield event
-                
-                # Capture context updates from agent
-                if isinstance(event, ContextUpdateEvent):
-                    # Merge update into current context
-                    updates = event.context
-                    # If updates is a dict of key-values, we assume they go into state
-                    # But context.update expects {node_id: output} usually?
-                    # We need to support arbitrary variable setting.
-                    if isinstance(updates, dict):
-                        # We merge these updates into the state. 
-                        # This allows agents to set variables like "next_agent".
-                        # But wait, context.update(updates) replaces/merges into state.
-                        context = context.update(updates)
 
-                # Capture final output
-                if isinstance(event, AgentOutputEvent):
-                    final_output = event.output
+        if len(run.final_contexts) == 1:
+            context = run.final_contexts[0]
+        elif run.final_contexts:
+            context = self._merge_contexts(context, run.final_contexts)
+
+        yield ContextUpdateEvent(
+            session_id=context.session_id,
+            agent_name="system",
+            context=context
+        )
+
+        # The run completed, nothing left to resume
+        if self.checkpointer and run.completed:
+            await self.checkpointer.a_clear_checkpoint(context.session_id)
+
+    def _spawn_branch(self, run: _RunState, node_id: str, context: WorkflowContext, bases: tuple):
+        run.pending += 1
+        task = asyncio.create_task(self._run_branch(run, node_id, context, bases))
+        run.tasks.add(task)
+        task.add_done_callback(run.tasks.discard)
+
+    async def _run_branch(self, run: _RunState, node_id: Optional[str], context: WorkflowContext, bases: tuple):
+        """
+        Walks the graph from `node_id` until the branch ends, waits at a join or fails.
+        `bases` is the stack of contexts at the enclosing fork points, used to compute
+        what each branch changed when branches are merged.
+        """
+        if run.profiler is not None:
+            run.profiler.bind()
+        speculation: Optional[_Speculation] = None
+        try:
+            while node_id:
+                node = self.plan.nodes.get(node_id)
+                if not node:
+                    break
+
+                # Check node type
+                if node.type == "end":
+                    await run.queue.put(WorkflowEndEvent(
+                        session_id=context.session_id,
+                        agent_name="system",
+                        context=context
+                    ))
+                    break
+
+                if node.type == "router":
+                    # Evaluate condition
+                    # condition is likely a variable name like "$next_agent"
+                    with span(node.id, "router") as span_args:
+                        condition_val = node.condition_accessor(context)
+
+                        # Determine next node
+                        # routes is a dict: { "greeting": "greeting_node", "planner": "planner_node" }
+                        next_node_id = node.route(condition_val)
+                        span_args["next_node"] = next_node_id
+                    if node.speculate == SPECULATE_LEARNED:
+                        self._record_route(node, next_node_id)
+
+                    if speculation is not None and speculation.target != next_node_id:
+                        self._discard_speculation(speculation)
+                        speculation = None
+
+                    await run.queue.put(RouterDecisionEvent(
+                        session_id=context.session_id,
+                        agent_name="system",
+                        node_id=node.id,
+                        next_node=next_node_id,
+                        condition=node.condition,
+                        value=condition_val
+                    ))
+
+                    node_id = next_node_id
+                    continue
+
+                if node.type == "join":
+                    joined = self._arrive_at_join(run, node, context, bases)
+                    if joined is None:
+                        # Another branch is still running, the last one to arrive continues
+                        return
+                    context, bases = joined
+                elif speculation is not None and speculation.target == node.id:
+                    context = await self._adopt_speculation(run, speculation, node, context)
+                    speculation = None
+                elif run.skip[node.id]:
+                    # Completed before the run was interrupted, its output is in the context
+                    run.skip[node.id] -= 1
+                else:
+                    if node.speculation_router:
+                        speculation = self._speculate(run, node, context)
+                    context = await self._execute_agent_node(run, node, context)
+
+                successors = node.next_nodes
+                if not successors:
+                    node_id = None
+                    continue
+
+                if len(successors) > 1:
+                    # Fan out: the first successor continues in this task, the rest get their own
+                    bases = bases + (context,)
+                    for successor_id in successors[1:]:
+                        self._spawn_branch(run, successor_id, context, bases)
+                node_id = successors[0]
+
+            run.final_contexts.append(context)
+        except asyncio.CancelledError:
+            raise
+        except _NodeTimeout as e:
+            run.queue.put_control(_Abort(e.reason))
+        except Exception as e:
+            run.queue.put_control(_BranchError(e))
+        finally:
+            if speculation is not None:
+                self._discard_speculation(speculation)
+            run.queue.put_control(_BRANCH_DONE)
+
+    async def _execute_agent_node(
+        self,
+        run: _RunState,
+        node: PlanNode,
+        context: WorkflowContext,
+        sink: Optional[_SpeculativeSink] = None
+    ) -> WorkflowContext:
+        """Runs an agent or map node. Speculative runs emit into `sink` and are not checkpointed."""
+        with span(node.id, "node", agent=node.agent_name, speculative=sink is not None) as span_args:
+            context_before = context
+            queue = sink or run.queue
+            await queue.put(NodeStartEvent(
+                session_id=context.session_id,
+                agent_name=node.agent_name,
+                node_id=node.id
+            ))
+
+            timeout, reason = self._node_timeout(run, node)
+            try:
+                if node.type == "map":
+                    work = self._run_map(run, node, context, queue)
+                else:
+                    work = self._run_agent(run, node, context, node.resolve_inputs(context), queue)
+                context, final_output, data = await asyncio.wait_for(work, timeout)
+                span_args.update(data)
+            except asyncio.TimeoutError:
+                queue.put_control(NodeTimeoutEvent(
+                    session_id=context.session_id,
+                    agent_name=node.agent_name,
+                    node_id=node.id,
+                    timeout=timeout,
+                    reason=reason,
+                    content=f"Node {node.id} exceeded its {'workflow deadline' if reason == 'deadline' else 'timeout'} ({timeout:.1f}s)"
+                ))
+                raise _NodeTimeout(reason)
 
             # If no AgentOutputEvent was yielded, we might need a fallback or assume it failed?
-            # For now, if final_output is None, we assume the agent implementation is legacy 
+            # For now, if final_output is None, we assume the agent implementation is legacy
             # and might need a_run, BUT we want to avoid double execution.
             # So we strictly rely on AgentOutputEvent for now for new agents.
-            
+
             if final_output:
                 output = final_output
             else:
                 # Fallback: create a generic output or empty one
                 # This handles cases where agent didn't yield output event (legacy or error)
                 output = AgentOutput(session_id=context.session_id)
-            
+
             # Add to history
             context = context.update({node.id: output})
             context = context.add_history(output)
 
-            yield NodeEndEvent(
+            await queue.put(NodeEndEvent(
                 session_id=context.session_id,
                 agent_name=node.agent_name,
                 node_id=node.id,
-                output=output
+                output=output,
+                data=data
+            ))
+
+            if self.checkpointer and sink is None:
+                await self._checkpoint(run, node, context_before, context)
+            return context
+
+    async def _run_agent(
+        self,
+        run: _RunState,
+        node: PlanNode,
+        context: WorkflowContext,
+        agent_inputs: Dict[str, Any],
+        queue
+    ) -> Tuple[WorkflowContext, Optional[AgentOutput], Dict[str, Any]]:
+        """Runs the node's agent once on `agent_inputs` through the middleware chain, or replays it from the cache."""
+        cache_key, cached = None, None
+        if node.cache and self.cache is not None:
+            cache_key = self.cache.key(
+                node.agent_name, node.config, agent_inputs, run.prompt,
+                context.history if node.cache.include_history else None
             )
+            cached = self.cache.get(cache_key, node.cache.ttl)
 
-            if node.next_nodes:
-                current_node_id = node.next_nodes[0]
-            else:
-                current_node_id = None
-        
-        yield ContextUpdateEvent(
+        if cached is not None:
+            context, final_output = await self._stream_agent(queue, replay_events(cached, context.session_id), context)
+            return context, final_output, {"cached": True}
+
+        recorded = [] if cache_key is not None else None
+        context, final_output = await self._invoke({
+            "kind": "node",
+            "name": node.id,
+            "agent": node.agent_name,
+            "session_id": context.session_id,
+            "node": node,
+            "run": run,
+            "context": context,
+            "inputs": agent_inputs,
+            "queue": queue,
+            "recorded": recorded
+        })
+
+        if recorded is not None and final_output:
+            if not node.cache.replay_stream:
+                recorded = [event for event in recorded if isinstance(event, (ContextUpdateEvent, AgentOutputEvent))]
+            self.cache.put(cache_key, recorded)
+
+        return context, final_output, {}
+
+    async def _invoke_agent(self, call: Dict[str, Any]) -> Tuple[WorkflowContext, Optional[AgentOutput]]:
+        """Target of the middleware chain: runs the node's agent once and streams its events."""
+        node, context = call["node"], call["context"]
+        # Get a (pooled) agent for the pre-merged config
+        agent = AgentRegistry.acquire(node.agent_name, agent_id=node.id, **node.config)
+
+        typed_input = agent.input_type(
             session_id=context.session_id,
-            agent_name="system",
-            context=context
+            prompt=call["run"].prompt,
+            history=context.history,
+            **call["inputs"]
         )
+        recorded = call["recorded"]
+        if recorded:
+            # Events of an attempt a retry middleware gave up on
+            recorded.clear()
+        return await self._stream_agent(call["queue"], agent.a_stream(typed_input), context, recorded)
 
-    def _resolve_inputs(self, mapping: Dict[str, Any], context: WorkflowContext) -> Dict[str, Any]:
-        inputs = {}
-        for target_key, source_value in mapping.items():
-            inputs[target_key] = self._resolve_value(source_value, context)
-        return inputs
-
-    def _resolve_value(self, source_value: Any, context: WorkflowContext) -> Any:
-        if isinstance(source_value, str) and source_value.startswith("$"):
-            ref_path = source_value[1:]
-            
-            if "." in ref_path:
-                node_id, rest = ref_path.split(".", 1)
-                node_output = context.state.get(node_id)
-                if node_output:
-                    return self._get_nested_value(node_output, rest)
-                
-                # Fallback: check global vars/state directly
-                # If "planner.next_agent" is stored in state["next_agent"]? No.
-                return None
-            else:
-                # Direct match
-                # 1. Check if it's in state (node outputs OR variables)
-                if ref_path in context.state:
-                    return context.state[ref_path]
-                
-                # 2. Check if it's in history (not easy to access by simple key)
-                return None
-        return source_value
-
-    def _get_nested_value(self, obj: Any, path: str) -> Any:
-        parts = path.split(".")
-        current = obj
-        for part in parts:
-            if hasattr(current, part):
-                current = getattr(current, part)
-            elif isinstance(current, dict) and part in current:
-                current = current[part]
+    async def _run_map(
+        self,
+        run: _RunState,
+        node: PlanNode,
+        context: WorkflowContext,
+        queue
+    ) -> Tuple[WorkflowContext, MapOutput, Dict[str, Any]]:
+        """
+        Runs the node's agent once per element of its list, at most `max_concurrency`
+        at a time, and collects the outputs in list order. Elements all start from
+        `context`; state updates they emit are not applied, their outputs are the result.
+        """
+        items = node.items_accessor(context, run.prompt)
+        if items is None:
+            items = []
+        elif isinstance(items, (str, bytes)) or not isinstance(items, Sequence):
+            raise ValueError(f"Map node '{node.id}' expects a list, got {type(items).__name__}")
+
+        shared_inputs = node.resolve_inputs(context)
+        semaphore = asyncio.Semaphore(node.max_concurrency)
+
+        async def _run_item(index: int, item: Any) -> Optional[AgentOutput]:
+            agent_inputs = dict(shared_inputs)
+            for key, accessor in node.item_inputs:
+                agent_inputs[key] = accessor(item)
+            async with semaphore:
+                _, output, _ = await self._run_agent(run, node, context, agent_inputs, _MapItemSink(queue, index))
+            return output or AgentOutput(session_id=context.session_id)
+
+        tasks = [asyncio.ensure_future(_run_item(index, item)) for index, item in enumerate(items)]
+        try:
+            outcomes = await asyncio.gather(*tasks, return_exceptions=node.continue_on_error)
+        finally:
+            # A failed element (or a timeout) stops the elements still running
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        results, errors = [], []
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                if isinstance(outcome, asyncio.CancelledError):
+                    raise outcome
+                logger.warning(f"Map node '{node.id}': element failed: {outcome}")
+                results.append(None)
+                errors.append(str(outcome))
             else:
-                return None
-        return current
+                results.append(outcome)
+                errors.append(None)
+
+        failed = sum(1 for error in errors if error is not None)
+        output = MapOutput(
+            session_id=context.session_id,
+            content="\n\n".join(result.content for result in results if result is not None and result.content),
+            results=results,
+            errors=errors if failed else []
+        )
+        return context, output, {"items": len(results), "failed": failed}
+
+    def _node_timeout(self, run: _RunState, node: PlanNode) -> Tuple[Optional[float], str]:
+        """Effective timeout of a node: its own limit, capped by what is left of the run deadline."""
+        if run.deadline is None:
+            return node.timeout, "timeout"
+        remaining = max(run.deadline - asyncio.get_running_loop().time(), 0)
+        if node.timeout is not None and node.timeout <= remaining:
+            return node.timeout, "timeout"
+        return remaining, "deadline"
+
+    async def _stream_agent(
+        self,
+        queue,
+        stream: AsyncIterator[StreamingEvent],
+        context: WorkflowContext,
+        recorded: Optional[List[StreamingEvent]] = None
+    ) -> Tuple[WorkflowContext, Optional[AgentOutput]]:
+        # Variable to capture the final output from the stream
+        final_output: AgentOutput = None
+        profiler = current_profiler()
+        tool_starts: Dict[str, List[int]] = {}
+
+        # Closing the stream explicitly on timeout/cancellation also closes the underlying LLM request
+        try:
+            async for event in stream:
+                await queue.put(event)
+                if recorded is not None:
+                    recorded.append(event)
+                if profiler is not None and isinstance(event, (ToolStartEvent, ToolEndEvent)):
+                    self._profile_tool(profiler, event, tool_starts)
+
+                # Capture context updates from agent
+                if isinstance(event, ContextUpdateEvent):
+                    # Merge update into current context
+                    updates = event.context
+                    # If updates is a dict of key-values, we assume they go into state
+                    # But context.update expects {node_id: output} usually?
+                    # We need to support arbitrary variable setting.
+                    if isinstance(updates, dict):
+                        # We merge these updates into the state.
+                        # This allows agents to set variables like "next_agent".
+                        # But wait, context.update(updates) replaces/merges into state.
+                        context = context.update(updates)
+
+                # Capture final output
+                if isinstance(event, AgentOutputEvent):
+                    final_output = event.output
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose:
+                await aclose()
+
+        return context, final_output
+
+    def _profile_tool(self, profiler: Profiler, event: StreamingEvent, tool_starts: Dict[str, List[int]]):
+        # Tool calls are timed from the ToolStart/ToolEnd events agents emit around them
+        tool_name = event.data.get("tool_name") or event.agent_name
+        if isinstance(event, ToolStartEvent):
+            tool_starts.setdefault(tool_name, []).append(profiler.now_us())
+        elif tool_starts.get(tool_name):
+            profiler.record(tool_name, "tool", tool_starts[tool_name].pop(0), agent=event.agent_name)
+
+    def _speculate(self, run: _RunState, node: PlanNode, context: WorkflowContext) -> Optional[_Speculation]:
+        """
+        Starts the likely route of the router downstream of `node` while `node` runs.
+        The speculative node sees the context from before `node`, which the plan
+        compiler guarantees its inputs do not depend on.
+        """
+        router = self.plan.nodes[node.speculation_router]
+        target = self._predict_route(router)
+        if target is None or run.skip[target]:
+            return None
+
+        sink = _SpeculativeSink(run.queue)
+        task = asyncio.create_task(self._execute_agent_node(run, self.plan.nodes[target], context, sink=sink))
+        run.tasks.add(task)
+        task.add_done_callback(run.tasks.discard)
+        logger.debug(f"Speculatively started '{target}' ahead of router '{router.id}'")
+        return _Speculation(target=target, base=context, sink=sink, task=task)
+
+    def _predict_route(self, router: PlanNode) -> Optional[str]:
+        if router.speculate != SPECULATE_LEARNED:
+            return router.speculate
+
+        decisions = self._route_history.get(router.id)
+        if not decisions or len(decisions) < _SPECULATION_MIN_SAMPLES:
+            return None
+        target, count = Counter(decisions).most_common(1)[0]
+        if count < len(decisions) * _SPECULATION_MIN_SHARE or target not in router.speculative_targets:
+            return None
+        return target
+
+    def _record_route(self, router: PlanNode, next_node_id: Optional[str]):
+        decisions = self._route_history.get(router.id)
+        if decisions is None:
+            decisions = self._route_history[router.id] = deque(maxlen=_SPECULATION_WINDOW)
+        decisions.append(next_node_id)
+
+    async def _adopt_speculation(self, run: _RunState, speculation: _Speculation, node: PlanNode, context: WorkflowContext) -> WorkflowContext:
+        """The router confirmed the guess: replay what the node emitted so far and wait for it."""
+        self.speculation_hits += 1
+        await speculation.sink.release()
+        result = await speculation.task
+
+        # Carry over only what the speculative node itself changed
+        adopted = self._apply_changes(context, speculation.base, result)
+        if self.checkpointer:
+            await self._checkpoint(run, node, context, adopted)
+        return adopted
+
+    def _discard_speculation(self, speculation: _Speculation):
+        self.speculation_misses += 1
+        speculation.task.cancel()
+        # Its outcome is irrelevant, just keep asyncio from reporting an unretrieved error
+        speculation.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def _checkpoint(self, run: _RunState, node: PlanNode, before: WorkflowContext, after: WorkflowContext):
+        # Fold what this node changed into the run-wide context, other branches may be in flight
+        run.completed.append(node.id)
+        run.checkpoint_context = self._apply_changes(run.checkpoint_context, before, after)
+        # Write-behind, the run does not wait for the disk
+        await self.checkpointer.a_save_checkpoint(WorkflowCheckpoint(
+            session_id=after.session_id,
+            workflow=self.plan.name,
+            prompt=run.prompt,
+            completed=tuple(run.completed),
+            context=run.checkpoint_context
+        ))
+
+    def _arrive_at_join(self, run: _RunState, node: PlanNode, context: WorkflowContext, bases: tuple) -> Optional[Tuple[WorkflowContext, tuple]]:
+        """
+        Registers a branch at a join node. Returns the merged context (and the fork stack
+        of the enclosing scope) once every upstream branch has arrived, otherwise None.
+        """
+        arrived = run.arrivals.setdefault(node.id, [])
+        arrived.append((context, bases))
+        if len(arrived) < node.fan_in:
+            return None
+
+        del run.arrivals[node.id]
+        first_context, first_bases = arrived[0]
+        if not first_bases:
+            # Join without a matching fork (e.g. several routes leading into it)
+            return first_context, first_bases
+
+        merged = self._merge_contexts(first_bases[-1], [ctx for ctx, _ in arrived])
+        return merged, first_bases[:-1]
+
+    def _merge_contexts(self, base: WorkflowContext, contexts: List[WorkflowContext]) -> WorkflowContext:
+        """
+        Applies what each branch changed relative to `base`, in arrival order:
+        state keys it (re)assigned and history entries it appended.
+        """
+        merged = base
+        for ctx in contexts:
+            merged = self._apply_changes(merged, base, ctx)
+        return merged
+
+    def _apply_changes(self, target: WorkflowContext, base: WorkflowContext, changed: WorkflowContext) -> WorkflowContext:
+        """Applies to `target` the state and history changes between `base` and `changed`."""
+        updates = {
+            key: value for key, value in changed.state.items()
+            if key not in base.state or base.state[key] is not value
+        }
+        if updates:
+            target = target.update(updates)
+        for entry in changed.history[len(base.history):]:
+            target = target.add_history(entry)
+        return target
@@ -5,7 +5,7 @@ import yaml
 @dataclass
 class WorkflowNode:
     id: str
-    type: str = "agent"  # agent, router, end
+    type: str = "agent"  # agent, map, router, join, end
     agent_name: Optional[str] = None
     input_mapping: Dict[str, str] = field(default_factory=dict)
     next_nodes: List[str] = field(default_factory=list)
@@ -14,16 +14,45 @@ class WorkflowNode:
     condition: Optional[str] = None
     routes: Dict[str, str] = field(default_factory=dict)
     default_route: Optional[str] = None
+    # Route key or node to start ahead of the decision, or "learned"
+    speculate: Optional[str] = None
     
+    # Map specific: list to run the agent over, concurrent element runs and
+    # whether a failed element fails the node
+    items: Optional[str] = None
+    max_concurrency: Optional[int] = None
+    continue_on_error: bool = False
+
     # Agent config
     config: Dict[str, Any] = field(default_factory=dict)
 
+    # Max seconds the agent may run, None for no per-node limit
+    timeout: Optional[float] = None
+
+    # Result caching: true or a mapping of CachePolicy options
+    cache: Any = None
+
 @dataclass
 class WorkflowDefinition:
     name: str
     nodes: Dict[str, WorkflowNode]
     start_node: str
     config: Dict[str, Any] = field(default_factory=dict)
+    # Deadline in seconds for a whole run, None or <= 0 for no deadline
+    timeout: Optional[float] = None
+    # Middleware every agent invocation runs through, see MiddlewarePipeline.from_config
+    middleware: List[Any] = field(default_factory=list)
+
+    def predecessors(self, node_id: str) -> List[str]:
+        """Returns the ids of all nodes with an edge (plain or routed) into `node_id`."""
+        preds = []
+        for node in self.nodes.values():
+            targets = list(node.next_nodes) + list(node.routes.values())
+            if node.default_route:
+                targets.append(node.default_route)
+            if node_id in targets:
+                preds.append(node.id)
+        return preds
 
 class YamlWorkflowLoader:
     def load(self, file_path: str) -> WorkflowDefinition:
@@ -89,7 +118,9 @@ class YamlWorkflowLoader:
             name=data.get('name', 'unnamed'),
             nodes=nodes,
             start_node=data.get('start_node'),
-            config=global_config
+            config=global_config,
+            timeout=data.get('timeout'),
+            middleware=data.get('middleware') or []
         )
 
     def _parse_node(self, node_data: Dict[str, Any]) -> WorkflowNode:
@@ -109,5 +140,11 @@ class YamlWorkflowLoader:
             condition=node_data.get('condition'),
             routes=node_data.get('routes', {}),
             default_route=node_data.get('default'),
-            config=node_data.get('config', {})
+            speculate=node_data.get('speculate'),
+            items=node_data.get('items'),
+            max_concurrency=node_data.get('max_concurrency'),
+            continue_on_error=node_data.get('continue_on_error', False),
+            config=node_data.get('config', {}),
+            timeout=node_data.get('timeout'),
+            cache=node_data.get('cache')
         )
@@ -1,10 +1,17 @@
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from .models.base import Base
+from ..settings import settings
 
 class DBManager:
     def __init__(self, connection_string: str = "sqlite:///datagent.db"):
+        self.connect(connection_string)
+
+    def connect(self, connection_string: str):
+        self.connection_string = connection_string
         self.engine = create_engine(connection_string)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", _configure_sqlite)
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
 
     def init_db(self):
@@ -17,10 +24,18 @@ class DBManager:
         finally:
             db.close()
 
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a turn is written, NORMAL sync is durable in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
 # Singleton instance
-db_manager = DBManager()
+db_manager = DBManager(settings.DATABASE_URL)
 
 def init_db(connection_string: str = None):
-    # If connection string provided, we might want to re-init manager, 
-    # but for simplicity we just use the default or current one.
+    if connection_string and connection_string != db_manager.connection_string:
+        db_manager.connect(connection_string)
     db_manager.init_db()
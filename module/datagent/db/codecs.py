@@ -0,0 +1,104 @@
+import json
+import struct
+import zlib
+from typing import Any, Callable, Dict, Optional
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Binary document layout:
+#   magic (4) | schema version (uint16) | payload encoding (uint8) | payload length (uint32) | payload
+MAGIC = b"DGSB"
+_HEADER = struct.Struct(">4sHBI")
+
+# Version of the document layout written now. Documents of older versions are
+# upgraded on load by the MIGRATIONS step from their version to the next one.
+# Version 0 is the original headerless, indented JSON file.
+SCHEMA_VERSION = 1
+
+MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    # The binary container keeps the JSON document structure unchanged
+    0: lambda data: data,
+}
+
+PAYLOAD_MSGPACK = 1
+PAYLOAD_ZLIB_JSON = 2
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+
+class DocumentCodec:
+    """Encodes repository documents (JSON-compatible dicts) to and from file contents."""
+    extension = ".json"
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+    def decode(self, raw: bytes) -> Dict[str, Any]:
+        if raw.startswith(MAGIC):
+            return BinaryCodec().decode(raw)
+        return migrate(json.loads(raw.decode("utf-8")), 0)
+
+class BinaryCodec(DocumentCodec):
+    """
+    Compact length-prefixed documents with a version header. The payload is
+    MessagePack when the `msgpack` package is installed, otherwise zlib-compressed
+    compact JSON. Headerless JSON documents of the old format decode as well.
+    """
+    extension = ".bin"
+
+    def __init__(self, payload: Optional[int] = None):
+        self.payload = payload or (PAYLOAD_MSGPACK if msgpack is not None else PAYLOAD_ZLIB_JSON)
+        if self.payload == PAYLOAD_MSGPACK and msgpack is None:
+            raise ImportError("msgpack is required for MessagePack session payloads")
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        if self.payload == PAYLOAD_MSGPACK:
+            body = msgpack.packb(data, use_bin_type=True)
+        else:
+            body = zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 1)
+        return _HEADER.pack(MAGIC, SCHEMA_VERSION, self.payload, len(body)) + body
+
+    def decode(self, raw: bytes) -> Dict[str, Any]:
+        if not raw.startswith(MAGIC):
+            # Written before the binary format existed
+            return migrate(json.loads(raw.decode("utf-8")), 0)
+
+        if len(raw) < _HEADER.size:
+            raise ValueError("Truncated document header")
+        _, version, payload, length = _HEADER.unpack_from(raw)
+        body = raw[_HEADER.size:_HEADER.size + length]
+        if len(body) != length:
+            raise ValueError(f"Truncated document, expected {length} payload bytes, got {len(body)}")
+
+        if payload == PAYLOAD_MSGPACK:
+            if msgpack is None:
+                raise ImportError("msgpack is required to read MessagePack session payloads")
+            data = msgpack.unpackb(body, raw=False)
+        elif payload == PAYLOAD_ZLIB_JSON:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error as e:
+                raise ValueError(f"Corrupt document payload: {e}") from None
+            data = json.loads(body.decode("utf-8"))
+        else:
+            raise ValueError(f"Unknown document payload encoding {payload}")
+        return migrate(data, version)
+
+def migrate(data: Dict[str, Any], version: int) -> Dict[str, Any]:
+    """Upgrades a document of layout `version` to SCHEMA_VERSION."""
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Document version {version} is newer than the supported version {SCHEMA_VERSION}")
+    while version < SCHEMA_VERSION:
+        data = MIGRATIONS[version](data)
+        version += 1
+    return data
+
+def get_codec(format: str) -> DocumentCodec:
+    """Codec for a `SESSION_FORMAT` setting: json or binary."""
+    if format == FORMAT_JSON:
+        return DocumentCodec()
+    if format == FORMAT_BINARY:
+        return BinaryCodec()
+    raise ValueError(f"Unknown session format {format}, expected {FORMAT_JSON} or {FORMAT_BINARY}")
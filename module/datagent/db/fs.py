@@ -1,64 +1,319 @@
 import os
 import json
+import hashlib
+import logging
 import shutil
-from typing import Any, Dict, List, Optional, Union
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+# Levels of two hex digit directories documents of a new store are sharded into
+# (1 level = 256 directories per collection). Stores created before sharding
+# existed stay flat (depth 0) until migrated with `migrate_layout`.
+DEFAULT_SHARD_DEPTH = 1
+
+_LAYOUT_FILE = ".layout.json"
+_INDEX_FILE = ".index.sqlite"
+
+# File extension -> number of dot-separated parts it spans, to split file names
+# back into document id and extension (ids may contain dots)
+_EXTENSION_PARTS: Dict[str, int] = {".json": 1, ".bin": 1}
+
+def register_extension(suffix: str, parts: int = 1):
+    """
+    Declares a document file suffix. `parts` > 1 for extensions with a variable
+    middle part, e.g. `register_extension(".log", parts=2)` for `<id>.<generation>.log`.
+    """
+    _EXTENSION_PARTS[suffix] = parts
+
+@dataclass(frozen=True, kw_only=True)
+class DocumentInfo:
+    """Index entry of a document: its files' total size and newest modification time."""
+    id: str
+    size: int
+    mtime: float
+
 class FileSystemDB:
     """
     A simple file-based database implementation that mimics a structured store.
     It stores data in JSON files within a specified root directory.
+
+    Documents are spread over hash-prefix subdirectories of their collection
+    (`shard_depth` levels), so no directory grows past a few thousand files. An
+    index of every document file (id, extension, size, mtime) is kept in a
+    SQLite file in the root; listing reads it instead of the directories and can
+    be paginated with a cursor. The index is rebuilt from the files when it is
+    missing, or on demand with `rebuild_index` after files were changed outside
+    of this class. File names are split back into id and extension with the
+    suffixes declared by `register_extension`.
+
+    Nothing is written before the first document is: the root directory, the
+    layout file and the index are created on demand.
     """
-    
-    def __init__(self, root_dir: str = None):
-        self.root_dir = Path(root_dir or "storage")    
-        self._ensure_root()
-        
+
+    def __init__(self, root_dir: str = None, shard_depth: Optional[int] = None):
+        self.root_dir = Path(root_dir or "storage")
+        if shard_depth is not None and shard_depth < 0:
+            raise ValueError("shard_depth must not be negative")
+        self.shard_depth = self._load_layout(shard_depth)
+        self._layout_written = (self.root_dir / _LAYOUT_FILE).exists()
+
+        # Directories known to exist, to skip the exists()/mkdir per document access
+        self._collection_paths: Dict[str, Path] = {}
+        self._made: Set[Path] = set()
+        self._index_conn: Optional[sqlite3.Connection] = None
+        self._index_lock = threading.Lock()
+
     def _ensure_root(self):
-        """Ensure the storage root directory exists."""
-        if not self.root_dir.exists():
+        """Ensure the storage root directory (and its layout file) exists."""
+        if not self._layout_written:
             self.root_dir.mkdir(parents=True, exist_ok=True)
-            
+            self._write_layout(self.shard_depth)
+
+    def _load_layout(self, shard_depth: Optional[int]) -> int:
+        layout_path = self.root_dir / _LAYOUT_FILE
+        if layout_path.exists():
+            depth = json.loads(layout_path.read_text(encoding="utf-8"))["shard_depth"]
+            if shard_depth is not None and shard_depth != depth:
+                raise ValueError(f"Storage {self.root_dir} is sharded {depth} levels deep, not {shard_depth} (see migrate_layout)")
+            return depth
+
+        if self._collections():
+            # Written before sharding existed
+            return 0
+        return DEFAULT_SHARD_DEPTH if shard_depth is None else shard_depth
+
+    def _write_layout(self, depth: int):
+        layout_path = self.root_dir / _LAYOUT_FILE
+        tmp_path = layout_path.with_name(f"{layout_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({"shard_depth": depth}), encoding="utf-8")
+        os.replace(tmp_path, layout_path)
+        self._layout_written = True
+
+    def _collections(self) -> List[str]:
+        if not self.root_dir.is_dir():
+            return []
+        return sorted(p.name for p in self.root_dir.iterdir() if p.is_dir() and not p.name.startswith("."))
+
     def _get_collection_path(self, collection: str) -> Path:
         """Get the path for a specific collection (directory)."""
-        path = self.root_dir / collection
-        if not path.exists():
-            path.mkdir(parents=True, exist_ok=True)
+        path = self._collection_paths.get(collection)
+        if path is None:
+            path = self._collection_paths[collection] = self.root_dir / collection
         return path
-    
-    def _get_doc_path(self, collection: str, doc_id: str) -> Path:
-        """Get the path for a specific document (file)."""
-        return self._get_collection_path(collection) / f"{doc_id}.json"
+
+    def _shard_dir(self, collection: str, doc_id: str, depth: int) -> Path:
+        path = self._get_collection_path(collection)
+        if depth:
+            digest = hashlib.md5(doc_id.encode("utf-8")).hexdigest()
+            for level in range(depth):
+                path = path / digest[2 * level:2 * level + 2]
+        return path
+
+    def _get_doc_path(self, collection: str, doc_id: str, extension: str = ".json", create: bool = False) -> Path:
+        """Get the path for a specific document (file). `create` makes sure its directory exists."""
+        directory = self._shard_dir(collection, doc_id, self.shard_depth)
+        if create and directory not in self._made:
+            self._ensure_root()
+            directory.mkdir(parents=True, exist_ok=True)
+            self._made.add(directory)
+        return directory / f"{doc_id}{extension}"
 
     def save(self, collection: str, doc_id: str, data: Dict[str, Any]):
         """Save a document to a collection."""
-        path = self._get_doc_path(collection, doc_id)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-            
+        self.save_raw(collection, doc_id, json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"), ".json")
+
     def load(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
         """Load a document from a collection."""
-        path = self._get_doc_path(collection, doc_id)
-        if not path.exists():
+        raw = self.load_raw(collection, doc_id, ".json")
+        if raw is None:
             return None
-        
+
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return json.loads(raw.decode("utf-8"))
         except Exception as e:
             # log error?
             return None
 
-    def delete(self, collection: str, doc_id: str):
+    def save_raw(self, collection: str, doc_id: str, raw: bytes, extension: str):
+        """Save an already encoded document, atomically replacing the previous one."""
+        path = self._get_doc_path(collection, doc_id, extension, create=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(raw)
+        os.replace(tmp_path, path)
+        self._index_put(collection, doc_id, extension, len(raw))
+
+    def append_raw(self, collection: str, doc_id: str, raw: bytes, extension: str) -> int:
+        """Append to a document (created if missing). Returns its size afterwards."""
+        with open(self._get_doc_path(collection, doc_id, extension, create=True), 'ab') as f:
+            f.write(raw)
+            size = f.tell()
+        self._index_put(collection, doc_id, extension, size)
+        return size
+
+    def load_raw(self, collection: str, doc_id: str, extension: str) -> Optional[bytes]:
+        """Load the encoded contents of a document, None if it does not exist."""
+        try:
+            with open(self._get_doc_path(collection, doc_id, extension), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, collection: str, doc_id: str, extension: str = ".json"):
         """Delete a document."""
-        path = self._get_doc_path(collection, doc_id)
-        if path.exists():
-            path.unlink()
-            
-    def list_ids(self, collection: str) -> List[str]:
+        try:
+            self._get_doc_path(collection, doc_id, extension).unlink()
+        except FileNotFoundError:
+            return
+        with self._index_lock:
+            self._index().execute(
+                "DELETE FROM documents WHERE collection = ? AND doc_id = ? AND extension = ?",
+                (collection, doc_id, extension)
+            )
+
+    def list_ids(self, collection: str, extensions: tuple = (".json",)) -> List[str]:
         """List all document IDs in a collection."""
-        path = self._get_collection_path(collection)
-        return [f.stem for f in path.glob("*.json")]
+        with self._index_lock:
+            rows = self._index().execute(
+                f"SELECT DISTINCT doc_id FROM documents WHERE collection = ? AND extension IN ({_placeholders(extensions)}) ORDER BY doc_id",
+                (collection, *extensions)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def list_page(
+        self,
+        collection: str,
+        extensions: tuple = (".json",),
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[DocumentInfo], Optional[str]]:
+        """
+        One page of the documents of a collection, ordered by id. Returns the page
+        and the cursor of the next one (None after the last page).
+        """
+        with self._index_lock:
+            rows = self._index().execute(
+                "SELECT doc_id, SUM(size), MAX(mtime) FROM documents "
+                f"WHERE collection = ? AND extension IN ({_placeholders(extensions)}) AND doc_id > ? "
+                "GROUP BY doc_id ORDER BY doc_id LIMIT ?",
+                (collection, *extensions, cursor or "", limit)
+            ).fetchall()
+        page = [DocumentInfo(id=doc_id, size=size, mtime=mtime) for doc_id, size, mtime in rows]
+        return page, (page[-1].id if len(page) == limit else None)
+
+    def rebuild_index(self) -> int:
+        """Rebuilds the index from the files on disk. Returns the number of files indexed."""
+        with self._index_lock:
+            conn = self._index()
+            return self._rebuild(conn)
+
+    def migrate_layout(self, shard_depth: int = DEFAULT_SHARD_DEPTH) -> int:
+        """
+        Moves every document to the directory of `shard_depth` and rebuilds the
+        index, e.g. to shard a store written before sharding existed. Not safe
+        while other processes use the store. Returns the number of files moved.
+        """
+        if shard_depth < 0:
+            raise ValueError("shard_depth must not be negative")
+        self._ensure_root()
+        moved = 0
+        with self._index_lock:
+            for collection in self._collections():
+                collection_path = self._get_collection_path(collection)
+                for path in list(_document_files(collection_path)):
+                    doc_id, _ = _split_name(path.name)
+                    target_dir = self._shard_dir(collection, doc_id, shard_depth)
+                    if path.parent == target_dir:
+                        continue
+                    target_dir.mkdir(parents=True, exist_ok=True)
+                    os.replace(path, target_dir / path.name)
+                    moved += 1
+                _remove_empty_dirs(collection_path)
+
+            self.shard_depth = shard_depth
+            self._write_layout(shard_depth)
+            self._made.clear()
+            self._rebuild(self._index())
+        return moved
+
+    def _index_put(self, collection: str, doc_id: str, extension: str, size: int):
+        with self._index_lock:
+            self._index().execute(
+                "INSERT OR REPLACE INTO documents (collection, doc_id, extension, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                (collection, doc_id, extension, size, time.time())
+            )
+
+    def _index(self) -> sqlite3.Connection:
+        """The index connection, opened (and built if new) on first use. Needs _index_lock."""
+        if self._index_conn is None:
+            self._ensure_root()
+            conn = sqlite3.connect(self.root_dir / _INDEX_FILE, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            created = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'documents'").fetchone() is None
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "collection TEXT NOT NULL, doc_id TEXT NOT NULL, extension TEXT NOT NULL, "
+                "size INTEGER NOT NULL, mtime REAL NOT NULL, "
+                "PRIMARY KEY (collection, doc_id, extension)) WITHOUT ROWID"
+            )
+            if created:
+                count = self._rebuild(conn)
+                if count:
+                    logger.info(f"Indexed {count} files of {self.root_dir}")
+            self._index_conn = conn
+        return self._index_conn
+
+    def _rebuild(self, conn: sqlite3.Connection) -> int:
+        rows = []
+        for collection in self._collections():
+            for path in _document_files(self.root_dir / collection):
+                doc_id, extension = _split_name(path.name)
+                stat = path.stat()
+                rows.append((collection, doc_id, extension, stat.st_size, stat.st_mtime))
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM documents")
+            conn.executemany("INSERT OR REPLACE INTO documents (collection, doc_id, extension, size, mtime) VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+def _document_files(directory: Path):
+    """Every document file below a collection directory, whatever its sharding."""
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            # Skip interrupted atomic writes
+            if not name.endswith(".tmp"):
+                yield Path(dirpath) / name
+
+def _split_name(name: str) -> Tuple[str, str]:
+    """Document id and extension of a file name, e.g. `s.1.json` or `s.1.3fa2.log`."""
+    base, dot, suffix = name.rpartition(".")
+    if not dot:
+        return name, ""
+    parts = _EXTENSION_PARTS.get(dot + suffix, 1)
+    pieces = name.rsplit(".", parts)
+    if len(pieces) <= parts or not pieces[0]:
+        # Fewer dots than the extension spans
+        return base, dot + suffix
+    return pieces[0], name[len(pieces[0]):]
+
+def _remove_empty_dirs(collection_path: Path):
+    for dirpath, _, _ in sorted(os.walk(collection_path), key=lambda entry: -len(entry[0])):
+        if Path(dirpath) != collection_path and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+def _placeholders(values: tuple) -> str:
+    return ", ".join("?" * len(values))
 
 # Singleton instance for easy access, configurable
 db = FileSystemDB()
@@ -1,3 +1,4 @@
 from .base import BaseModel
+from .session import SessionRecord, MessageRecord, CheckpointRecord
 
-__all__ = ["BaseModel"]
+__all__ = ["BaseModel", "SessionRecord", "MessageRecord", "CheckpointRecord"]
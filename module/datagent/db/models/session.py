@@ -0,0 +1,34 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text
+from datetime import datetime
+from .base import Base, BaseModel
+
+class SessionRecord(BaseModel):
+    """A workflow session: its state and the number of messages in its history."""
+    __tablename__ = "sessions"
+
+    # Serialized WorkflowContext.state (JSON)
+    state = Column(Text, nullable=False, default="{}")
+    message_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Listing sessions by recency
+        Index("ix_sessions_updated_at", "updated_at"),
+    )
+
+class MessageRecord(Base):
+    """One history entry of a session, the primary key orders a session's messages."""
+    __tablename__ = "messages"
+
+    session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    type = Column(String, nullable=False)
+    # Serialized message (JSON)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CheckpointRecord(BaseModel):
+    """The checkpoint of a session's in-flight run, keyed by session id."""
+    __tablename__ = "checkpoints"
+
+    # Checkpoint document (JSON), see checkpoint_to_document
+    data = Column(Text, nullable=False)
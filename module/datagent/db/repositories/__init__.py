@@ -1,3 +1,5 @@
 from .session import SessionRepository
+from .journal import JournaledSessionRepository
+from .sql import SQLSessionRepository
 
-__all__ = ["SessionRepository"]
+__all__ = ["SessionRepository", "JournaledSessionRepository", "SQLSessionRepository"]
@@ -0,0 +1,232 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import threading
+import uuid
+from ...core.context import WorkflowContext
+from ...core.serialization import serialize, deserialize
+from ..fs import db, FileSystemDB, register_extension
+from ..codecs import DocumentCodec
+from .session import SessionRepository
+
+logger = logging.getLogger(__name__)
+
+# Snapshot key: generation of the journal file holding the changes made after it
+_GENERATION = "journal_generation"
+
+@dataclass
+class _Persisted:
+    """What is on disk for a session, so the next save only writes the difference."""
+    generation: str
+    records: int
+    history_length: int
+    # Identity of the newest persisted history entry, to tell an extended history from another one
+    last_entry: Any
+    state: Dict[str, Any]
+    # Read back from disk: the entries are copies, compared by value
+    recovered: bool = False
+
+class JournaledSessionRepository(SessionRepository):
+    """
+    Session store that appends every save to a per-session journal instead of
+    rewriting the whole session.
+
+    A session is a snapshot (the regular session document plus the generation of
+    its journal) and the journal `<session>.<generation>.log`: one JSON record per
+    save with the new history entries and the changed and removed state keys.
+    After `compact_every` records the session is compacted: a new snapshot is
+    written with a new generation, then the old journal is removed. A crash in
+    between leaves an orphaned journal that is never replayed, since generations
+    are random and never reused.
+
+    What was persisted is remembered for the `max_sessions` most recently used
+    sessions; saving any other session reads its snapshot and journal back first.
+    The first save of a session written without a journal writes a snapshot.
+    Checkpoints are stored as before.
+    """
+
+    def __init__(
+        self,
+        database: FileSystemDB = db,
+        codec: Optional[DocumentCodec] = None,
+        compact_every: int = 100,
+        max_sessions: int = 4096
+    ):
+        super().__init__(database, codec)
+        if compact_every < 1:
+            raise ValueError("compact_every must be at least 1")
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.compact_every = compact_every
+        self.max_sessions = max_sessions
+        self._persisted: "OrderedDict[str, _Persisted]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters for observability
+        self.appends = 0
+        self.snapshots = 0
+        self.recoveries = 0
+
+    def save(self, context: WorkflowContext) -> None:
+        with self._lock:
+            persisted = self._tracked(context.session_id)
+            history = context.history
+            if persisted is None or not self._extends(history, persisted):
+                self._snapshot(context)
+                return
+
+            state = dict(context.state.items())
+            changed = {key: value for key, value in state.items() if persisted.state.get(key, _MISSING) is not value}
+            removed = [key for key in persisted.state if key not in state]
+            new_entries = history[persisted.history_length:]
+            if not (changed or removed or new_entries):
+                return
+
+            if persisted.records + 1 >= self.compact_every:
+                self._snapshot(context)
+                return
+
+            record = {"history": serialize(new_entries)}
+            if changed:
+                record["state"] = serialize(changed)
+            if removed:
+                record["removed"] = removed
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+            self.db.append_raw(self.COLLECTION, context.session_id, line.encode("utf-8"), _journal(persisted.generation))
+
+            persisted.records += 1
+            persisted.history_length = len(history)
+            persisted.last_entry = history[-1] if len(history) else None
+            persisted.state = state
+            persisted.recovered = False
+            self.appends += 1
+
+    def load(self, session_id: str) -> WorkflowContext:
+        with self._lock:
+            data = self._read(self.COLLECTION, session_id)
+            if not data:
+                self._persisted.pop(session_id, None)
+                return WorkflowContext(session_id=session_id)
+
+            generation = data.get(_GENERATION)
+            state = deserialize(data.get("state", {}))
+            history = deserialize(data.get("history", []))
+            records, corrupt = self._replay(session_id, generation, state, history) if generation else (0, False)
+
+            context = WorkflowContext(session_id=data.get("session_id", session_id), state=state, history=history)
+            if not generation:
+                # Written without a journal, the next save starts one with a snapshot
+                self._persisted.pop(session_id, None)
+                return context
+
+            self._remember(context, generation, records)
+            if corrupt:
+                # Continue from a clean snapshot rather than appending after a torn record
+                self._snapshot(context)
+            return context
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            persisted = self._persisted.pop(session_id, None)
+            data = None if persisted else self._read(self.COLLECTION, session_id)
+            generation = persisted.generation if persisted else (data or {}).get(_GENERATION)
+            super().delete(session_id)
+            if generation:
+                self.db.delete(self.COLLECTION, session_id, _journal(generation))
+
+    def compact(self, session_id: str):
+        """Folds the journal of a session into a new snapshot."""
+        context = self.load(session_id)
+        with self._lock:
+            persisted = self._persisted.get(session_id)
+            if persisted is not None and persisted.records:
+                self._snapshot(context)
+
+    def _tracked(self, session_id: str) -> Optional[_Persisted]:
+        """What is persisted of a session, read back from disk when it was forgotten."""
+        persisted = self._persisted.get(session_id)
+        if persisted is not None:
+            self._persisted.move_to_end(session_id)
+            return persisted
+
+        data = self._read(self.COLLECTION, session_id)
+        generation = (data or {}).get(_GENERATION)
+        if not generation:
+            return None
+        state = deserialize(data.get("state", {}))
+        history = deserialize(data.get("history", []))
+        records, corrupt = self._replay(session_id, generation, state, history)
+        self.recoveries += 1
+        persisted = self._remember(WorkflowContext(session_id=session_id, state=state, history=history), generation, records, recovered=True)
+        # After a torn record the save writes a snapshot, which also drops the journal
+        return None if corrupt else persisted
+
+    def _extends(self, history, persisted: _Persisted) -> bool:
+        length = persisted.history_length
+        if len(history) < length:
+            return False
+        if length == 0 or history[length - 1] is persisted.last_entry:
+            return True
+        return persisted.recovered and history[length - 1] == persisted.last_entry
+
+    def _snapshot(self, context: WorkflowContext):
+        generation = uuid.uuid4().hex[:12]
+        previous = self._persisted.get(context.session_id)
+        self._write(self.COLLECTION, context.session_id, {
+            "session_id": context.session_id,
+            "state": serialize(context.state),
+            "history": serialize(context.history),
+            _GENERATION: generation
+        })
+        # Only now that the snapshot no longer points at it
+        if previous is not None:
+            self.db.delete(self.COLLECTION, context.session_id, _journal(previous.generation))
+        self._remember(context, generation, 0)
+        self.snapshots += 1
+
+    def _remember(self, context: WorkflowContext, generation: str, records: int, recovered: bool = False) -> _Persisted:
+        history = context.history
+        persisted = _Persisted(
+            generation=generation,
+            records=records,
+            history_length=len(history),
+            last_entry=history[-1] if len(history) else None,
+            state=dict(context.state.items()),
+            recovered=recovered
+        )
+        self._persisted[context.session_id] = persisted
+        self._persisted.move_to_end(context.session_id)
+        while len(self._persisted) > self.max_sessions:
+            self._persisted.popitem(last=False)
+        return persisted
+
+    def _replay(self, session_id: str, generation: str, state: Dict[str, Any], history: List[Any]) -> Tuple[int, bool]:
+        """Applies the journal on top of the snapshot's state and history. Returns (records, corrupt)."""
+        raw = self.db.load_raw(self.COLLECTION, session_id, _journal(generation))
+        if not raw:
+            return 0, False
+
+        records = 0
+        for line in raw.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn write can only be the last record, nothing after it was acknowledged
+                logger.warning(f"Ignoring corrupt journal record {records + 1} of session {session_id}")
+                return records, True
+            history.extend(deserialize(record.get("history", [])))
+            state.update(deserialize(record.get("state", {})))
+            for key in record.get("removed", ()):
+                state.pop(key, None)
+            records += 1
+        return records, False
+
+_MISSING = object()
+
+def _journal(generation: str) -> str:
+    return f".{generation}.log"
+
+# Journals are named `<session>.<generation>.log`
+register_extension(".log", parts=2)
@@ -1,16 +1,30 @@
 from typing import Optional, List, Any, Dict
+from datetime import datetime
+import logging
 from ...core.context import WorkflowContext
+from ...core.checkpoint import WorkflowCheckpoint
 from ...core.serialization import serialize, deserialize
+from ...agents.schemas import BasePrompt, FileData
 from ..fs import db, FileSystemDB
+from ..codecs import DocumentCodec, BinaryCodec, get_codec
+from ...settings import settings
+
+logger = logging.getLogger(__name__)
+
+# File extensions of every document format, the configured one is tried first
+_EXTENSIONS = (DocumentCodec.extension, BinaryCodec.extension)
 
 class SessionRepository:
     """
     Repository for managing WorkflowContext sessions using FileSystemDB.
     """
     COLLECTION = "sessions"
+    CHECKPOINT_COLLECTION = "checkpoints"
 
-    def __init__(self, database: FileSystemDB = db):
+    def __init__(self, database: FileSystemDB = db, codec: Optional[DocumentCodec] = None):
         self.db = database
+        # Format new documents are written in, documents of either format are read
+        self.codec = codec or get_codec(settings.SESSION_FORMAT)
 
     def save(self, context: WorkflowContext) -> None:
         """Save a workflow context session."""
@@ -19,14 +33,14 @@ class SessionRepository:
             "state": serialize(context.state),
             "history": serialize(context.history)
         }
-        self.db.save(self.COLLECTION, context.session_id, data)
+        self._write(self.COLLECTION, context.session_id, data)
 
     def load(self, session_id: str) -> WorkflowContext:
         """
         Load a workflow context session. 
         Returns a new empty context if not found.
         """
-        data = self.db.load(self.COLLECTION, session_id)
+        data = self._read(self.COLLECTION, session_id)
         if data:
             return WorkflowContext(
                 session_id=data.get("session_id", session_id),
@@ -37,8 +51,109 @@ class SessionRepository:
 
     def delete(self, session_id: str) -> None:
         """Delete a session."""
-        self.db.delete(self.COLLECTION, session_id)
+        self._delete(self.COLLECTION, session_id)
 
     def list_sessions(self) -> List[str]:
         """List all available session IDs."""
-        return self.db.list_ids(self.COLLECTION)
+        return self.db.list_ids(self.COLLECTION, _EXTENSIONS)
+
+    def list_checkpoints(self) -> List[str]:
+        """List the IDs of sessions with a checkpoint."""
+        return self.db.list_ids(self.CHECKPOINT_COLLECTION, _EXTENSIONS)
+
+    def save_checkpoint(self, checkpoint: WorkflowCheckpoint) -> None:
+        """Save the checkpoint of an in-flight run (one per session)."""
+        self._write(self.CHECKPOINT_COLLECTION, checkpoint.session_id, checkpoint_to_document(checkpoint))
+
+    def load_checkpoint(self, session_id: str) -> Optional[WorkflowCheckpoint]:
+        """Load the checkpoint of an interrupted run, None if there is none."""
+        data = self._read(self.CHECKPOINT_COLLECTION, session_id)
+        if not data:
+            return None
+        return checkpoint_from_document(data, session_id)
+
+    def delete_checkpoint(self, session_id: str) -> None:
+        """Delete the checkpoint of a session once its run completed."""
+        self._delete(self.CHECKPOINT_COLLECTION, session_id)
+
+    def migrate(self) -> int:
+        """Rewrites every stored session and checkpoint in the configured format. Returns the number migrated."""
+        migrated = 0
+        for collection in (self.COLLECTION, self.CHECKPOINT_COLLECTION):
+            for doc_id in self.db.list_ids(collection, _EXTENSIONS):
+                if self.db.load_raw(collection, doc_id, self.codec.extension) is not None:
+                    continue
+                data = self._read(collection, doc_id)
+                if data is not None:
+                    self._write(collection, doc_id, data)
+                    migrated += 1
+        return migrated
+
+    def _write(self, collection: str, doc_id: str, data: Dict[str, Any]):
+        self.db.save_raw(collection, doc_id, self.codec.encode(data), self.codec.extension)
+        # A copy in another format is outdated now and must not be read instead
+        for extension in _EXTENSIONS:
+            if extension != self.codec.extension:
+                self.db.delete(collection, doc_id, extension)
+
+    def _read(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        extensions = (self.codec.extension,) + tuple(e for e in _EXTENSIONS if e != self.codec.extension)
+        for extension in extensions:
+            raw = self.db.load_raw(collection, doc_id, extension)
+            if raw is None:
+                continue
+            try:
+                # Either codec decodes documents of every format and version
+                return self.codec.decode(raw)
+            except (ValueError, ImportError) as e:
+                logger.error(f"Failed to decode {collection}/{doc_id}{extension}: {e}")
+                return None
+        return None
+
+    def _delete(self, collection: str, doc_id: str):
+        for extension in _EXTENSIONS:
+            self.db.delete(collection, doc_id, extension)
+
+def checkpoint_to_document(checkpoint: WorkflowCheckpoint) -> Dict[str, Any]:
+    """JSON-compatible document of a checkpoint, shared by the session stores."""
+    prompt = checkpoint.prompt
+    return {
+        "session_id": checkpoint.session_id,
+        "workflow": checkpoint.workflow,
+        "prompt": {
+            "email": prompt.email,
+            "name": prompt.name,
+            "query": prompt.query,
+            "files": [
+                {"filename": f.filename, "url": f.url, "timestamp": f.timestamp.isoformat()}
+                for f in prompt.files
+            ]
+        },
+        "completed": list(checkpoint.completed),
+        "state": serialize(checkpoint.context.state),
+        "history": serialize(checkpoint.context.history)
+    }
+
+def checkpoint_from_document(data: Dict[str, Any], session_id: str) -> WorkflowCheckpoint:
+    """Rebuilds a checkpoint from its document."""
+    prompt_data = data.get("prompt", {})
+    prompt = BasePrompt(
+        email=prompt_data.get("email"),
+        name=prompt_data.get("name"),
+        query=prompt_data.get("query"),
+        files=[
+            FileData(filename=f.get("filename"), url=f.get("url"), timestamp=datetime.fromisoformat(f.get("timestamp")))
+            for f in prompt_data.get("files", [])
+        ]
+    )
+    return WorkflowCheckpoint(
+        session_id=data.get("session_id", session_id),
+        workflow=data.get("workflow"),
+        prompt=prompt,
+        completed=tuple(data.get("completed", [])),
+        context=WorkflowContext(
+            session_id=data.get("session_id", session_id),
+            state=deserialize(data.get("state", {})),
+            history=deserialize(data.get("history", []))
+        )
+    )
@@ -0,0 +1,198 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import threading
+from sqlalchemy import delete, insert, select
+from ...core.context import WorkflowContext
+from ...core.checkpoint import WorkflowCheckpoint
+from ...core.serialization import serialize, deserialize
+from ..base import DBManager, db_manager
+from ..models.base import Base
+from ..models.session import SessionRecord, MessageRecord, CheckpointRecord
+from .session import SessionRepository, checkpoint_to_document, checkpoint_from_document
+
+_TABLES = [SessionRecord.__table__, MessageRecord.__table__, CheckpointRecord.__table__]
+
+class SQLSessionRepository:
+    """
+    Session store in a SQL database (settings.DATABASE_URL): a `sessions` row with
+    the state and one `messages` row per history entry, keyed by session and
+    sequence number. SQLite databases run in WAL mode (see DBManager).
+
+    A save is one transaction that updates the session row and inserts only the
+    messages added since it was last saved; a history that does not extend the
+    persisted one is rewritten. What was persisted is remembered for the
+    `max_sessions` most recently used sessions, for the others the newest stored
+    message is read back. Sessions can be listed by recency and the last N
+    messages loaded without the rest.
+    """
+
+    def __init__(self, manager: DBManager = db_manager, max_sessions: int = 4096):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.manager = manager
+        self.max_sessions = max_sessions
+        Base.metadata.create_all(bind=manager.engine, tables=_TABLES)
+        # session id -> (persisted message count, newest persisted history entry), least recently used first
+        self._persisted: "OrderedDict[str, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters for observability
+        self.appends = 0
+        self.rewrites = 0
+        self.lookups = 0
+
+    def save(self, context: WorkflowContext) -> None:
+        """Save a workflow context session."""
+        session_id = context.session_id
+        history = context.history
+        state = _dumps(serialize(context.state))
+
+        with self._lock, self.manager.SessionLocal() as session, session.begin():
+            record = session.get(SessionRecord, session_id)
+            start = self._persisted_length(session, record, history)
+            if record is None:
+                record = SessionRecord(id=session_id)
+                session.add(record)
+            elif start == 0 and record.message_count:
+                session.execute(delete(MessageRecord).where(MessageRecord.session_id == session_id))
+
+            new_entries = history[start:]
+            if new_entries:
+                session.flush()
+                session.execute(insert(MessageRecord), [
+                    {"session_id": session_id, "seq": seq, "type": type(entry).__name__, "payload": _dumps(serialize(entry))}
+                    for seq, entry in enumerate(new_entries, start)
+                ])
+            record.state = state
+            record.message_count = len(history)
+            record.updated_at = datetime.utcnow()
+
+        self._remember(session_id, history)
+        if start:
+            self.appends += 1
+        else:
+            self.rewrites += 1
+
+    def load(self, session_id: str) -> WorkflowContext:
+        """
+        Load a workflow context session.
+        Returns a new empty context if not found.
+        """
+        with self._lock, self.manager.SessionLocal() as session:
+            record = session.get(SessionRecord, session_id)
+            if record is None:
+                self._persisted.pop(session_id, None)
+                return WorkflowContext(session_id=session_id)
+            payloads = session.scalars(
+                select(MessageRecord.payload).where(MessageRecord.session_id == session_id).order_by(MessageRecord.seq)
+            ).all()
+            context = WorkflowContext(
+                session_id=session_id,
+                state=deserialize(json.loads(record.state)),
+                history=[deserialize(json.loads(payload)) for payload in payloads]
+            )
+            self._remember(session_id, context.history)
+            return context
+
+    def load_history(self, session_id: str, last: Optional[int] = None) -> List[Any]:
+        """The history of a session, only its `last` messages if given, oldest first."""
+        query = select(MessageRecord.payload).where(MessageRecord.session_id == session_id)
+        if last is not None:
+            query = query.order_by(MessageRecord.seq.desc()).limit(last)
+        else:
+            query = query.order_by(MessageRecord.seq)
+        with self.manager.SessionLocal() as session:
+            payloads = session.scalars(query).all()
+        if last is not None:
+            payloads.reverse()
+        return [deserialize(json.loads(payload)) for payload in payloads]
+
+    def delete(self, session_id: str) -> None:
+        """Delete a session."""
+        with self._lock, self.manager.SessionLocal() as session, session.begin():
+            session.execute(delete(MessageRecord).where(MessageRecord.session_id == session_id))
+            session.execute(delete(SessionRecord).where(SessionRecord.id == session_id))
+            self._persisted.pop(session_id, None)
+
+    def list_sessions(self, limit: Optional[int] = None, offset: int = 0) -> List[str]:
+        """List session IDs, the most recently saved first."""
+        query = select(SessionRecord.id).order_by(SessionRecord.updated_at.desc()).offset(offset).limit(limit)
+        with self.manager.SessionLocal() as session:
+            return list(session.scalars(query).all())
+
+    def save_checkpoint(self, checkpoint: WorkflowCheckpoint) -> None:
+        """Save the checkpoint of an in-flight run (one per session)."""
+        data = _dumps(checkpoint_to_document(checkpoint))
+        with self.manager.SessionLocal() as session, session.begin():
+            record = session.get(CheckpointRecord, checkpoint.session_id)
+            if record is None:
+                session.add(CheckpointRecord(id=checkpoint.session_id, data=data))
+            else:
+                record.data = data
+
+    def load_checkpoint(self, session_id: str) -> Optional[WorkflowCheckpoint]:
+        """Load the checkpoint of an interrupted run, None if there is none."""
+        with self.manager.SessionLocal() as session:
+            record = session.get(CheckpointRecord, session_id)
+            data = record.data if record is not None else None
+        if data is None:
+            return None
+        return checkpoint_from_document(json.loads(data), session_id)
+
+    def delete_checkpoint(self, session_id: str) -> None:
+        """Delete the checkpoint of a session once its run completed."""
+        with self.manager.SessionLocal() as session, session.begin():
+            session.execute(delete(CheckpointRecord).where(CheckpointRecord.id == session_id))
+
+    def migrate(self, source: Optional[SessionRepository] = None) -> int:
+        """
+        Imports the sessions and checkpoints of a file-based store (the default
+        FileSystemDB one) that are not in the database yet. Returns the number imported.
+        """
+        source = source or SessionRepository()
+        with self.manager.SessionLocal() as session:
+            sessions = set(session.scalars(select(SessionRecord.id)).all())
+            checkpoints = set(session.scalars(select(CheckpointRecord.id)).all())
+
+        migrated = 0
+        for session_id in source.list_sessions():
+            if session_id not in sessions:
+                self.save(source.load(session_id))
+                migrated += 1
+        for session_id in source.list_checkpoints():
+            if session_id not in checkpoints:
+                checkpoint = source.load_checkpoint(session_id)
+                if checkpoint is not None:
+                    self.save_checkpoint(checkpoint)
+                    migrated += 1
+        return migrated
+
+    def _persisted_length(self, session, record: Optional[SessionRecord], history) -> int:
+        """How many leading history entries are already stored, 0 if they have to be rewritten."""
+        if record is None or not record.message_count or len(history) < record.message_count:
+            return 0
+        length = record.message_count
+        persisted = self._persisted.get(record.id)
+        # Another process may have saved the session since
+        if persisted is not None and persisted[0] == length:
+            return length if history[length - 1] is persisted[1] else 0
+
+        # Not remembered: compare with the newest stored message
+        payload = session.scalar(
+            select(MessageRecord.payload).where(MessageRecord.session_id == record.id, MessageRecord.seq == length - 1)
+        )
+        self.lookups += 1
+        if payload != _dumps(serialize(history[length - 1])):
+            return 0
+        return length
+
+    def _remember(self, session_id: str, history):
+        self._persisted[session_id] = (len(history), history[-1] if len(history) else None)
+        self._persisted.move_to_end(session_id)
+        while len(self._persisted) > self.max_sessions:
+            self._persisted.popitem(last=False)
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple, TypeVar
+import asyncio
+import hashlib
+import json
+import threading
+import weakref
+
+T = TypeVar("T")
+
+class InstancePool:
+    """
+    Shared instances keyed by (type name, config hash) in LRU order, so every caller
+    asking for the same type and config gets the same instance. Holds at most
+    `max_size` instances, evicting the least recently used.
+
+    With `per_loop`, every event loop gets its own instances (and `max_size` applies
+    per loop): async clients bind to the loop they first ran on and fail on any
+    other. Callers outside a running loop get the instances of the synchronous
+    agent API, which runs everything on the shared BackgroundLoop. Instances of a
+    loop are released with it.
+    """
+
+    def __init__(self, max_size: int, per_loop: bool = False):
+        self.max_size = max_size
+        self.per_loop = per_loop
+        # Owning loop (None unless per_loop) -> instances of that loop
+        self._pools: "weakref.WeakKeyDictionary[Any, OrderedDict[Tuple[str, str], Any]]" = weakref.WeakKeyDictionary()
+        self._shared: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, name: str, config: Dict[str, Any], factory: Callable[[], T]) -> T:
+        key = (name, config_hash(config))
+        owner = _owner_loop() if self.per_loop else None
+        with self._lock:
+            instances = self._instances_of(owner)
+            instance = instances.get(key)
+            if instance is not None:
+                instances.move_to_end(key)
+                return instance
+
+        # Construct outside the lock, client setup can be slow
+        instance = factory()
+        with self._lock:
+            instances = self._instances_of(owner)
+            # Another caller may have raced us, keep the first instance
+            instance = instances.setdefault(key, instance)
+            instances.move_to_end(key)
+            while len(instances) > self.max_size:
+                instances.popitem(last=False)
+        return instance
+
+    def _instances_of(self, owner: Any) -> "OrderedDict[Tuple[str, str], Any]":
+        if owner is None:
+            return self._shared
+        instances = self._pools.get(owner)
+        if instances is None:
+            instances = self._pools[owner] = OrderedDict()
+        return instances
+
+    def clear(self):
+        with self._lock:
+            self._shared.clear()
+            self._pools.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._shared) + sum(len(instances) for instances in self._pools.values())
+
+def _owner_loop() -> Any:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        # Imported here, the agents package itself imports this module
+        from .agents.base import background_loop
+        return background_loop.loop
+
+def config_hash(config: Dict[str, Any]) -> str:
+    canonical = json.dumps(config, sort_keys=True, default=repr)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
@@ -5,6 +5,7 @@ from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, Base
 
 from ..base import BaseLLM, LLMResponse, StreamingChunk
 from ..registry import LLMRegistry
+from ...core.profiler import span, profile_stream
 from ...settings import settings
 
 @LLMRegistry.register("groq")
@@ -37,7 +38,8 @@ class GroqLLM(BaseLLM):
         return await self.generate_chat([{"role": "user", "content": prompt}], **kwargs)
 
     async def generate_chat(self, messages: List[Dict[str, str]], **kwargs) -> LLMResponse:
-        response = await self.client.ainvoke(messages, **kwargs)
+        with span("llm.chat", "llm", provider="groq", model=self.model):
+            response = await self.client.ainvoke(messages, **kwargs)
         
         usage = response.response_metadata.get("token_usage")
         tool_calls = None
@@ -56,7 +58,8 @@ class GroqLLM(BaseLLM):
 
     async def generate_chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[StreamingChunk]:
         lc_messages = self._convert_messages(messages)
-        async for chunk in self.client.astream(lc_messages, **kwargs):
+        stream = profile_stream(self.client.astream(lc_messages, **kwargs), "llm.stream", "llm", provider="groq", model=self.model)
+        async for chunk in stream:
             content = str(chunk.content) if chunk.content else None
             
             tool_calls = None
@@ -6,6 +6,7 @@ from langchain_core.outputs import ChatGenerationChunk
 
 from ..base import BaseLLM, LLMResponse, StreamingChunk
 from ..registry import LLMRegistry
+from ...core.profiler import span, profile_stream
 from ...settings import settings
 
 @LLMRegistry.register("openai")
@@ -41,7 +42,8 @@ class OpenAILLM(BaseLLM):
     async def generate_chat(self, messages: List[Dict[str, str]], **kwargs) -> LLMResponse:
         lc_messages = self._convert_messages(messages)
         # LangChain's ainvoke returns an AIMessage
-        response = await self.client.ainvoke(lc_messages, **kwargs)
+        with span("llm.chat", "llm", provider="openai", model=self.model):
+            response = await self.client.ainvoke(lc_messages, **kwargs)
         
         # Extract usage if available (LangChain often puts it in response_metadata)
         usage = response.response_metadata.get("token_usage")
@@ -63,7 +65,8 @@ class OpenAILLM(BaseLLM):
 
     async def generate_chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[StreamingChunk]:
         lc_messages = self._convert_messages(messages)
-        async for chunk in self.client.astream(lc_messages, **kwargs):
+        stream = profile_stream(self.client.astream(lc_messages, **kwargs), "llm.stream", "llm", provider="openai", model=self.model)
+        async for chunk in stream:
             content = str(chunk.content) if chunk.content else None
             
             # Map tool call chunks if present
@@ -0,0 +1,78 @@
+from typing import Any, AsyncIterator, Dict, List
+from .base import BaseLLM, LLMResponse, StreamingChunk
+from ..core.middleware import MiddlewarePipeline
+
+class PipelinedLLM(BaseLLM):
+    """
+    Wraps a client so its calls run through a middleware chain composed once per
+    client. For streams the chain covers opening the stream up to its first chunk,
+    which is where rate limits and connection errors surface; chunks after that
+    are passed through untouched.
+    """
+
+    def __init__(self, llm: BaseLLM, pipeline: MiddlewarePipeline, provider: str):
+        super().__init__(llm.model, llm.api_key, **llm.kwargs)
+        self.inner = llm
+        self.provider = provider
+        self._chat = pipeline.build(self._call_chat)
+        self._open = pipeline.build(self._open_stream)
+
+    def __getattr__(self, name: str) -> Any:
+        # Provider specific attributes (e.g. `client`) of the wrapped client
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    async def generate(self, prompt: str, **kwargs) -> LLMResponse:
+        return await self.generate_chat([{"role": "user", "content": prompt}], **kwargs)
+
+    async def generate_chat(self, messages: List[Dict[str, str]], **kwargs) -> LLMResponse:
+        return await self._chat(self._call("llm.chat", messages, kwargs))
+
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[StreamingChunk]:
+        async for chunk in self.generate_chat_stream([{"role": "user", "content": prompt}], **kwargs):
+            yield chunk
+
+    async def generate_chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[StreamingChunk]:
+        stream = await self._open(self._call("llm.stream", messages, kwargs))
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def _call(self, name: str, messages: List[Dict[str, str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "kind": "llm",
+            "name": name,
+            "provider": self.provider,
+            "model": self.model,
+            "messages": messages,
+            "kwargs": kwargs
+        }
+
+    async def _call_chat(self, call: Dict[str, Any]) -> LLMResponse:
+        return await self.inner.generate_chat(call["messages"], **call["kwargs"])
+
+    async def _open_stream(self, call: Dict[str, Any]) -> AsyncIterator[StreamingChunk]:
+        stream = self.inner.generate_chat_stream(call["messages"], **call["kwargs"])
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            return _empty()
+        except BaseException:
+            await stream.aclose()
+            raise
+        return _prepend(first, stream)
+
+async def _prepend(first: StreamingChunk, stream: AsyncIterator[StreamingChunk]) -> AsyncIterator[StreamingChunk]:
+    try:
+        yield first
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
+
+async def _empty() -> AsyncIterator[StreamingChunk]:
+    return
+    yield
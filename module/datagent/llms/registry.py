@@ -1,9 +1,18 @@
-from typing import Dict, Type
+from typing import Any, Dict, Type, Optional
 from .base import BaseLLM
+from ..core.middleware import MiddlewarePipeline
+from ..instance_pool import InstancePool
 
 class LLMRegistry:
     _registry: Dict[str, Type[BaseLLM]] = {}
 
+    # Shared clients keyed by provider and config, per event loop as their
+    # HTTP connection pools are bound to the loop they first ran on
+    _pool = InstancePool(max_size=64, per_loop=True)
+
+    # Chain every acquired client's calls run through, None for plain clients
+    _middleware: Optional[MiddlewarePipeline] = None
+
     @classmethod
     def register(cls, provider_name: str):
         def decorator(llm_cls: Type[BaseLLM]):
@@ -16,3 +25,36 @@ class LLMRegistry:
         if provider not in cls._registry:
             raise ValueError(f"LLM provider {provider} not found")
         return cls._registry[provider](**kwargs)
+
+    @classmethod
+    def acquire(cls, provider: str, **kwargs) -> BaseLLM:
+        """
+        Returns a shared client for the given provider and config, so every agent
+        using the same model reuses one client and its HTTP connection pool.
+        Clients are shared within the running event loop only (see InstancePool).
+        """
+        if provider not in cls._registry:
+            raise ValueError(f"LLM provider {provider} not found")
+
+        return cls._pool.get_or_create(provider, kwargs, lambda: cls._create(provider, kwargs))
+
+    @classmethod
+    def _create(cls, provider: str, config: Dict[str, Any]) -> BaseLLM:
+        llm = cls._registry[provider](**config)
+        if cls._middleware:
+            from .pipeline import PipelinedLLM
+            llm = PipelinedLLM(llm, cls._middleware, provider)
+        return llm
+
+    @classmethod
+    def use_middleware(cls, pipeline: Optional[MiddlewarePipeline]):
+        """
+        Sets the middleware chain of all clients handed out by `acquire` from now on.
+        Pooled clients are dropped so none keeps running through the previous chain.
+        """
+        cls._middleware = pipeline
+        cls.clear_pool()
+
+    @classmethod
+    def clear_pool(cls):
+        cls._pool.clear()
@@ -22,6 +22,45 @@ class Settings(BaseSettings):
     
     # Storage
     STORAGE_ROOT: str = "module/datagent/db/storage"
+    # Format sessions and checkpoints are written in: "json" or "binary" (both are read)
+    SESSION_FORMAT: str = "json"
+    # "document" rewrites a session on every save, "journal" appends what changed,
+    # "sql" stores sessions and their messages in the DATABASE_URL database
+    SESSION_STORE: str = "document"
+    # Journal records after which a session is compacted into a new snapshot
+    SESSION_JOURNAL_COMPACT_EVERY: int = 100
+    # Sessions whose persisted length the journal and sql stores remember, so that
+    # their saves write only what changed; a forgotten session is read back on save
+    SESSION_TRACKED_MAX: int = 4096
+    # Estimated bytes of recently used sessions kept in memory, 0 disables the cache.
+    # Set it to 0 when several processes serve the same sessions (uvicorn --workers,
+    # replicas sharing a store), the cache does not see the saves of other processes
+    SESSION_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # Seconds a session save waits before it is written, so the saves of a run coalesce
+    SESSION_FLUSH_INTERVAL: float = 0.5
+
+    # Streaming (flow control between agents and clients)
+    STREAM_HIGH_WATER: int = 256
+    STREAM_LOW_WATER: Optional[int] = None
+    STREAM_TEXT_POLICY: str = "coalesce"
+    # Text chunk batching before transports, 0 disables
+    STREAM_COALESCE_MS: int = 30
+    STREAM_COALESCE_MAX_BYTES: int = 4096
+
+    # Node result cache (nodes with a `cache:` block), no disk tier when unset
+    NODE_CACHE_MAX_ENTRIES: int = 1024
+    NODE_CACHE_DIR: Optional[str] = None
+
+    # Key/value state: "memory" (unbounded), "lru" (bounded, in memory) or "sqlite"
+    STATE_BACKEND: str = "lru"
+    STATE_MAX_ENTRIES: int = 10000
+    STATE_MAX_BYTES: Optional[int] = None
+    # Seconds until a state key expires, None for no expiry
+    STATE_TTL: Optional[float] = None
+    STATE_DB_PATH: str = "module/datagent/db/state.db"
+
+    # Comma separated middleware every LLM call runs through, e.g. "timing,retry"
+    LLM_MIDDLEWARE: str = ""
 
     model_config = SettingsConfigDict(
         env_file=".env",
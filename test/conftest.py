@@ -0,0 +1,77 @@
+import asyncio
+from dataclasses import dataclass
+
+import pytest
+
+from datagent.agents.base import BaseAgent
+from datagent.agents.registry import AgentRegistry
+from datagent.agents.schemas import AgentInput, AgentOutput, AgentOutputEvent, BasePrompt, ContextUpdateEvent, TextChunkEvent
+from datagent.core.yaml_workflow_loader import WorkflowDefinition, WorkflowNode
+
+@dataclass(frozen=True, kw_only=True)
+class EchoOutput(AgentOutput):
+    value: str = ""
+
+@AgentRegistry.register("test_echo")
+class EchoAgent(BaseAgent):
+    """Streams a few chunks, then outputs its `value` config (its node id by default)."""
+    poolable = True
+    input_type = AgentInput
+    output_type = EchoOutput
+
+    def __init__(self, agent_id: str, **kwargs):
+        super().__init__(agent_id, **kwargs)
+
+    async def a_run(self, input_data: AgentInput) -> EchoOutput:
+        return self._output(input_data)
+
+    async def a_stream(self, input_data: AgentInput):
+        for k in range(self.config.get("chunks", 2)):
+            await asyncio.sleep(self.config.get("delay", 0))
+            yield TextChunkEvent(session_id=input_data.session_id, agent_name=self.name, content=f"{self.name}:{k} ")
+        if self.config.get("fail"):
+            raise RuntimeError(f"{self.name} failed")
+        if self.config.get("update"):
+            # Sets the state variable named by `update` to the node id
+            yield ContextUpdateEvent(session_id=input_data.session_id, agent_name=self.name, context={self.config["update"]: self.name})
+        yield AgentOutputEvent(session_id=input_data.session_id, agent_name=self.name, output=self._output(input_data))
+
+    def _output(self, input_data: AgentInput) -> EchoOutput:
+        return EchoOutput(session_id=input_data.session_id, content=self.name, value=self.config.get("value", self.name))
+
+@AgentRegistry.register("test_counter")
+class CounterAgent(BaseAgent):
+    """Outputs "again" until it has run `times` times in the session history, then "done"."""
+    poolable = True
+    input_type = AgentInput
+    output_type = EchoOutput
+
+    def __init__(self, agent_id: str, **kwargs):
+        super().__init__(agent_id, **kwargs)
+
+    async def a_run(self, input_data: AgentInput) -> EchoOutput:
+        count = sum(1 for entry in input_data.history if getattr(entry, "content", None) == "count") + 1
+        return EchoOutput(
+            session_id=input_data.session_id,
+            content="count",
+            value="done" if count >= self.config.get("times", 3) else "again"
+        )
+
+    async def a_stream(self, input_data: AgentInput):
+        yield AgentOutputEvent(session_id=input_data.session_id, agent_name=self.name, output=await self.a_run(input_data))
+
+def node(id: str, **kwargs) -> WorkflowNode:
+    return WorkflowNode(id=id, **kwargs)
+
+def workflow(*nodes: WorkflowNode, start: str = None, **kwargs) -> WorkflowDefinition:
+    return WorkflowDefinition(name="test", nodes={n.id: n for n in nodes}, start_node=start or nodes[0].id, **kwargs)
+
+@pytest.fixture
+def prompt() -> BasePrompt:
+    return BasePrompt(name="tester", email="tester@example.com", query="hi")
+
+@pytest.fixture(autouse=True)
+def fresh_agent_pool():
+    AgentRegistry.clear_pool()
+    yield
+    AgentRegistry.clear_pool()
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import pytest
+
+from conftest import EchoAgent
+from datagent.agents.base import background_loop
+from datagent.agents.registry import AgentRegistry
+from datagent.agents.schemas import AgentInput, AgentOutputEvent, TextChunkEvent
+
+class LoopRecorder(EchoAgent):
+    """An EchoAgent remembering the loops it ran on and whether its streams were closed."""
+
+    def __init__(self, agent_id: str, **kwargs):
+        super().__init__(agent_id, **kwargs)
+        self.loops = []
+        self.closed = 0
+
+    async def a_run(self, input_data):
+        self.loops.append(asyncio.get_running_loop())
+        return await super().a_run(input_data)
+
+    async def a_stream(self, input_data):
+        self.loops.append(asyncio.get_running_loop())
+        try:
+            async for event in super().a_stream(input_data):
+                yield event
+        finally:
+            self.closed += 1
+
+@pytest.fixture
+def agent_input(prompt):
+    return AgentInput(session_id="s", content="hi", prompt=prompt)
+
+def test_sync_run_uses_one_background_loop(agent_input):
+    agent = LoopRecorder("a", value="x")
+    assert agent.run(agent_input).value == "x"
+    assert agent.run(agent_input).value == "x"
+    assert agent.loops == [background_loop.loop] * 2
+
+def test_sync_stream(agent_input):
+    agent = LoopRecorder("a", chunks=3)
+    events = list(agent.stream(agent_input))
+    assert [event.content for event in events if isinstance(event, TextChunkEvent)] == ["a:0 ", "a:1 ", "a:2 "]
+    assert isinstance(events[-1], AgentOutputEvent) and agent.closed == 1
+
+def test_stopping_a_sync_stream_early_closes_it(agent_input):
+    agent = LoopRecorder("a", chunks=5)
+    stream = agent.stream(agent_input)
+    assert next(stream).content == "a:0 "
+    stream.close()
+    assert agent.closed == 1
+
+def test_sync_errors_propagate(agent_input):
+    agent = LoopRecorder("a", fail=True)
+    with pytest.raises(RuntimeError, match="a failed"):
+        list(agent.stream(agent_input))
+    assert agent.closed == 1
+
+def test_sync_run_inside_a_running_loop(agent_input):
+    agent = LoopRecorder("a", value="x", chunks=2)
+
+    async def caller():
+        # Blocks this loop, but the agent runs on the background loop, not this one
+        output = agent.run(agent_input)
+        events = list(agent.stream(agent_input))
+        return asyncio.get_running_loop(), output, events
+
+    caller_loop, output, events = asyncio.run(caller())
+    assert output.value == "x" and len(events) == 3
+    assert agent.loops == [background_loop.loop] * 2 and caller_loop not in agent.loops
+
+def test_background_loop_refuses_to_block_itself():
+    async def nested():
+        return background_loop.run(asyncio.sleep(0))
+
+    with pytest.raises(RuntimeError, match="background loop itself"):
+        background_loop.run(nested())
+    assert background_loop.run(asyncio.sleep(0, "still running")) == "still running"
+
+def test_pooled_agents_belong_to_their_loop():
+    async def acquire():
+        first = AgentRegistry.acquire("test_echo", agent_id="a")
+        assert AgentRegistry.acquire("test_echo", agent_id="a") is first
+        return first
+
+    in_one_loop = asyncio.run(acquire())
+    in_another_loop = asyncio.run(acquire())
+    assert in_one_loop is not in_another_loop
+
+    # Outside a loop, the instance of the sync API's background loop
+    sync = AgentRegistry.acquire("test_echo", agent_id="a")
+    assert sync not in (in_one_loop, in_another_loop)
+    assert background_loop.run(acquire()) is sync
+
+def test_pooled_agents_are_shared_across_threads_outside_a_loop():
+    agents = []
+    threads = [threading.Thread(target=lambda: agents.append(AgentRegistry.acquire("test_echo", agent_id="a"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(agents) == 4 and all(agent is agents[0] for agent in agents)
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from conftest import EchoOutput, node, workflow
+from datagent.agents.registry import AgentRegistry
+from datagent.core.checkpoint import WorkflowCheckpoint
+from datagent.core.context import WorkflowContext
+from datagent.core.storage import SessionStorage
+from datagent.core.workflow_executor import WorkflowExecutor
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SessionStorage(storage_dir=str(tmp_path), flush_interval=0)
+    yield storage
+    storage.close()
+
+def cycle():
+    return workflow(
+        node("counter", agent_name="test_counter", next_nodes=["route"], config={"times": 3}),
+        node("route", type="router", condition="$counter.value", routes={"again": "counter", "done": "end"}),
+        node("end", type="end"),
+        timeout=5
+    )
+
+def counts(context):
+    return sum(1 for entry in context.history if getattr(entry, "content", None) == "count")
+
+def test_cycle_runs_with_a_checkpointer(prompt, storage):
+    executor = WorkflowExecutor(cycle(), checkpointer=storage)
+    context = asyncio.run(executor.run(prompt, WorkflowContext(session_id="s")))
+
+    assert counts(context) == 3
+    assert context.state["counter"].value == "done"
+    # The run completed, nothing left to resume
+    assert storage.load_checkpoint("s") is None
+
+def test_resume_skips_completed_nodes_once(prompt, storage):
+    calls = []
+    agent_cls = AgentRegistry._registry["test_echo"]
+
+    class FlakyEcho(agent_cls):
+        async def a_stream(self, input_data):
+            calls.append(self.name)
+            if self.name == "c" and calls.count("c") == 1:
+                raise RuntimeError("crash")
+            async for event in super().a_stream(input_data):
+                yield event
+
+    AgentRegistry._registry["test_flaky"] = FlakyEcho
+    try:
+        definition = workflow(
+            node("a", agent_name="test_flaky", next_nodes=["b"]),
+            node("b", agent_name="test_flaky", next_nodes=["c"]),
+            node("c", agent_name="test_flaky", next_nodes=["end"]),
+            node("end", type="end")
+        )
+        executor = WorkflowExecutor(definition, checkpointer=storage)
+        with pytest.raises(RuntimeError):
+            asyncio.run(executor.run(prompt, WorkflowContext(session_id="s")))
+        assert storage.load_checkpoint("s").completed == ("a", "b")
+
+        context = asyncio.run(executor.resume("s"))
+    finally:
+        del AgentRegistry._registry["test_flaky"]
+
+    assert calls == ["a", "b", "c", "c"]
+    assert [entry.content for entry in context.history if isinstance(entry, EchoOutput)] == ["a", "b", "c"]
+    assert storage.load_checkpoint("s") is None
+
+def test_resumed_cycle_runs_again_after_replayed_visits(prompt, storage):
+    executor = WorkflowExecutor(cycle(), checkpointer=storage)
+    context = asyncio.run(executor.run(prompt, WorkflowContext(session_id="s")))
+    # Pretend the run was interrupted after the first two counter visits
+    partial = WorkflowContext(
+        session_id="s",
+        state={"counter": context.state["counter"]},
+        history=[entry for entry in context.history if getattr(entry, "content", None) != "count"][:1]
+    )
+    first = [entry for entry in context.history if getattr(entry, "content", None) == "count"][:2]
+    for entry in first:
+        partial = partial.add_history(entry)
+    partial = partial.update({"counter": first[-1]})
+    storage.save_checkpoint(WorkflowCheckpoint(
+        session_id="s", workflow=executor.plan.name, prompt=prompt, completed=("counter", "counter"), context=partial
+    ))
+
+    resumed = asyncio.run(executor.resume("s"))
+
+    # Both checkpointed visits are replayed, the third one runs
+    assert counts(resumed) == 3
+    assert resumed.state["counter"].value == "done"
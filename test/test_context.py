@@ -0,0 +1,46 @@
+import random
+
+from datagent.core.context import ChainedState, History
+
+def depth(state):
+    layers = 0
+    while state is not None:
+        layers += 1
+        state = state._parent
+    return layers
+
+def test_chained_state_matches_a_dict_across_merges():
+    rng = random.Random(7)
+    state, expected = ChainedState({"base": 0}), {"base": 0}
+    versions = []
+    for step in range(2000):
+        updates = {f"k{rng.randrange(300)}": step for _ in range(rng.choice((1, 1, 1, 5, 40)))}
+        state = state.set_many(updates)
+        expected.update(updates)
+        versions.append((state, dict(expected)))
+
+        assert len(state) == len(expected)
+        assert depth(state) <= len(expected).bit_length() + 1
+
+    for version, snapshot in versions[::97]:
+        # Older versions keep their own values after later layers were merged
+        assert dict(version.items()) == snapshot
+        assert all(version[key] == value for key, value in snapshot.items())
+        assert "missing" not in version and version.get("missing", 1) == 1
+
+def test_newer_layers_shadow_older_ones():
+    state = ChainedState({f"k{i}": "old" for i in range(1000)})
+    for i in range(50):
+        state = state.set_many({"k0": i})
+    shadowed = state.set_many({"k1": "new"})
+    assert (shadowed["k0"], shadowed["k1"], shadowed["k2"]) == (49, "new", "old")
+    assert state["k1"] == "old"
+    assert len(shadowed) == 1000 and shadowed.copy()["k1"] == "new"
+    # A small update never copies the large layer at the bottom
+    assert depth(shadowed) <= 3
+    assert state.set_many({}) is state
+
+def test_history_branches_do_not_see_each_other():
+    base = History(["a"])
+    left, right = base.append("l"), base.append("r")
+    assert list(left) == ["a", "l"] and list(right) == ["a", "r"] and list(base) == ["a"]
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from datagent.core.dependency_injection import SESSION, SINGLETON, TRANSIENT, Container
+
+def run(coro):
+    return asyncio.run(coro)
+
+class Service:
+    def __init__(self, name="service"):
+        self.name = name
+
+class Other(Service):
+    pass
+
+class Third(Service):
+    pass
+
+def test_scopes():
+    container = Container()
+    container.register_factory(Service, Service, scope=SINGLETON)
+    container.register_factory(Other, Other, scope=SESSION)
+    container.register_factory(Third, Third, scope=TRANSIENT)
+
+    assert container.resolve(Service) is container.resolve(Service)
+    assert container.resolve(Other, "a") is container.resolve(Other, "a")
+    assert container.resolve(Other, "a") is not container.resolve(Other, "b")
+    assert container.resolve(Third) is not container.resolve(Third)
+    with pytest.raises(ValueError):
+        container.resolve(Other)
+    with pytest.raises(ValueError):
+        container.resolve(int)
+
+def test_concurrent_async_resolves_share_one_creation():
+    container = Container()
+    created = []
+
+    async def factory():
+        created.append(1)
+        await asyncio.sleep(0.05)
+        return Service()
+
+    container.register_factory(Service, factory, scope=SINGLETON)
+
+    async def resolve_all():
+        return await asyncio.gather(*(container.aresolve(Service) for _ in range(10)))
+
+    instances = run(resolve_all())
+    assert len(created) == 1 and all(instance is instances[0] for instance in instances)
+    # Created now, so sync resolve returns it too
+    assert container.resolve(Service) is instances[0]
+
+def test_concurrent_resolves_across_threads_and_loops():
+    container = Container()
+    created = []
+
+    def factory():
+        created.append(1)
+        time.sleep(0.05)
+        return Service()
+
+    container.register_factory(Service, factory, scope=SINGLETON)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(run(container.aresolve(Service)))) for _ in range(4)]
+    threads += [threading.Thread(target=lambda: results.append(container.resolve(Service))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and len(results) == 8
+    assert all(result is results[0] for result in results)
+
+def test_failed_creation_is_retried():
+    container = Container()
+    attempts = []
+
+    async def factory():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("not yet")
+        return Service()
+
+    container.register_factory(Service, factory, scope=SINGLETON)
+
+    async def resolve_all():
+        return await asyncio.gather(container.aresolve(Service), container.aresolve(Service), return_exceptions=True)
+
+    # The waiting caller gets the first attempt's error as well
+    assert all(isinstance(result, RuntimeError) for result in run(resolve_all()))
+    assert isinstance(run(container.aresolve(Service)), Service)
+    with pytest.raises(ValueError):
+        Container().register_factory(Service, factory, scope="request")
+
+def test_async_factory_needs_aresolve():
+    container = Container()
+
+    async def factory():
+        return Service()
+
+    container.register_factory(Service, factory, scope=SINGLETON)
+    with pytest.raises(ValueError):
+        container.resolve(Service)
+
+def test_shutdown_disposes_sessions_then_singletons_newest_first():
+    container = Container()
+    disposed = []
+
+    async def dispose_async(instance):
+        disposed.append(instance.name)
+
+    container.register_factory(Service, lambda: Service("first"), scope=SINGLETON, dispose=lambda s: disposed.append(s.name))
+    container.register_factory(Other, lambda: Other("second"), scope=SINGLETON, dispose=dispose_async, eager=True)
+    container.register_factory(Third, lambda: Third("session"), scope=SESSION, dispose=lambda s: disposed.append(s.name))
+    container.on_shutdown(lambda: disposed.append("hook"))
+
+    async def lifecycle():
+        await container.startup()
+        container.resolve(Service)
+        container.resolve(Third, "a")
+        container.resolve(Third, "b")
+        await container.end_session("a")
+        assert disposed == ["session"]
+        await container.shutdown()
+
+    run(lifecycle())
+    # "second" is eager, created at startup before "first"
+    assert disposed == ["session", "session", "first", "second", "hook"]
+
+def test_re_registering_a_live_service_is_refused():
+    container = Container()
+    disposed = []
+    container.register_factory(Service, lambda: Service("old"), scope=SINGLETON, dispose=lambda s: disposed.append(s.name))
+    # Nothing created yet, so it can still be replaced
+    container.register_factory(Service, lambda: Service("first"), scope=SINGLETON, dispose=lambda s: disposed.append(s.name))
+    assert container.resolve(Service).name == "first"
+
+    with pytest.raises(ValueError):
+        container.register_factory(Service, lambda: Service("new"), scope=SINGLETON)
+    container.register_factory(Other, Other, scope=SESSION)
+    container.resolve(Other, "a")
+    with pytest.raises(ValueError):
+        container.register_factory(Other, Other, scope=SESSION)
+
+    run(container.shutdown())
+    assert disposed == ["first"]
+    container.register_factory(Service, lambda: Service("new"), scope=SINGLETON)
+    assert container.resolve(Service).name == "new"
@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import pytest
+
+from datagent.core.event_bus import ALL_EVENTS, OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, EventBus, Subscription
+
+def run(coro):
+    return asyncio.run(coro)
+
+class SlowHandler:
+    """Records payloads, blocking on each until released."""
+
+    def __init__(self):
+        self.received = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, payload):
+        await self.release.wait()
+        self.received.append(payload)
+
+async def publish_to_slow_subscriber(overflow):
+    bus = EventBus()
+    handler = SlowHandler()
+    subscription = bus.subscribe_queued("e", handler, max_queue=2, overflow=overflow)
+    await bus.publish("e", 1)
+    # Let the worker take event 1 and block on it, the queue is empty again
+    await asyncio.sleep(0)
+    await bus.publish("e", 2)
+    await bus.publish("e", 3)
+    return bus, handler, subscription
+
+@pytest.mark.parametrize("overflow, expected", [
+    (OVERFLOW_DROP_NEWEST, [1, 2, 3]),
+    (OVERFLOW_DROP_OLDEST, [1, 4, 5])
+])
+def test_dropping_overflow_policies(overflow, expected):
+    async def scenario():
+        bus, handler, subscription = await publish_to_slow_subscriber(overflow)
+        started = time.monotonic()
+        await bus.publish("e", 4)
+        await bus.publish("e", 5)
+        # A full queue never makes the publisher wait with these policies
+        assert time.monotonic() - started < 0.05
+        assert subscription.lag == 2 and subscription.max_lag == 2
+        handler.release.set()
+        await bus.close()
+        return handler.received, subscription.stats()
+
+    received, stats = run(scenario())
+    assert received == expected
+    assert stats["published"] == 5 and stats["delivered"] == 3 and stats["dropped"] == 2
+
+def test_block_policy_applies_backpressure():
+    async def scenario():
+        bus, handler, subscription = await publish_to_slow_subscriber(OVERFLOW_BLOCK)
+        publish = asyncio.ensure_future(bus.publish("e", 4))
+        await asyncio.sleep(0.05)
+        assert not publish.done() and subscription.lag == 2
+        handler.release.set()
+        await publish
+        await bus.publish("e", 5)
+        await bus.close()
+        return handler.received, subscription
+
+    received, subscription = run(scenario())
+    assert received == [1, 2, 3, 4, 5]
+    assert subscription.dropped == 0 and subscription.delivered == 5
+
+def test_slow_subscriber_does_not_delay_the_others():
+    async def scenario():
+        bus = EventBus()
+        slow = SlowHandler()
+        fast = []
+        bus.subscribe_queued("e", slow, max_queue=1, overflow=OVERFLOW_DROP_NEWEST)
+        bus.subscribe_queued(ALL_EVENTS, fast.append)
+        await bus.publish("e", 0)
+        await asyncio.sleep(0)
+        for i in range(1, 5):
+            await bus.publish("e", i)
+        await asyncio.sleep(0.01)
+        assert fast == [0, 1, 2, 3, 4] and slow.received == []
+        slow.release.set()
+        await bus.close()
+        return slow.received
+
+    assert run(scenario()) == [0, 1]
+
+def test_batches_fill_up_to_batch_size():
+    async def scenario():
+        bus = EventBus()
+        batches = []
+        bus.subscribe_queued("e", batches.append, batch_size=3, batch_interval=0.05)
+        for i in range(7):
+            await bus.publish("e", i)
+        await bus.close()
+        return batches
+
+    assert run(scenario()) == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_partial_batch_is_flushed_after_batch_interval():
+    async def scenario():
+        bus = EventBus()
+        batches = []
+        subscription = bus.subscribe_queued("e", batches.append, batch_size=10, batch_interval=0.1)
+        await bus.publish("e", 0)
+        await asyncio.sleep(0.02)
+        await bus.publish("e", 1)
+        await asyncio.sleep(0.03)
+        # Still within the interval of the batch started by event 0
+        assert batches == []
+        await asyncio.sleep(0.1)
+        assert batches == [[0, 1]]
+        # Lower bound only, the upper one depends on the scheduler
+        assert subscription.last_delay >= 0.1
+        await bus.close()
+
+    run(scenario())
+
+def test_batch_without_interval_takes_what_is_queued():
+    async def scenario():
+        bus = EventBus()
+        batches = []
+        bus.subscribe_queued("e", batches.append, batch_size=10)
+        await bus.publish("e", 0)
+        await asyncio.sleep(0.01)
+        await bus.publish("e", 1)
+        await bus.publish("e", 2)
+        await bus.close()
+        return batches
+
+    assert run(scenario()) == [[0], [1, 2]]
+
+def test_failing_handler_is_counted_and_delivery_goes_on():
+    async def scenario():
+        bus = EventBus()
+        received = []
+
+        def handler(payload):
+            if payload == 1:
+                raise RuntimeError("boom")
+            received.append(payload)
+
+        subscription = bus.subscribe_queued("e", handler)
+        for i in range(3):
+            await bus.publish("e", i)
+        await bus.close()
+        return received, subscription
+
+    received, subscription = run(scenario())
+    assert received == [0, 2] and subscription.failed == 1 and subscription.delivered == 2
+
+def test_subscription_options_are_validated():
+    with pytest.raises(ValueError):
+        Subscription("e", print, overflow="drop_all")
+    with pytest.raises(ValueError):
+        Subscription("e", print, max_queue=0)
+    with pytest.raises(ValueError):
+        Subscription("e", print, batch_size=0)
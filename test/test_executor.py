@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from conftest import EchoOutput, node, workflow
+from datagent.agents.schemas import BasePrompt, FileData, TextChunkEvent
+from datagent.core.context import WorkflowContext
+from datagent.core.streaming import ITEM_INDEX, ChunkCoalescer
+from datagent.core.workflow_executor import WorkflowCancelledError, WorkflowExecutor, cancel_run
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_fan_out_branches_merge_at_join(prompt):
+    definition = workflow(
+        node("a", agent_name="test_echo", next_nodes=["b", "c"]),
+        node("b", agent_name="test_echo", next_nodes=["j"], config={"delay": 0.02}),
+        node("c", agent_name="test_echo", next_nodes=["j"]),
+        node("j", type="join", next_nodes=["d"]),
+        node("d", agent_name="test_echo", next_nodes=["end"]),
+        node("end", type="end")
+    )
+    context = run(WorkflowExecutor(definition).run(prompt, WorkflowContext(session_id="s")))
+
+    assert {"a", "b", "c", "d"} <= set(context.state)
+    assert context.state["b"].value == "b" and context.state["c"].value == "c"
+    contents = [entry.content for entry in context.history if isinstance(entry, EchoOutput)]
+    # Each node's output once, both branches before the join's successor
+    assert sorted(contents) == ["a", "b", "c", "d"]
+    assert contents[0] == "a" and contents[-1] == "d"
+
+def test_branches_run_concurrently(prompt):
+    definition = workflow(
+        node("a", agent_name="test_echo", next_nodes=["b", "c"], config={"chunks": 0}),
+        node("b", agent_name="test_echo", next_nodes=["j"], config={"delay": 0.1}),
+        node("c", agent_name="test_echo", next_nodes=["j"], config={"delay": 0.1}),
+        node("j", type="join", next_nodes=["end"]),
+        node("end", type="end")
+    )
+    started = time.perf_counter()
+    run(WorkflowExecutor(definition).run(prompt, WorkflowContext(session_id="s")))
+    elapsed = time.perf_counter() - started
+    # Two chunks of 0.1s per branch, sequential branches would take 0.4s
+    assert elapsed < 0.35
+
+def test_no_deadline_unless_configured():
+    definition = workflow(node("a", agent_name="test_echo", next_nodes=["end"]), node("end", type="end"))
+    assert WorkflowExecutor(definition).plan.timeout is None
+    definition.timeout = 0
+    assert WorkflowExecutor(definition).plan.timeout is None
+    definition.timeout = 5
+    assert WorkflowExecutor(definition).plan.timeout == 5
+
+def test_deadline_cancels_the_run(prompt):
+    definition = workflow(
+        node("a", agent_name="test_echo", next_nodes=["end"], config={"delay": 1}),
+        node("end", type="end")
+    )
+
+    async def collect():
+        return [event async for event in WorkflowExecutor(definition).run_stream(prompt, WorkflowContext(session_id="s"), timeout=0.05)]
+
+    started = time.perf_counter()
+    events = run(collect())
+    assert time.perf_counter() - started < 0.5
+    assert [event.type for event in events][-2:] == ["node_timeout", "workflow_cancelled"]
+    assert events[-1].reason == "deadline"
+
+def test_map_element_chunks_are_not_merged_across_elements():
+    prompt = BasePrompt(name="tester", email="tester@example.com", query="hi", files=[
+        FileData(filename=f"f{i}", url=f"file://f{i}") for i in range(3)
+    ])
+    definition = workflow(
+        node("m", type="map", agent_name="test_echo", items="$prompt.files", next_nodes=["end"], config={"chunks": 3, "delay": 0.01}),
+        node("end", type="end")
+    )
+
+    async def collect():
+        events = WorkflowExecutor(definition).run_stream(prompt, WorkflowContext(session_id="s"))
+        return [event async for event in ChunkCoalescer(window_ms=1000).coalesce(events)]
+
+    chunks = [event for event in run(collect()) if isinstance(event, TextChunkEvent)]
+    texts = {}
+    for chunk in chunks:
+        texts[chunk.data[ITEM_INDEX]] = texts.get(chunk.data[ITEM_INDEX], "") + chunk.content
+    # The elements ran interleaved, yet every element's text is intact
+    assert len(chunks) > 3
+    assert texts == {i: "m:0 m:1 m:2 " for i in range(3)}
+
+def slow_workflow(delay=1):
+    return workflow(
+        node("a", agent_name="test_echo", next_nodes=["end"], config={"chunks": 5, "delay": delay}),
+        node("end", type="end")
+    )
+
+def test_cancel_does_not_need_the_executor_that_started_the_run(prompt):
+    async def scenario():
+        stream = WorkflowExecutor(slow_workflow(0.05)).run_stream(prompt, WorkflowContext(session_id="s"))
+        first = await stream.__anext__()
+        # As after a reload of the workflow: a new executor, the run is still found
+        assert WorkflowExecutor(slow_workflow(0.05)).cancel("s", reason="stop")
+        events = [first] + [event async for event in stream]
+        assert not cancel_run("s")
+        return events
+
+    started = time.perf_counter()
+    events = run(scenario())
+    assert time.perf_counter() - started < 0.2
+    assert events[-1].type == "workflow_cancelled" and events[-1].reason == "stop"
+
+def test_cancel_from_another_thread(prompt):
+    def cancel_soon():
+        time.sleep(0.05)
+        assert cancel_run("s", reason="from a thread")
+
+    async def scenario():
+        return [event async for event in WorkflowExecutor(slow_workflow()).run_stream(prompt, WorkflowContext(session_id="s"))]
+
+    canceller = threading.Thread(target=cancel_soon)
+    canceller.start()
+    started = time.perf_counter()
+    events = run(scenario())
+    canceller.join()
+    assert time.perf_counter() - started < 0.5
+    assert events[-1].reason == "from a thread"
+
+def test_runs_of_one_session_do_not_unregister_each_other(prompt):
+    async def scenario():
+        executor = WorkflowExecutor(slow_workflow(0.01))
+        quick = WorkflowExecutor(workflow(node("a", agent_name="test_echo", next_nodes=["end"]), node("end", type="end")))
+        slow = asyncio.ensure_future(executor.run(prompt, WorkflowContext(session_id="s")))
+        await asyncio.sleep(0.005)
+        await quick.run(prompt, WorkflowContext(session_id="s"))
+        # The quick run finished first, the slow one is still cancellable
+        assert cancel_run("s")
+        return await asyncio.gather(slow, return_exceptions=True)
+
+    [result] = run(scenario())
+    assert isinstance(result, WorkflowCancelledError)
+
+def test_batch_items_must_not_share_a_session(prompt):
+    executor = WorkflowExecutor(slow_workflow(0))
+    contexts = [WorkflowContext(session_id=session_id) for session_id in ("a", "b", "a")]
+    with pytest.raises(ValueError, match="share sessions a"):
+        run(executor.run_batch([prompt] * 3, contexts))
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from datagent.agents.schemas import UserMessage
+from datagent.core.context import WorkflowContext
+from datagent.db.fs import FileSystemDB
+from datagent.db.repositories.journal import JournaledSessionRepository
+
+IDS = ["a", "user.one", "v1.2.3"]
+
+@pytest.fixture
+def legacy_root(tmp_path):
+    """A flat store as written before sharding existed."""
+    sessions = tmp_path / "sessions"
+    sessions.mkdir()
+    for doc_id in IDS:
+        (sessions / f"{doc_id}.json").write_text(json.dumps({"id": doc_id}))
+    (sessions / "user.one.3fa2c1.log").write_text("")
+    (sessions / "a.json.123.tmp").write_text("torn")
+    return tmp_path
+
+def test_no_files_until_first_write(tmp_path):
+    root = tmp_path / "store"
+    fs = FileSystemDB(str(root))
+    assert fs.load("sessions", "x") is None
+    assert not root.exists()
+
+    fs.save("sessions", "x", {"v": 1})
+    assert (root / ".layout.json").exists()
+    assert fs.load("sessions", "x") == {"v": 1}
+
+def test_legacy_store_lists_dotted_ids(legacy_root):
+    fs = FileSystemDB(str(legacy_root))
+    assert fs.shard_depth == 0
+    assert fs.list_ids("sessions") == sorted(IDS)
+    assert fs.list_ids("sessions", (".json", ".3fa2c1.log")) == sorted(IDS)
+    assert fs.load("sessions", "user.one") == {"id": "user.one"}
+
+def test_migrate_layout_keeps_dotted_ids(legacy_root):
+    fs = FileSystemDB(str(legacy_root))
+    assert fs.migrate_layout(1) == 4
+
+    reopened = FileSystemDB(str(legacy_root))
+    assert reopened.shard_depth == 1
+    assert reopened.list_ids("sessions") == sorted(IDS)
+    for doc_id in IDS:
+        assert reopened.load("sessions", doc_id) == {"id": doc_id}
+    assert reopened.load_raw("sessions", "user.one", ".3fa2c1.log") == b""
+    assert not (legacy_root / "sessions" / "user.one.json").exists()
+
+    with pytest.raises(ValueError):
+        FileSystemDB(str(legacy_root), shard_depth=2)
+
+def test_rebuild_index_keeps_dotted_ids(tmp_path):
+    fs = FileSystemDB(str(tmp_path), shard_depth=2)
+    for doc_id in IDS:
+        fs.save("sessions", doc_id, {"id": doc_id})
+    fs.append_raw("sessions", "a.b", b"{}\n", ".0c1d2e.log")
+
+    assert fs.rebuild_index() == 4
+    assert fs.list_ids("sessions") == sorted(IDS)
+    assert fs.list_ids("sessions", (".0c1d2e.log",)) == ["a.b"]
+
+def test_list_page_cursor(tmp_path):
+    fs = FileSystemDB(str(tmp_path))
+    for i in range(25):
+        fs.save_raw("sessions", f"s{i:02d}", b"{}", ".json")
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = fs.list_page("sessions", limit=10, cursor=cursor)
+        seen.extend(info.id for info in page)
+        if cursor is None:
+            break
+    assert seen == [f"s{i:02d}" for i in range(25)]
+    assert page[-1].size == 2
+
+def test_journaled_session_with_dotted_id_survives_migration(tmp_path):
+    fs = FileSystemDB(str(tmp_path), shard_depth=0)
+    repo = JournaledSessionRepository(database=fs, compact_every=100)
+    context = WorkflowContext(session_id="user.one")
+    for i in range(3):
+        context = context.add_history(UserMessage(session_id="user.one", content=str(i)))
+        repo.save(context)
+
+    fs.migrate_layout(1)
+    loaded = JournaledSessionRepository(database=FileSystemDB(str(tmp_path))).load("user.one")
+    assert [entry.content for entry in loaded.history] == ["0", "1", "2"]
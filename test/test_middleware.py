@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from datagent.core import middleware as middleware_module
+from datagent.core.middleware import (
+    Middleware, MiddlewarePipeline, MiddlewareRegistry, RateLimitMiddleware, RetryMiddleware
+)
+
+def run(coro):
+    return asyncio.run(coro)
+
+class Recorder(Middleware):
+    def __init__(self, name, log):
+        self.name, self.log = name, log
+
+    async def handle(self, context, call_next):
+        self.log.append(f"{self.name}>")
+        result = await call_next({**context, "path": context.get("path", "") + self.name})
+        self.log.append(f"<{self.name}")
+        return result
+
+class LegacyRecorder(Middleware):
+    def __init__(self, log):
+        self.log = log
+
+    async def process_request(self, context, next_call):
+        self.log.append("legacy")
+        return await next_call()
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock, advanced by the middleware's asyncio.sleep calls."""
+    now = [0.0]
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(middleware_module.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(middleware_module.asyncio, "sleep", sleep)
+    monkeypatch.setattr(middleware_module.random, "uniform", lambda low, high: high)
+    return sleeps
+
+def test_build_composes_the_first_middleware_outermost():
+    log = []
+
+    async def target(context):
+        log.append(f"target {context['path']}")
+        return "result"
+
+    pipeline = MiddlewarePipeline([Recorder("a", log), Recorder("b", log)])
+    pipeline.add(LegacyRecorder(log))
+    assert run(pipeline.build(target)({})) == "result"
+    assert log == ["a>", "b>", "legacy", "target ab", "<b", "<a"]
+
+def test_execute_rebuilds_after_add():
+    log = []
+    pipeline = MiddlewarePipeline([Recorder("a", log)])
+
+    async def target():
+        return len(log)
+
+    assert run(pipeline.execute({}, target)) == 1
+    pipeline.add(Recorder("b", log))
+    log.clear()
+    assert run(pipeline.execute({}, target)) == 2
+
+def test_middleware_without_overrides_passes_through():
+    async def target(context):
+        return context["value"]
+
+    assert run(MiddlewarePipeline([Middleware()]).build(target)({"value": 7})) == 7
+
+def test_from_config_keeps_the_listed_order():
+    pipeline = MiddlewarePipeline.from_config(["logging", {"retry": {"max_attempts": 2}}, {"rate_limit": {"rate": 5}}])
+    assert [type(m).__name__ for m in pipeline._middlewares] == ["LoggingMiddleware", "RetryMiddleware", "RateLimitMiddleware"]
+    with pytest.raises(ValueError):
+        MiddlewarePipeline.from_config(["unknown"])
+    with pytest.raises(ValueError):
+        MiddlewarePipeline.from_config([{"retry": {}, "logging": {}}])
+
+def flaky(failures, error=OSError):
+    calls = []
+
+    async def target(context):
+        calls.append(context)
+        if len(calls) <= failures:
+            raise error("boom")
+        return len(calls)
+
+    return target, calls
+
+def test_retry_backs_off_exponentially(clock):
+    target, calls = flaky(2)
+    retry = RetryMiddleware(max_attempts=3, backoff=0.5)
+    assert run(retry.handle({}, target)) == 3
+    assert clock == [0.5, 1.0]
+
+def test_retry_gives_up_after_max_attempts_and_caps_backoff(clock):
+    target, calls = flaky(10)
+    retry = RetryMiddleware(max_attempts=4, backoff=3, max_backoff=5)
+    with pytest.raises(OSError):
+        run(retry.handle({}, target))
+    assert len(calls) == 4
+    assert clock == [3, 5, 5]
+
+def test_retry_only_retries_listed_errors(clock):
+    target, calls = flaky(1, error=ValueError)
+    with pytest.raises(ValueError):
+        run(RetryMiddleware(retry_on=(OSError,)).handle({}, target))
+    assert len(calls) == 1 and clock == []
+    with pytest.raises(ValueError):
+        RetryMiddleware(max_attempts=0)
+
+async def _ok(context):
+    return True
+
+def test_rate_limit_allows_a_burst_then_spaces_calls(clock):
+    limiter = RateLimitMiddleware(rate=10, burst=2)
+
+    async def calls(n, context):
+        for _ in range(n):
+            await limiter.handle(context, _ok)
+
+    run(calls(4, {}))
+    # Two from the burst, then one token every 0.1s
+    assert clock == pytest.approx([0.1, 0.1])
+
+def test_rate_limit_keeps_a_bucket_per_key(clock):
+    limiter = RateLimitMiddleware(rate=1, key="agent")
+
+    async def calls():
+        for agent in ("a", "b", "c"):
+            await limiter.handle({"agent": agent}, _ok)
+        await limiter.handle({"agent": "a"}, _ok)
+
+    run(calls())
+    assert clock == pytest.approx([1.0])
+    with pytest.raises(ValueError):
+        RateLimitMiddleware(rate=0)
+
+def test_registry_rejects_unknown_names():
+    with pytest.raises(ValueError):
+        MiddlewareRegistry.instantiate("nope")
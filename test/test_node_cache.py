@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from conftest import EchoOutput, node, workflow
+from datagent.agents.schemas import AgentOutputEvent, TextChunkEvent, UserMessage
+from datagent.core.context import WorkflowContext
+from datagent.core.execution_plan import CachePolicy
+from datagent.core.node_cache import NodeResultCache, replay_events
+from datagent.core.workflow_executor import WorkflowExecutor
+
+def run(coro):
+    return asyncio.run(coro)
+
+def events(session_id="s", content="out"):
+    return (
+        TextChunkEvent(session_id=session_id, agent_name="a", content="chunk"),
+        AgentOutputEvent(session_id=session_id, agent_name="a", output=EchoOutput(session_id=session_id, content=content, value=content))
+    )
+
+def test_hit_and_miss():
+    cache = NodeResultCache()
+    key = cache.key("a", {"x": 1}, {"q": "hi"}, None)
+    assert cache.get(key) is None
+    cache.put(key, events())
+    assert [event.type for event in cache.get(key).events] == ["text_chunk", "agent_output"]
+    assert cache.stats() == {"hits": 1, "disk_hits": 0, "misses": 1, "entries": 1}
+
+def test_ttl_expiry(monkeypatch):
+    cache = NodeResultCache()
+    cache.put("k", events())
+    now = cache.get("k").created_at
+    monkeypatch.setattr("datagent.core.node_cache.time.time", lambda: now + 10)
+    assert cache.get("k", ttl=60) is not None
+    assert cache.get("k", ttl=5) is None
+    # Expired entries are dropped
+    assert cache.get("k") is None and cache.stats()["entries"] == 0
+
+def test_lru_bound():
+    cache = NodeResultCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, events())
+    cache.get("a")
+    cache.put("c", events())
+    assert cache.get("b") is None and cache.get("a") is not None
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    NodeResultCache(directory=str(tmp_path)).put("k1", events(content="disk"))
+    cache = NodeResultCache(directory=str(tmp_path))
+    entry = cache.get("k1")
+    assert entry.events[-1].output.value == "disk"
+    assert cache.stats()["disk_hits"] == 1
+    # Promoted to memory
+    cache.get("k1")
+    assert cache.stats()["disk_hits"] == 1
+
+    cache.invalidate("k1")
+    assert NodeResultCache(directory=str(tmp_path)).get("k1") is None
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path):
+    cache = NodeResultCache(directory=str(tmp_path))
+    cache.put("k2", events())
+    path = tmp_path / "k2" / "k2.json"
+    path.write_text("{torn")
+    assert NodeResultCache(directory=str(tmp_path)).get("k2") is None
+
+def test_replay_refreshes_message_identity():
+    entry_events = events(session_id="old")
+    cache = NodeResultCache()
+    cache.put("k", entry_events)
+
+    async def replay():
+        return [event async for event in replay_events(cache.get("k"), "new")]
+
+    replayed = run(replay())
+    assert [event.content for event in replayed] == ["chunk", None]
+    for original, event in zip(entry_events, replayed):
+        assert event.session_id == "new" and event.id != original.id
+    assert replayed[-1].output.session_id == "new"
+    assert replayed[-1].output.id != entry_events[-1].output.id
+    assert replayed[-1].output.value == "out"
+
+def test_key_sensitivity():
+    cache = NodeResultCache()
+    first = UserMessage(session_id="s", content="hello")
+    # Same content, other id, timestamp and session
+    same = UserMessage(session_id="t", content="hello")
+    other = UserMessage(session_id="s", content="bye")
+
+    base = cache.key("a", {"x": 1}, {"q": "hi"}, None, [first])
+    assert cache.key("a", {"x": 1}, {"q": "hi"}, None, [same]) == base
+    assert cache.key("a", {"x": 1}, {"q": "hi"}, None, [other]) != base
+    assert cache.key("a", {"x": 2}, {"q": "hi"}, None, [first]) != base
+    assert cache.key("a", {"x": 1}, {"q": "ho"}, None, [first]) != base
+    # Without include_history the executor passes no history, so any history shares one key
+    assert cache.key("a", {"x": 1}, {"q": "hi"}, None) != base
+
+@pytest.mark.parametrize("include_history, expected_hits", [(True, 0), (False, 1)])
+def test_executor_hits_depend_on_include_history(prompt, include_history, expected_hits):
+    definition = workflow(
+        node("a", agent_name="test_echo", next_nodes=["end"], cache={"include_history": include_history}),
+        node("end", type="end")
+    )
+    executor = WorkflowExecutor(definition)
+    context = run(executor.run(prompt, WorkflowContext(session_id="s")))
+    # The second turn sees a longer history
+    context = run(executor.run(prompt, context))
+    assert executor.cache.hits == expected_hits
+    assert context.state["a"].value == "a"
+
+def test_cache_policy_parse():
+    assert CachePolicy.parse(None) is None and CachePolicy.parse({"enabled": False}) is None
+    assert CachePolicy.parse(True) == CachePolicy()
+    assert CachePolicy.parse({"ttl": 5, "include_history": False}) == CachePolicy(ttl=5, include_history=False)
+    for invalid in ({"ttl": 0}, {"bogus": 1}, "yes"):
+        with pytest.raises(ValueError):
+            CachePolicy.parse(invalid)
@@ -0,0 +1,8 @@
+from datagent.core.profiler import span
+
+def test_disabled_span_yields_a_fresh_dict():
+    with span("a", "test", x=1) as first:
+        first["leaked"] = True
+    with span("b", "test") as second:
+        assert second == {}
+    assert first == {"x": 1, "leaked": True}
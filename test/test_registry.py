@@ -0,0 +1,40 @@
+from conftest import EchoAgent
+from datagent.agents.base import BaseAgent
+from datagent.agents.registry import AgentRegistry
+from datagent.instance_pool import InstancePool
+
+def test_pool_shares_one_instance_per_config():
+    pool = InstancePool(max_size=2)
+    created = []
+
+    def make(value):
+        created.append(value)
+        return object()
+
+    a = pool.get_or_create("x", {"v": 1, "w": 2}, lambda: make(1))
+    assert pool.get_or_create("x", {"w": 2, "v": 1}, lambda: make(2)) is a
+    pool.get_or_create("y", {"v": 1}, lambda: make(3))
+    pool.get_or_create("x", {"v": 2}, lambda: make(4))
+    # The least recently used config was evicted
+    assert len(pool) == 2
+    assert pool.get_or_create("x", {"v": 1, "w": 2}, lambda: make(5)) is not a
+    assert created == [1, 3, 4, 5]
+
+def test_agent_registry_pools_poolable_agents():
+    a = AgentRegistry.acquire("test_echo", agent_id="a", config={"value": "x"})
+    assert AgentRegistry.acquire("test_echo", agent_id="a", config={"value": "x"}) is a
+    assert AgentRegistry.acquire("test_echo", agent_id="a", config={"value": "y"}) is not a
+    assert AgentRegistry.pool_size() == 2
+
+def test_agents_are_not_pooled_unless_they_opt_in():
+    class Stateful(EchoAgent):
+        poolable = False
+
+    AgentRegistry.register("test_stateful")(Stateful)
+    try:
+        a = AgentRegistry.acquire("test_stateful", agent_id="a")
+        assert AgentRegistry.acquire("test_stateful", agent_id="a") is not a
+        assert AgentRegistry.pool_size() == 0
+    finally:
+        del AgentRegistry._registry["test_stateful"]
+    assert BaseAgent.poolable is False
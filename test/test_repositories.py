@@ -0,0 +1,128 @@
+import pytest
+
+from datagent.agents.schemas import UserMessage
+from datagent.core.checkpoint import WorkflowCheckpoint
+from datagent.core.context import WorkflowContext
+from datagent.db.codecs import PAYLOAD_ZLIB_JSON, BinaryCodec, DocumentCodec
+from datagent.db.base import DBManager
+from datagent.db.fs import FileSystemDB
+from datagent.db.repositories.journal import JournaledSessionRepository
+from datagent.db.repositories.session import SessionRepository
+from datagent.db.repositories.sql import SQLSessionRepository
+
+def grow(context, *contents, **state):
+    for content in contents:
+        context = context.add_history(UserMessage(session_id=context.session_id, content=content))
+    return context.update(state) if state else context
+
+def contents(context):
+    return [entry.content for entry in context.history]
+
+@pytest.fixture
+def fs(tmp_path):
+    return FileSystemDB(str(tmp_path))
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = DBManager(f"sqlite:///{tmp_path / 'sessions.db'}")
+    yield manager
+    manager.engine.dispose()
+
+def test_journal_round_trip(fs):
+    repo = JournaledSessionRepository(database=fs, compact_every=3)
+    context = WorkflowContext(session_id="s")
+    for i in range(5):
+        context = grow(context, str(i), step=i)
+        repo.save(context)
+    context = WorkflowContext(session_id="s", state={"done": True}, history=context.history)
+    repo.save(context)
+
+    loaded = JournaledSessionRepository(database=fs).load("s")
+    assert contents(loaded) == ["0", "1", "2", "3", "4"]
+    assert dict(loaded.state.items()) == {"done": True}
+    # The first save and the compaction before the third record write snapshots
+    assert (repo.snapshots, repo.appends) == (2, 4)
+
+def test_journal_appends_after_forgetting_a_session(fs):
+    repo = JournaledSessionRepository(database=fs, max_sessions=1)
+    first = grow(WorkflowContext(session_id="first"), "a", step=1)
+    repo.save(first)
+    repo.save(grow(WorkflowContext(session_id="second"), "x"))
+    assert list(repo._persisted) == ["second"]
+
+    # Evicted, but a context extending the stored history still only appends
+    reloaded = JournaledSessionRepository(database=fs).load("first")
+    snapshots = repo.snapshots
+    repo.save(grow(reloaded, "b", step=2))
+    assert repo.snapshots == snapshots
+    assert repo.appends == 1 and repo.recoveries == 1
+    assert len(repo._persisted) == 1
+
+    loaded = JournaledSessionRepository(database=fs).load("first")
+    assert contents(loaded) == ["a", "b"]
+    assert loaded.state["step"] == 2
+
+def test_journal_rewrites_a_diverged_history(fs):
+    repo = JournaledSessionRepository(database=fs, max_sessions=1)
+    repo.save(grow(WorkflowContext(session_id="first"), "a", "b"))
+    repo.save(grow(WorkflowContext(session_id="second"), "x"))
+
+    repo.save(grow(WorkflowContext(session_id="first"), "c"))
+    assert contents(JournaledSessionRepository(database=fs).load("first")) == ["c"]
+
+def test_sql_round_trip(manager):
+    repo = SQLSessionRepository(manager)
+    context = WorkflowContext(session_id="s")
+    for i in range(3):
+        context = grow(context, str(i), step=i)
+        repo.save(context)
+    assert (repo.rewrites, repo.appends) == (1, 2)
+
+    loaded = SQLSessionRepository(manager).load("s")
+    assert contents(loaded) == ["0", "1", "2"]
+    assert loaded.state["step"] == 2
+    assert [entry.content for entry in repo.load_history("s", last=2)] == ["1", "2"]
+
+    repo.save(grow(WorkflowContext(session_id="s"), "x"))
+    assert contents(repo.load("s")) == ["x"]
+    repo.delete("s")
+    assert contents(repo.load("s")) == []
+
+def test_sql_appends_after_forgetting_a_session(manager):
+    repo = SQLSessionRepository(manager, max_sessions=1)
+    repo.save(grow(WorkflowContext(session_id="first"), "a"))
+    repo.save(grow(WorkflowContext(session_id="second"), "x"))
+    assert list(repo._persisted) == ["second"]
+
+    # Evicted, the newest stored message tells the context extends what is stored
+    reloaded = SQLSessionRepository(manager).load("first")
+    repo.save(grow(reloaded, "b"))
+    assert (repo.appends, repo.lookups) == (1, 1)
+    assert len(repo._persisted) == 1
+
+    repo.save(grow(WorkflowContext(session_id="second"), "y"))
+    assert repo.rewrites == 3
+    assert contents(repo.load("first")) == ["a", "b"]
+    assert contents(repo.load("second")) == ["y"]
+
+def test_binary_codec_round_trip(fs, prompt):
+    binary = SessionRepository(database=fs, codec=BinaryCodec(PAYLOAD_ZLIB_JSON))
+    context = grow(WorkflowContext(session_id="s"), "a", "b", step=2)
+    binary.save(context)
+    binary.save_checkpoint(WorkflowCheckpoint(session_id="s", workflow="w", prompt=prompt, completed=("x", "x"), context=context))
+
+    assert fs.load_raw("sessions", "s", ".bin").startswith(b"DGSB")
+    # A JSON-writing repository reads binary documents as well
+    for repo in (binary, SessionRepository(database=fs, codec=DocumentCodec())):
+        loaded = repo.load("s")
+        assert contents(loaded) == ["a", "b"] and loaded.state["step"] == 2
+        checkpoint = repo.load_checkpoint("s")
+        assert checkpoint.completed == ("x", "x") and checkpoint.prompt == prompt
+        assert contents(checkpoint.context) == ["a", "b"]
+
+def test_binary_migration_of_json_sessions(fs):
+    SessionRepository(database=fs, codec=DocumentCodec()).save(grow(WorkflowContext(session_id="s"), "a"))
+    binary = SessionRepository(database=fs, codec=BinaryCodec(PAYLOAD_ZLIB_JSON))
+    assert binary.migrate() == 1
+    assert fs.load_raw("sessions", "s", ".json") is None
+    assert contents(binary.load("s")) == ["a"]
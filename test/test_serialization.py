@@ -0,0 +1,94 @@
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import pytest
+
+from datagent.agents.schemas import AgentInput, AssistantMessage, BasePrompt, FileData, UserMessage
+from datagent.core import serialization
+from datagent.core.context import ChainedState, History
+from datagent.core.serialization import deserialize, invalidate_registry, register_type, serialize
+
+@pytest.fixture(autouse=True)
+def restore_registry():
+    extra_types = dict(serialization._extra_types)
+    yield
+    serialization._extra_types.clear()
+    serialization._extra_types.update(extra_types)
+    invalidate_registry()
+
+def round_trip(obj):
+    # Through JSON, like every store does
+    return deserialize(json.loads(json.dumps(serialize(obj))))
+
+def prompt():
+    return BasePrompt(
+        email="a@b.c",
+        name="a",
+        query="q",
+        files=[FileData(filename="a.csv", url="s3://bucket/a.csv", timestamp=datetime(2024, 1, 2, 3, 4, 5))]
+    )
+
+@pytest.mark.parametrize("obj", [
+    UserMessage(content="hi", session_id="s"),
+    AssistantMessage(content="hello", agent_name="agent", node_id="n"),
+    prompt(),
+    AgentInput(content="go", prompt=prompt(), history=[UserMessage(content="hi"), AssistantMessage(content="x", agent_name="a", node_id="n")]),
+    {"nested": [UserMessage(content="hi"), {"when": "2024-01-02"}], "n": 1, "none": None}
+], ids=["user", "assistant", "prompt", "agent_input", "container"])
+def test_round_trip(obj):
+    restored = round_trip(obj)
+    assert restored == obj and type(restored) is type(obj)
+
+def test_datetime_fields_are_restored():
+    message = round_trip(UserMessage(content="hi", timestamp=datetime(2024, 1, 2, 3, 4, 5)))
+    assert message.timestamp == datetime(2024, 1, 2, 3, 4, 5)
+    # Outside a datetime field an ISO string stays a string
+    assert round_trip({"at": datetime(2024, 1, 2)}) == {"at": "2024-01-02T00:00:00"}
+
+def test_context_containers_serialize_as_plain_values():
+    history = History([UserMessage(content="a")]).append(UserMessage(content="b"))
+    state = ChainedState({"a": 1}).set_many({"b": datetime(2024, 1, 2)})
+    assert serialize(history) == [serialize(entry) for entry in history]
+    assert serialize(state) == {"a": 1, "b": "2024-01-02T00:00:00"}
+
+def test_deserialize_does_not_modify_its_input():
+    data = serialize(AgentInput(content="go", prompt=prompt()))
+    snapshot = json.loads(json.dumps(data))
+    deserialize(data)
+    assert data == snapshot
+
+def test_unknown_type_falls_back_to_dict():
+    assert deserialize({"_type": "NoSuchType", "a": 1}) == {"_type": "NoSuchType", "a": 1}
+
+def test_type_registered_after_first_use_is_picked_up():
+    @dataclass(frozen=True, kw_only=True)
+    class LateResult:
+        value: int
+
+    encoded = serialize(LateResult(value=1))
+    # Used before registration: unknown, and remembered as missing
+    assert deserialize(encoded) == {"_type": "LateResult", "value": 1}
+    assert deserialize(encoded) == {"_type": "LateResult", "value": 1}
+
+    register_type(LateResult)
+    assert deserialize(encoded) == LateResult(value=1)
+
+def test_register_type_replaces_the_compiled_decoder():
+    @dataclass(frozen=True, kw_only=True)
+    class Versioned:
+        value: int
+
+    register_type(Versioned)
+    assert deserialize({"_type": "Versioned", "value": 1}) == Versioned(value=1)
+    first = Versioned
+
+    @dataclass(frozen=True, kw_only=True)
+    class Versioned:
+        value: int
+        at: datetime = field(default_factory=datetime.utcnow)
+
+    register_type(Versioned)
+    restored = deserialize({"_type": "Versioned", "value": 1, "at": "2024-01-02T00:00:00"})
+    assert type(restored) is Versioned and type(restored) is not first
+    assert restored.at == datetime(2024, 1, 2)
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import pytest
+
+from conftest import node, workflow
+from datagent.core.context import WorkflowContext
+from datagent.core.workflow_executor import WorkflowExecutor
+
+def routed(value, speculate="x", **b_kwargs):
+    """a -> router on a's value: x -> b, y -> c. The router speculates on `speculate`."""
+    return workflow(
+        node("a", agent_name="test_echo", next_nodes=["r"], config={"value": value, "delay": 0.1}),
+        node("r", type="router", condition="$a.value", routes={"x": "b", "y": "c"}, speculate=speculate),
+        node("b", agent_name="test_echo", next_nodes=["end"], config={"delay": 0.1, "update": "marker"}, **b_kwargs),
+        node("c", agent_name="test_echo", next_nodes=["end"], config={"chunks": 0}),
+        node("end", type="end")
+    )
+
+def stream(executor, prompt):
+    async def collect():
+        return [event async for event in executor.run_stream(prompt, WorkflowContext(session_id="s"))]
+    return asyncio.run(collect())
+
+def chunk_agents(events):
+    return [event.agent_name for event in events if event.type == "text_chunk"]
+
+def test_hit_overlaps_the_target_with_the_router(prompt):
+    executor = WorkflowExecutor(routed("x"))
+    started = time.perf_counter()
+    events = stream(executor, prompt)
+    elapsed = time.perf_counter() - started
+
+    # a and b take 0.2s each, run one after the other they would take 0.4s
+    assert elapsed < 0.35
+    assert executor.speculation_hits == 1 and executor.speculation_misses == 0
+    # b's events were held back until the router confirmed it
+    decision = next(i for i, event in enumerate(events) if event.type == "router_decision")
+    assert chunk_agents(events[:decision]) == ["a", "a"]
+    assert chunk_agents(events[decision:]) == ["b", "b"]
+    updates = [i for i, event in enumerate(events) if event.type == "context_update" and event.agent_name == "b"]
+    assert len(updates) == 1 and updates[0] > decision
+
+def test_miss_discards_the_speculative_node(prompt):
+    executor = WorkflowExecutor(routed("y"))
+    events = stream(executor, prompt)
+
+    assert executor.speculation_hits == 0 and executor.speculation_misses == 1
+    assert "b" not in chunk_agents(events)
+    assert not any(getattr(event, "agent_name", None) == "b" for event in events)
+
+    context = asyncio.run(WorkflowExecutor(routed("y")).run(prompt, WorkflowContext(session_id="s")))
+    assert "b" not in context.state and "marker" not in context.state
+    assert "c" in context.state
+
+def test_learned_speculation_starts_after_enough_decisions(prompt):
+    executor = WorkflowExecutor(routed("x", speculate="learned"))
+    for _ in range(5):
+        stream(executor, prompt)
+    # Nothing to learn from before the fifth decision
+    assert executor.speculation_hits == 0
+
+    context = asyncio.run(executor.run(prompt, WorkflowContext(session_id="s")))
+    assert executor.speculation_hits == 1
+    assert context.state["marker"] == "b"
+
+def test_target_reading_upstream_output_is_rejected():
+    with pytest.raises(ValueError, match="cannot speculate on 'b'"):
+        WorkflowExecutor(routed("x", input_mapping={"q": "$a.value"}))
+
+    # Learned speculation never picks such a target
+    executor = WorkflowExecutor(routed("x", speculate="learned", input_mapping={"q": "$a.value"}))
+    assert "b" not in executor.plan.nodes["r"].speculative_targets
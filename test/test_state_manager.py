@@ -0,0 +1,190 @@
+import asyncio
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+from datagent import bootstrap
+from datagent.agents.schemas import FileData, UserMessage
+from datagent.core import dependency_injection, state_manager
+from datagent.core.dependency_injection import Container
+from datagent.core.state_manager import InMemoryStateManager, LRUStateManager, SQLiteStateManager, StateManager, create_state_manager
+
+def run(coro):
+    return asyncio.run(coro)
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(state_manager.time, "monotonic", lambda: now[0])
+    return now
+
+def test_lru_evicts_least_recently_used():
+    async def scenario():
+        manager = LRUStateManager(max_entries=3)
+        for key in "abc":
+            await manager.set_state(key, {"key": key})
+        # Reading a makes b the least recently used
+        assert await manager.get_state("a") == {"key": "a"}
+        await manager.set_state("d", {"key": "d"})
+        return manager, [key for key in "abcd" if await manager.get_state(key) is not None]
+
+    manager, kept = run(scenario())
+    assert kept == ["a", "c", "d"]
+    assert manager.stats()["evictions"] == 1 and manager.stats()["entries"] == 3
+
+def test_lru_evicts_by_size():
+    async def scenario():
+        value = {"v": "x" * 20}
+        size = len('{"v": "' + "x" * 20 + '"}')
+        manager = LRUStateManager(max_bytes=2 * size)
+        await manager.set_state("a", value)
+        await manager.set_state("b", value)
+        assert manager.size_bytes == 2 * size
+        await manager.set_state("c", value)
+        assert manager.size_bytes == 2 * size and await manager.get_state("a") is None
+        # Too large on its own, but the entry just set is never evicted
+        await manager.set_state("big", {"v": "x" * 100})
+        assert [key for key in ("b", "c", "big") if await manager.get_state(key) is not None] == ["big"]
+        # Replacing a key accounts for the old size
+        await manager.set_state("big", value)
+        return manager.size_bytes, size
+
+    size_bytes, size = run(scenario())
+    assert size_bytes == size
+
+def test_lru_ttl_expiry(clock):
+    async def scenario():
+        manager = LRUStateManager(default_ttl=10)
+        await manager.set_state("default", {"v": 1})
+        await manager.set_state("short", {"v": 2}, ttl=1)
+        clock[0] += 1
+        assert await manager.get_state("short") is None
+        assert await manager.get_state("default") == {"v": 1}
+        clock[0] += 9
+        assert await manager.get_state("default") is None
+        return manager.stats()
+
+    stats = run(scenario())
+    assert stats["expirations"] == 2 and stats["entries"] == 0 and stats["size_bytes"] == 0
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+def test_sqlite_round_trip_survives_reopen(tmp_path):
+    path = str(tmp_path / "state" / "state.db")
+    value = {
+        "files": [FileData(filename="a.csv", url="s3://bucket/a.csv", timestamp=datetime(2024, 1, 2))],
+        "message": UserMessage(content="hi", session_id="s"),
+        "count": 3
+    }
+
+    async def write():
+        manager = SQLiteStateManager(path)
+        await manager.set_state("k", value)
+        await manager.set_state("gone", {"v": 1})
+        await manager.delete_state("gone")
+        await manager.close()
+
+    async def read():
+        manager = SQLiteStateManager(path)
+        try:
+            return await manager.get_state("k"), await manager.get_state("gone")
+        finally:
+            await manager.close()
+
+    run(write())
+    restored, gone = run(read())
+    assert restored == value and gone is None
+
+def test_sqlite_reads_pending_writes_and_flush_commits_them(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    def committed():
+        with sqlite3.connect(path) as conn:
+            return [key for key, in conn.execute("SELECT key FROM state ORDER BY key")]
+
+    async def scenario():
+        # A flush interval long enough that only flush() commits
+        manager = SQLiteStateManager(path, flush_interval=60, batch_size=1000)
+        try:
+            await manager.set_state("a", {"v": 1})
+            await manager.set_state("b", {"v": 2})
+            await manager.set_state("a", {"v": 3})
+            await asyncio.sleep(0.05)
+            assert committed() == [] and await manager.get_state("a") == {"v": 3}
+            await manager.flush()
+            assert committed() == ["a", "b"]
+            assert manager.writes == 2 and manager.batches == 1
+        finally:
+            await manager.close()
+        with pytest.raises(RuntimeError):
+            await manager.set_state("c", {"v": 4})
+
+    run(scenario())
+
+def test_sqlite_full_batch_is_written_without_waiting(tmp_path):
+    async def scenario():
+        manager = SQLiteStateManager(str(tmp_path / "state.db"), flush_interval=60, batch_size=3)
+        try:
+            for i in range(3):
+                await manager.set_state(f"k{i}", {"v": i})
+            for _ in range(100):
+                if manager.batches:
+                    break
+                await asyncio.sleep(0.01)
+            return manager.batches, manager.writes
+        finally:
+            await manager.close()
+
+    assert run(scenario()) == (1, 3)
+
+def test_sqlite_ttl_expiry(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    async def scenario():
+        manager = SQLiteStateManager(path, default_ttl=0.05)
+        try:
+            await manager.set_state("short", {"v": 1})
+            await manager.set_state("kept", {"v": 2}, ttl=60)
+            await manager.flush()
+            await asyncio.sleep(0.1)
+            assert await manager.get_state("short") is None
+            assert await manager.get_state("kept") == {"v": 2}
+            # Expired rows are purged by the next write
+            await manager.set_state("other", {"v": 3})
+            await manager.flush()
+        finally:
+            await manager.close()
+
+    run(scenario())
+    with sqlite3.connect(path) as conn:
+        assert sorted(key for key, in conn.execute("SELECT key FROM state")) == ["kept", "other"]
+
+def test_create_state_manager(tmp_path):
+    assert isinstance(create_state_manager("memory"), InMemoryStateManager)
+    manager = create_state_manager("lru", max_entries=5, max_bytes=100, ttl=2)
+    assert (manager.max_entries, manager.max_bytes, manager.default_ttl) == (5, 100, 2)
+    with pytest.raises(ValueError):
+        create_state_manager("sqlite")
+    with pytest.raises(ValueError):
+        create_state_manager("redis")
+
+@pytest.mark.parametrize("backend, cls", [("memory", InMemoryStateManager), ("lru", LRUStateManager), ("sqlite", SQLiteStateManager)])
+def test_registered_state_manager_follows_settings(monkeypatch, tmp_path, backend, cls):
+    test_container = Container()
+    monkeypatch.setattr(dependency_injection, "container", test_container)
+    monkeypatch.setattr(bootstrap.settings, "STATE_BACKEND", backend)
+    monkeypatch.setattr(bootstrap.settings, "STATE_MAX_ENTRIES", 7)
+    monkeypatch.setattr(bootstrap.settings, "STATE_TTL", 30.0)
+    monkeypatch.setattr(bootstrap.settings, "STATE_DB_PATH", str(tmp_path / "state.db"))
+    bootstrap.register_services()
+
+    manager = test_container.resolve(StateManager)
+    assert type(manager) is cls
+    if backend != "memory":
+        assert manager.default_ttl == 30.0
+    if backend == "lru":
+        assert manager.max_entries == 7
+    if backend == "sqlite":
+        assert manager.path == str(tmp_path / "state.db")
+    run(test_container.shutdown())
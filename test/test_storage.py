@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from datagent.agents.schemas import UserMessage
+from datagent.core.checkpoint import WorkflowCheckpoint
+from datagent.core.context import WorkflowContext
+from datagent.core.storage import SessionStorage
+
+def turn(context, content):
+    return context.add_history(UserMessage(session_id=context.session_id, content=content))
+
+def on_disk(storage, session_id):
+    return [entry.content for entry in storage.repo.load(session_id).history]
+
+@pytest.fixture
+def storage(tmp_path):
+    # Nothing is written until flushed
+    storage = SessionStorage(storage_dir=str(tmp_path), cache_max_bytes=0, flush_interval=60)
+    yield storage
+    storage.close()
+
+def test_saves_of_a_session_coalesce_into_the_last(storage):
+    context = WorkflowContext(session_id="s")
+
+    async def saves():
+        nonlocal context
+        for content in "abc":
+            context = turn(context, content)
+            await storage.a_save_context(context)
+
+    asyncio.run(saves())
+    assert on_disk(storage, "s") == []
+    storage.flush()
+    assert on_disk(storage, "s") == ["a", "b", "c"]
+    assert (storage.enqueued, storage.coalesced, storage.written) == (3, 2, 1)
+
+def test_sync_save_supersedes_a_pending_one(storage):
+    old = turn(WorkflowContext(session_id="s"), "old")
+    asyncio.run(storage.a_save_context(old))
+    storage.save_context(turn(WorkflowContext(session_id="s"), "new"))
+    storage.flush()
+    assert on_disk(storage, "s") == ["new"]
+    assert storage.written == 0
+
+def test_cleared_checkpoint_is_not_resurrected(storage, prompt):
+    context = WorkflowContext(session_id="s")
+    checkpoint = WorkflowCheckpoint(session_id="s", workflow="w", prompt=prompt, completed=("a",), context=context)
+
+    async def run():
+        await storage.a_save_checkpoint(checkpoint)
+        assert await storage.a_load_checkpoint("s") is checkpoint
+        await storage.a_clear_checkpoint("s")
+        assert await storage.a_load_checkpoint("s") is None
+
+    asyncio.run(run())
+    storage.flush()
+    assert storage.repo.load_checkpoint("s") is None
+
+def test_failed_write_stays_pending_behind_newer_saves(storage, monkeypatch):
+    save = storage.repo.save
+    failures = []
+
+    def flaky(context):
+        if not failures:
+            failures.append(context)
+            raise OSError("disk full")
+        save(context)
+
+    monkeypatch.setattr(storage.repo, "save", flaky)
+    first = turn(WorkflowContext(session_id="s"), "a")
+    asyncio.run(storage.a_save_context(first))
+    with pytest.raises(OSError):
+        storage.flush()
+    assert storage.stats()["pending"] == 1
+
+    # A newer save replaces the failed one instead of being overwritten by its retry
+    asyncio.run(storage.a_save_context(turn(first, "b")))
+    storage.flush()
+    assert on_disk(storage, "s") == ["a", "b"]
+    assert storage.failed == 1
+
+def test_failing_session_does_not_block_the_others(storage, monkeypatch, caplog):
+    save = storage.repo.save
+
+    def failing(context):
+        if context.session_id == "bad":
+            raise OSError("disk full")
+        save(context)
+
+    monkeypatch.setattr(storage.repo, "save", failing)
+
+    async def saves():
+        for session_id in ("bad", "a", "b", "c"):
+            await storage.a_save_context(turn(WorkflowContext(session_id=session_id), session_id))
+
+    asyncio.run(saves())
+    with pytest.raises(OSError):
+        storage.flush()
+    assert storage.written == 3
+    assert [on_disk(storage, session_id) for session_id in "abc"] == [["a"], ["b"], ["c"]]
+    assert list(storage._pending) == [("context", "bad")]
+
+    # Retried until max_attempts, then dropped with an error
+    for _ in range(storage.max_attempts - 1):
+        with pytest.raises(OSError):
+            storage.flush()
+    assert storage.stats()["pending"] == 0
+    assert (storage.failed, storage.dropped) == (storage.max_attempts, 1)
+    assert "Dropping the context of session bad" in caplog.text
+    storage.flush()
+
+def test_cache_evicts_least_recently_used_sessions_by_size(tmp_path):
+    # One message is estimated at 256 bytes of overhead plus its content
+    entry = 257
+    storage = SessionStorage(storage_dir=str(tmp_path), cache_max_bytes=3 * entry, flush_interval=60)
+    try:
+        for session_id in ("s1", "s2", "s3"):
+            storage.save_context(turn(WorkflowContext(session_id=session_id), "x"))
+        assert storage.stats()["cache_bytes"] == 3 * entry
+        # Loading s1 makes s2 the least recently used
+        storage.load_context("s1")
+        storage.save_context(turn(WorkflowContext(session_id="s4"), "x"))
+        assert list(storage._cache) == ["s3", "s1", "s4"]
+        assert (storage.cache_hits, storage.cache_evictions) == (1, 1)
+
+        # A miss reads the repository and caches the session again
+        assert [entry.content for entry in storage.load_context("s2").history] == ["x"]
+        assert list(storage._cache) == ["s1", "s4", "s2"]
+        assert (storage.cache_misses, storage.cache_evictions) == (1, 2)
+
+        # A grown session is sized by what it added and can evict several others
+        storage.save_context(turn(turn(storage.load_context("s2"), "y"), "z"))
+        assert list(storage._cache) == ["s2"] and storage.cache_bytes == 3 * entry
+        assert storage.cache_evictions == 4
+
+        # Never evicts the session just saved, even if it alone is too large
+        storage.save_context(turn(WorkflowContext(session_id="big"), "x" * 4 * entry))
+        assert list(storage._cache) == ["big"] and storage.cache_evictions == 5
+    finally:
+        storage.close()
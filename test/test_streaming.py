@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+from datagent.agents.schemas import TextChunkEvent, ToolStartEvent
+from datagent.core.streaming import ITEM_INDEX, ChunkCoalescer, EventBuffer, StreamConfig
+
+def run(coro):
+    return asyncio.run(coro)
+
+def chunk(content, agent="a", **data):
+    return TextChunkEvent(session_id="s", agent_name=agent, content=content, data=data)
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_producers_pause_at_high_water_and_resume_at_low_water():
+    async def scenario():
+        buffer = EventBuffer(StreamConfig(high_water=4, low_water=1, text_policy="block"))
+        producer = asyncio.create_task(_produce(buffer, range(8)))
+        await settle()
+        assert len(buffer) == 4 and buffer.blocked == 1
+
+        # Still above low water, the producer stays paused
+        received = [await buffer.get(), await buffer.get()]
+        await settle()
+        assert len(buffer) == 2
+
+        received.append(await buffer.get())
+        await settle()
+        # Drained to low water: refilled up to high water again
+        assert len(buffer) == 4
+        received += [await buffer.get() for _ in range(5)]
+        await producer
+        return received
+
+    assert run(scenario()) == list(range(8))
+
+async def _produce(buffer, items):
+    for item in items:
+        await buffer.put(item)
+
+def test_text_chunks_coalesce_instead_of_blocking():
+    async def scenario():
+        buffer = EventBuffer(StreamConfig(high_water=2))
+        await buffer.put(chunk("1"))
+        await buffer.put(chunk("2"))
+        # Full: a chunk continuing the last one is merged into it
+        await asyncio.wait_for(buffer.put(chunk("3")), 1)
+        assert len(buffer) == 2 and buffer.coalesced == 1 and buffer.blocked == 0
+
+        # Other agents' chunks, other map elements' chunks and other events wait for room
+        for event in (chunk("x", agent="b"), chunk("x", **{ITEM_INDEX: 1}), ToolStartEvent(session_id="s", agent_name="a")):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(buffer.put(event), 0.05)
+        return [(await buffer.get()).content, (await buffer.get()).content]
+
+    assert run(scenario()) == ["1", "23"]
+
+def test_block_policy_never_coalesces():
+    async def scenario():
+        buffer = EventBuffer(StreamConfig(high_water=1, text_policy="block"))
+        await buffer.put(chunk("1"))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(buffer.put(chunk("2")), 0.05)
+        assert buffer.coalesced == 0
+
+    run(scenario())
+
+def test_put_control_bypasses_the_limit():
+    async def scenario():
+        buffer = EventBuffer(StreamConfig(high_water=1, text_policy="block"))
+        await buffer.put("event")
+        buffer.put_control("done")
+        assert len(buffer) == 2
+        return [await buffer.get(), await buffer.get()]
+
+    assert run(scenario()) == ["event", "done"]
+
+@pytest.mark.parametrize("options", [
+    {"high_water": 0},
+    {"text_policy": "drop"},
+    {"high_water": 4, "low_water": 4},
+    {"high_water": 4, "low_water": -1},
+])
+def test_stream_config_validation(options):
+    with pytest.raises(ValueError):
+        StreamConfig(**options)
+
+def test_stream_config_default_low_water():
+    assert EventBuffer(StreamConfig(high_water=9))._low_water == 4
+
+async def source(*steps, closed=None):
+    """Yields events, a number in `steps` sleeps that many seconds instead."""
+    try:
+        for step in steps:
+            if isinstance(step, (int, float)):
+                await asyncio.sleep(step)
+            else:
+                yield step
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+def coalesce(coalescer, events):
+    async def collect():
+        return [event async for event in coalescer.coalesce(events)]
+    return run(collect())
+
+def test_window_flushes_a_batch():
+    out = coalesce(ChunkCoalescer(window_ms=20), source(chunk("1"), chunk("2"), 0.1, chunk("3")))
+    assert [event.content for event in out] == ["12", "3"]
+
+def test_max_bytes_flushes_a_batch():
+    coalescer = ChunkCoalescer(window_ms=1000, max_bytes=10)
+    out = coalesce(coalescer, source(*(chunk("abcdef") for _ in range(5))))
+    assert [len(event.content) for event in out] == [12, 12, 6]
+    assert (coalescer.chunks_in, coalescer.chunks_out) == (5, 3)
+
+def test_other_events_flush_first_and_keep_their_order():
+    tool = ToolStartEvent(session_id="s", agent_name="a")
+    out = coalesce(ChunkCoalescer(window_ms=1000), source(chunk("1"), chunk("2"), tool, chunk("3")))
+    assert [event.content if event is not tool else "tool" for event in out] == ["12", "tool", "3"]
+
+def test_batches_split_by_stream():
+    events = source(
+        chunk("a1"), chunk("b1", agent="b"), chunk("a2"),
+        chunk("m0", **{ITEM_INDEX: 0}), chunk("m1", **{ITEM_INDEX: 1}), chunk("m1'", **{ITEM_INDEX: 1})
+    )
+    out = coalesce(ChunkCoalescer(window_ms=1000), events)
+    assert [event.content for event in out] == ["a1", "b1", "a2", "m0", "m1m1'"]
+    assert out[-1].data == {ITEM_INDEX: 1}
+
+def test_zero_window_passes_events_through():
+    events = [chunk("1"), chunk("2")]
+    out = coalesce(ChunkCoalescer(window_ms=0), source(*events))
+    assert out == events and all(a is b for a, b in zip(out, events))
+
+def test_stopping_early_closes_the_source():
+    closed = []
+
+    async def scenario():
+        stream = ChunkCoalescer(window_ms=1000).coalesce(source(chunk("1"), ToolStartEvent(session_id="s", agent_name="a"), 10, chunk("2"), closed=closed))
+        first = await stream.__anext__()
+        await stream.__anext__()
+        # Stop before the source is exhausted
+        await stream.aclose()
+        return first
+
+    assert run(asyncio.wait_for(scenario(), 2)).content == "1"
+    assert closed == [True]